@@ -0,0 +1,109 @@
+# background_writer.py - Cola + hilo escritor compartidos por el diario de trades y la grabación de ticks
+import logging
+import queue
+import threading
+from typing import List, Optional
+
+logger = logging.getLogger("PolyPolyBot")
+
+_STOP = object()
+
+
+class BackgroundWriter:
+    """
+    Base de los escritores en segundo plano.
+
+    Los productores solo encolan (_enqueue); un hilo daemon agrupa todo lo
+    pendiente en un lote, lo pasa a _write_batch y después a _after_batch
+    (volcados, fsync, cierres). flush() espera a que lo encolado hasta ese
+    momento esté escrito; close() lo termina todo y para el hilo.
+
+    Las subclases fijan su estado antes de llamar a este __init__ (arranca el hilo)
+    y no deben dejar escapar excepciones de _write_batch: un error por elemento se
+    registra y se sigue. Si aun así el hilo muere, se deja de aceptar datos.
+    """
+
+    thread_name = "background-writer"
+
+    def __init__(self):
+        self._queue: "queue.Queue" = queue.Queue()
+        self._closed = False
+        self._dead_logged = False
+        self._thread = threading.Thread(target=self._writer, name=self.thread_name, daemon=True)
+        self._thread.start()
+
+    # ------------------- API ------------------- #
+    def flush(self) -> None:
+        """Bloquea hasta que todo lo encolado esté escrito."""
+        if self._closed or not self._thread.is_alive():
+            return  # close() ya lo dejó todo escrito; nadie atendería la espera
+        done = threading.Event()
+        self._queue.put(done)
+        # Si el escritor termina entre medias (close en otro hilo) no se espera para siempre
+        while not done.wait(0.5):
+            if not self._thread.is_alive():
+                return
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def _enqueue(self, item) -> bool:
+        """Encola un elemento; False si ya no hay escritor que lo vaya a atender."""
+        if self._closed:
+            return False
+        if not self._thread.is_alive():
+            if not self._dead_logged:
+                logger.error("El hilo %s ha terminado: se descartan los datos nuevos", self.thread_name)
+                self._dead_logged = True
+            return False
+        self._queue.put(item)
+        return True
+
+    # ------------------- Subclases ------------------- #
+    def _wait_timeout(self) -> Optional[float]:
+        """Cada cuánto despierta el escritor sin datos nuevos (None = solo con datos)."""
+        return None
+
+    def _write_batch(self, batch: List) -> None:
+        raise NotImplementedError
+
+    def _after_batch(self, force: bool, stop: bool) -> None:
+        """Tras cada lote (o espera vacía); force si hay un flush() o close() esperando."""
+
+    # ------------------- Writer ------------------- #
+    def _writer(self) -> None:
+        stop = False
+        while not stop:
+            try:
+                items = [self._queue.get(timeout=self._wait_timeout())]
+            except queue.Empty:
+                items = []
+            # Agrupar todo lo que ya esté encolado en un solo lote
+            while True:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            batch: List = []
+            waiters: List[threading.Event] = []
+            for item in items:
+                if item is _STOP:
+                    stop = True
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    batch.append(item)
+
+            if batch:
+                self._write_batch(batch)
+            try:
+                self._after_batch(force=stop or bool(waiters), stop=stop)
+            except Exception as e:
+                logger.error("Error en el hilo %s: %s", self.thread_name, e)
+            for waiter in waiters:
+                waiter.set()
@@ -1,159 +1,577 @@
 # backtest.py - Backtest con capital compuesto y profit real
 import os
 import json
-from typing import List, Tuple
+import math
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
 
 import pandas as pd
 
-from strategy import GabagoolStrategy
+from fill_model import attach_fill_models, load_book_histories
+from market_catalog import MarketCatalog, slug_from_filename
+from strategy import Strategy
+from trade_journal import TradeJournal
+from tick_cache import (
+    build_market_arrays,
+    load_manifest,
+    load_market_arrays,
+    read_tick_csv,
+    save_manifest,
+)
 import numpy as np
 
 DATA_DIR = "live_data_polling"
+HISTORICAL_DIR = "historical_data"
 LOG_DIR = "trade_logs"
+# En backtest los trades no se escriben a disco salvo que se pase otro diario
+NULL_JOURNAL = TradeJournal()
+MIN_ROWS = 1000
+# Mínimo de filas por origen: el polling va a ~1 tick/s, el histórico de CLOB es mucho más ralo
+SOURCE_MIN_ROWS = {DATA_DIR: MIN_ROWS, HISTORICAL_DIR: 20}
 os.makedirs(LOG_DIR, exist_ok=True)
 
 
-def load_all_markets() -> List[dict]:
+def load_all_markets(
+    use_cache: bool = True,
+    sources: Optional[List[str]] = None,
+    max_markets: int = 100,
+    resolve: bool = True,
+    fetch_resolutions: bool = False,
+) -> List[dict]:
+    """
+    Carga los CSV de ticks de cada directorio de `sources` (por defecto DATA_DIR;
+    HISTORICAL_DIR para los descargados con historical_data) como arrays por mercado.
+    Los dos orígenes comparten el formato canónico de tick_cache.
+    Con use_cache los arrays salen de la caché columnar (tick_cache, una por
+    directorio) y solo se re-parsean los CSV nuevos o modificados.
+    Con resolve se adjunta a cada mercado su resolución real del catálogo local
+    (attach_resolutions); fetch_resolutions además consulta a Gamma las que falten.
+    """
     markets: List[dict] = []
-    files = [f for f in os.listdir(DATA_DIR) if f.endswith(".csv")]
-    print(f"Encontrados {len(files)} archivos en {DATA_DIR}\n")
     sim = 0
-    for file in sorted(files):
-        if sim > 100:
-            break
-        path = os.path.join(DATA_DIR, file)
-        try:
-            df = pd.read_csv(path, parse_dates=["timestamp"])
-            if len(df) < 1000:
-                print(f"Saltando {file} (muy pocos datos: {len(df)} filas)")
-                continue
-
-            df = df.sort_values("timestamp").reset_index(drop=True)
-            markets.append({"name": file, "data": df})
-            print(f"Cargado {file}: {len(df)} ticks")
-            sim += 1
-        except Exception as e:  # noqa: BLE001
-            print(f"Error leyendo {file}: {e}")
+    for directory in sources or [DATA_DIR]:
+        min_rows = SOURCE_MIN_ROWS.get(directory, MIN_ROWS)
+        cache_dir = os.path.join(directory, ".cache")
+        files = [f for f in os.listdir(directory) if f.endswith(".csv")]
+        print(f"Encontrados {len(files)} archivos en {directory}\n")
+        manifest = load_manifest(cache_dir) if use_cache else {}
+        for file in sorted(files):
+            if sim > max_markets:
+                break
+            path = os.path.join(directory, file)
+            try:
+                if use_cache:
+                    arrays = load_market_arrays(path, manifest, min_rows=min_rows, cache_dir=cache_dir)
+                    n_rows = manifest[file]["rows"]
+                else:
+                    df = read_tick_csv(path)
+                    n_rows = len(df)
+                    arrays = build_market_arrays(df) if n_rows >= min_rows else None
+
+                if arrays is None:
+                    print(f"Saltando {file} (muy pocos datos: {n_rows} filas)")
+                    continue
+
+                markets.append({"name": file, "arrays": arrays})
+                print(f"Cargado {file}: {n_rows} ticks")
+                sim += 1
+            except Exception as e:
+                print(f"Error leyendo {file}: {e}")
+
+        if use_cache:
+            save_manifest(manifest, cache_dir)
 
     print(f"\nTotal mercados válidos: {len(markets)}\n")
+    if resolve and markets:
+        attach_resolutions(markets, fetch_missing=fetch_resolutions)
     return markets
 
-def run_backtest(initial_capital: float = 1000.0, n_simulations = 500) -> Tuple[pd.DataFrame, float]:
+# --------------------------------------------------------------
+# Motor de replay sobre arrays
+# --------------------------------------------------------------
+def replay_market(strategy: Strategy, arrays: dict) -> Strategy:
+    """
+    Alimenta la estrategia tick a tick desde los arrays del mercado.
+    Cuando la estrategia se bloquea ya no cambia su estado, así que se corta el replay.
+    """
+    timestamps = arrays["timestamp"]
+    ticks = zip(
+        arrays["price_yes"].tolist(),
+        arrays["price_no"].tolist(),
+        arrays["tendency"].tolist(),
+    )
+    for tick_index, (p_yes, p_no, tendency) in enumerate(ticks, start=1):  # tick_index empieza en 1
+        if strategy.locked:
+            break
+        strategy.decide_and_execute(
+            ts=timestamps[tick_index - 1],
+            price_yes=p_yes,
+            price_no=p_no,
+            tick_index=tick_index,
+            tendency=tendency,
+        )
+    return strategy
+
+
+# --------------------------------------------------------------
+# Montecarlo (serie o en paralelo)
+# --------------------------------------------------------------
+# Mercados cargados en cada proceso worker (se reciben una sola vez en el initializer)
+_WORKER_MARKETS: List[dict] = []
+
+
+def simulation_seeds(n_simulations: int, seed: Optional[int] = None) -> List[np.random.SeedSequence]:
+    """
+    Una SeedSequence independiente por camino de Montecarlo.
+    El orden de mercados de la simulación i depende solo de (seed, i),
+    así que el resultado es el mismo en serie o repartido entre procesos.
+    """
+    return np.random.SeedSequence(seed).spawn(n_simulations)
+
+
+def final_price_winner(arrays: dict) -> str:
+    """Lado ganador estimado por el último tick ("YES", "NO" o "UNKNOWN")."""
+    final_price_yes = float(arrays["price_yes"][-1])
+    final_price_no = float(arrays["price_no"][-1])
+    # Heurística simple: si YES está cerca de 1, asumimos que ganó YES, etc.
+    if final_price_yes > 0.9 and final_price_yes >= final_price_no:
+        return "YES"
+    if final_price_no > 0.9 and final_price_no >= final_price_yes:
+        return "NO"
+    return "UNKNOWN"
+
+
+def market_winner(arrays: dict) -> str:
+    """
+    Lado ganador del mercado: la resolución real si attach_resolutions la
+    adjuntó; si no, la heurística del último tick.
+    """
+    winner = arrays.get("winner")
+    return winner if winner is not None else final_price_winner(arrays)
+
+
+def market_payoffs(arrays: dict) -> Tuple[float, float]:
+    """Pago por acción (YES, NO) al resolverse el mercado (precalculado si es posible)."""
+    payoffs = arrays.get("payoffs")
+    if payoffs is not None:
+        return payoffs
+    winner = market_winner(arrays)
+    return float(winner == "YES"), float(winner == "NO")
+
+
+def attach_resolutions(
+    markets: List[dict], catalog: Optional[MarketCatalog] = None, fetch_missing: bool = False
+) -> int:
+    """
+    Adjunta a los arrays de cada mercado el ganador real (outcomePrices de Gamma,
+    guardado en el catálogo local) y sus pagos por acción, una sola vez antes de
+    los caminos de Montecarlo. Por defecto solo se lee el catálogo (sin red);
+    fetch_missing=True pide a Gamma los que falten. Los mercados sin resolución
+    conocida se quedan con la heurística del último tick. Devuelve cuántos se resolvieron.
+    """
+    catalog = catalog if catalog is not None else MarketCatalog()
+    slugs = [slug_from_filename(m["name"]) for m in markets]
+    try:
+        resolutions = catalog.resolutions(slugs, fetch_missing=fetch_missing)
+    except Exception as e:
+        print(f"No se pudieron obtener resoluciones: {e}")
+        resolutions = {}
+
+    resolved = 0
+    for market, slug in zip(markets, slugs):
+        arrays = market["arrays"]
+        winner = resolutions.get(slug)
+        if winner is not None:
+            resolved += 1
+        else:
+            winner = final_price_winner(arrays)
+        arrays["winner"] = winner
+        arrays["payoffs"] = (float(winner == "YES"), float(winner == "NO"))
+    print(f"Resoluciones reales: {resolved}/{len(markets)} (resto por último tick)")
+    if resolved < len(markets) and not fetch_missing:
+        print("  Para completarlas: python market_catalog.py --resolve <directorio de CSV>")
+    return resolved
+
+
+def simulate_market(
+    arrays: dict,
+    capital_before: float,
+    strategy_params: Optional[dict] = None,
+    journal: Optional[TradeJournal] = None,
+    market_slug: str = "",
+    fill_model=None,
+) -> Tuple[Strategy, str, float, float, float]:
+    """
+    Simula un mercado completo con el capital disponible.
+    strategy_params se pasa tal cual al constructor de Strategy (umbrales, etc.).
+    Los trades van a `journal` (por defecto NULL_JOURNAL: no se guardan).
+    fill_model (p. ej. fill_model.DepthFillModel) ejecuta contra el libro grabado
+    en lugar de llenar todo al mid.
+    Devuelve (strategy, winner, profit_real, profit_lockeado, profit_final).
     """
-    Ejecuta el backtest sobre todos los CSV en DATA_DIR.
+    # La estrategia ve como "initial_capital" el capital disponible en este mercado
+    strategy = Strategy(
+        initial_capital=capital_before,
+        market_slug=market_slug,
+        journal=journal if journal is not None else NULL_JOURNAL,
+        fill_model=fill_model,
+        **(strategy_params or {}),
+    )
+    strategy.reset()
+
+    replay_market(strategy, arrays)
+    # --------------------------------------------------------------
+    # Cálculo de beneficio real del mercado
+    # --------------------------------------------------------------
+    winner = market_winner(arrays)
+    payoff_yes, payoff_no = market_payoffs(arrays)
+    payout = strategy.qty_yes * payoff_yes + strategy.qty_no * payoff_no
+
+    total_cost = strategy.cost_yes + strategy.cost_no
+    profit_real = payout - total_cost
+    profit_lockeado = strategy.guaranteed_profit()
+    profit_final = max(profit_lockeado, profit_real)
+
+    return strategy, winner, profit_real, profit_lockeado, profit_final
+
+
+def simulate_path(
+    markets: List[dict],
+    order: np.ndarray,
+    initial_capital: float,
+    sim: int,
+    strategy_params: Optional[dict] = None,
+    journal: Optional[TradeJournal] = None,
+) -> Tuple[List[dict], float, float, int]:
+    """
+    Recorre los mercados en el orden dado con capital compuesto.
+    Devuelve (resultados por mercado, capital final, profit total, safe trades).
+    """
+    current_capital = float(initial_capital)
+    total_profit = 0.0
+    results = []
+    safe = 0
+
+    for idx in order:
+        market = markets[idx]
+        arrays = market["arrays"]
+        name = market["name"]
+
+        # Capital antes de operar este mercado
+        capital_before = current_capital
+
+        # print(
+        #     f"Procesando → {name} ({arrays['n_ticks']} ticks) - "
+        #     f"Capital actual: ${capital_before:.2f}"
+        # )
+
+        strategy, winner, profit_real, profit_lockeado, profit_final = simulate_market(
+            arrays,
+            capital_before,
+            strategy_params,
+            journal,
+            os.path.splitext(name)[0],
+            market.get("fill_model"),
+        )
+        safe += strategy.safe
+
+        # Actualizar capital compuesto (capital_before + beneficio del mercado)
+        current_capital = capital_before + profit_final
+        total_profit += profit_final
+
+        # Capital efectivamente utilizado en este mercado
+        capital_used = strategy.initial_capital - strategy.capital            
+
+        results.append(
+            {
+                "market": name,
+                "market_number": sim,
+                "capital_before": round(capital_before, 2),
+                "profit_final": round(profit_final, 3),
+                "capital_after": round(current_capital, 2),
+                "profit_real": round(profit_real, 3),
+                "profit_lockeado": round(profit_lockeado, 3),
+                "winner": winner,
+                "final_pair_cost": round(strategy.pair_cost(), 4),
+                "trades": len(strategy.trades),
+                "roi_%": round(
+                    (profit_final / capital_used * 100) if capital_used > 0 else 0,
+                    2,
+                ),
+            }
+        )
+
+        # Log detallado de este mercado
+        # log_file = os.path.join(
+        #     LOG_DIR, f"{os.path.splitext(name)[0]}_log.json"
+        # )
+        # with open(log_file, "w", encoding="utf-8") as f:
+        #     json.dump(
+        #         {
+        #             "market": name,
+        #             "capital_before": round(capital_before, 2),
+        #             "profit_final": round(profit_final, 3),
+        #             "capital_after": round(current_capital, 2),
+        #             "trades": strategy.trades,
+        #         },
+        #         f,
+        #         indent=2,
+        #         default=str,
+        #     )
+
+    return results, current_capital, total_profit, safe
+
+
+def _init_worker(markets: List[dict]) -> None:
+    global _WORKER_MARKETS
+    _WORKER_MARKETS = markets
+
+
+def _run_path_worker(job: Tuple[int, np.random.SeedSequence, float]):
+    sim, seed_seq, initial_capital = job
+    order = np.random.default_rng(seed_seq).permutation(len(_WORKER_MARKETS))
+    return simulate_path(_WORKER_MARKETS, order, initial_capital, sim)
+
+
+def _iter_paths(
+    markets: List[dict],
+    seeds: List[np.random.SeedSequence],
+    initial_capital: float,
+    workers: int,
+    journal: Optional[TradeJournal] = None,
+) -> Iterator[Tuple[List[dict], float, float, int]]:
+    """Genera los caminos en orden de simulación, en serie o con un pool de procesos."""
+    if workers <= 1:
+        for sim, seed_seq in enumerate(seeds, start=1):
+            order = np.random.default_rng(seed_seq).permutation(len(markets))
+            yield simulate_path(markets, order, initial_capital, sim, journal=journal)
+        return
+
+    if journal is not None:
+        raise ValueError("journal solo está disponible en modo serie (workers=1)")
+
+    jobs = [(sim, seed_seq, initial_capital) for sim, seed_seq in enumerate(seeds, start=1)]
+    chunksize = max(1, len(jobs) // (workers * 8))
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(markets,)
+    ) as pool:
+        # map conserva el orden: la distribución final es idéntica a la serie
+        yield from pool.map(_run_path_worker, jobs, chunksize=chunksize)
+
+
+# --------------------------------------------------------------
+# Montecarlo analítico (cada mercado se simula una vez por bucket de capital)
+# --------------------------------------------------------------
+class MarketReturnTable:
+    """
+    Multiplicador de capital (capital_after / capital_before) por mercado y bucket de capital.
+
+    Cada par (mercado, bucket) se simula una sola vez, bajo demanda, al capital
+    del límite inferior del bucket. Las órdenes de Strategy son proporcionales al
+    capital, así que el multiplicador es constante por tramos, pero salta donde
+    una orden cruza min_order_value (p. ej. con poco capital): en el bucket que
+    contiene el salto el multiplicador puede estar hasta ~20% desviado.
+    near_threshold() marca esos buckets (el multiplicador del bucket siguiente
+    difiere en más de `tolerance`) para que el camino se repita exacto.
+    """
+
+    def __init__(
+        self,
+        markets: List[dict],
+        base_capital: float,
+        capital_step: float = 0.05,
+        strategy_params: Optional[dict] = None,
+        tolerance: float = 1e-3,
+    ):
+        if capital_step <= 0:
+            raise ValueError("capital_step debe ser > 0")
+        self.markets = markets
+        self.base_capital = float(base_capital)
+        self.log_step = math.log1p(capital_step)
+        # Por debajo de min_order_value la estrategia no opera (multiplicador 1)
+        self.strategy_params = strategy_params or {}
+        self.min_capital = Strategy(**self.strategy_params).min_order_value
+        self.tolerance = tolerance
+        self._cache: Dict[Tuple[int, int], float] = {}
+
+    def bucket_capital(self, bucket: int) -> float:
+        return self.base_capital * math.exp(bucket * self.log_step)
+
+    def buckets(self, capital: np.ndarray) -> np.ndarray:
+        ratio = np.maximum(capital, self.min_capital) / self.base_capital
+        return np.floor(np.log(ratio) / self.log_step).astype(np.int64)
+
+    def multiplier(self, market_idx: int, bucket: int) -> float:
+        key = (market_idx, bucket)
+        mult = self._cache.get(key)
+        if mult is None:
+            capital = self.bucket_capital(bucket)
+            market = self.markets[market_idx]
+            *_, profit_final = simulate_market(
+                market["arrays"],
+                capital,
+                self.strategy_params,
+                fill_model=market.get("fill_model"),
+            )
+            mult = (capital + profit_final) / capital
+            self._cache[key] = mult
+        return mult
+
+    def lookup(self, market_idx: np.ndarray, capital: np.ndarray) -> np.ndarray:
+        """Multiplicadores para un vector de (mercado, capital actual) de todos los caminos."""
+        keys = np.stack([market_idx, self.buckets(capital)], axis=1)
+        uniq, inverse = np.unique(keys, axis=0, return_inverse=True)
+        mult = np.array([self.multiplier(int(m), int(b)) for m, b in uniq])
+        out = mult[inverse.ravel()]
+        out[capital < self.min_capital] = 1.0
+        return out
+
+    def near_threshold(self, market_idx: np.ndarray, capital: np.ndarray) -> np.ndarray:
+        """
+        True donde el multiplicador cambia dentro del bucket del capital actual
+        (difiere del bucket siguiente): ahí el valor del límite inferior no vale.
+        """
+        keys = np.stack([market_idx, self.buckets(capital)], axis=1)
+        uniq, inverse = np.unique(keys, axis=0, return_inverse=True)
+        jump = np.array([
+            abs(self.multiplier(int(m), int(b) + 1) - self.multiplier(int(m), int(b)))
+            > self.tolerance
+            for m, b in uniq
+        ])
+        out = jump[inverse.ravel()]
+        # Sin capital para una orden mínima no se opera nunca más: el 1.0 es exacto
+        out[capital < self.min_capital] = False
+        return out
+
+    @property
+    def simulated(self) -> int:
+        return len(self._cache)
+
+
+def run_analytic_montecarlo(
+    markets: List[dict],
+    seeds: List[np.random.SeedSequence],
+    initial_capital: float,
+    capital_step: float = 0.05,
+    strategy_params: Optional[dict] = None,
+    verbose: bool = True,
+    exact_near: bool = True,
+) -> np.ndarray:
+    """
+    Capital final de cada camino compuesto como producto de multiplicadores por mercado.
+    Usa las mismas permutaciones que el Montecarlo tick a tick para cada seed.
+    Coste: O(ticks × buckets visitados + simulaciones × mercados).
+
+    Sin corrección (exact_near=False) un camino que pasa por un umbral de
+    min_order_value puede acabar con un capital ~26% distinto del exacto
+    (medido con 42 mercados y capital_step 0.01/0.001); la media y los
+    percentiles se desvían mucho menos, así que solo sirve para estadísticas
+    agregadas. Con exact_near=True esos caminos se repiten con simulate_path;
+    el resto acumula como mucho `tolerance` por mercado (~0.5% en ese test).
+    """
+    n_markets = len(markets)
+    capital = np.full(len(seeds), float(initial_capital))
+    if n_markets == 0 or len(seeds) == 0:
+        return capital
+
+    orders = np.stack([np.random.default_rng(s).permutation(n_markets) for s in seeds])
+    table = MarketReturnTable(markets, initial_capital, capital_step, strategy_params)
+    near = np.zeros(len(seeds), dtype=bool)
+
+    for step in range(n_markets):
+        if exact_near:
+            near |= table.near_threshold(orders[:, step], capital)
+        capital = capital * table.lookup(orders[:, step], capital)
+
+    for path in np.flatnonzero(near):
+        capital[path] = simulate_path(
+            markets, orders[path], initial_capital, int(path) + 1, strategy_params
+        )[1]
+
+    if verbose:
+        print(f"Simulaciones de mercado ejecutadas: {table.simulated} (mercados × buckets)")
+        if exact_near:
+            print(f"Caminos repetidos exactos (cerca de un umbral): {int(near.sum())}/{len(seeds)}")
+    return capital
+
+
+def _print_montecarlo_summary(roi_array: np.ndarray, n_simulations: int) -> None:
+    print("\n" + "="*80)
+    print("RESULTADOS MONTECARLO")
+    print("="*80)
+    print(f"Número de simulaciones: {n_simulations}")
+    print(f"ROI medio: {roi_array.mean():.2f}%")
+    print(f"ROI mediana: {np.median(roi_array):.2f}%")
+    print(f"ROI mínimo: {roi_array.min():.2f}%")
+    print(f"ROI máximo: {roi_array.max():.2f}%")
+    print(f"Desviación estándar: {roi_array.std():.2f}%")
+    print("="*80)
+
+
+def run_backtest(
+    initial_capital: float = 1000.0,
+    n_simulations = 500,
+    seed: Optional[int] = None,
+    workers: int = 1,
+    analytic: bool = False,
+    capital_step: float = 0.05,
+    journal: Optional[TradeJournal] = None,
+    book_recording: Optional[str] = None,
+    market_assets: Optional[Dict[str, Tuple[str, str]]] = None,
+    sources: Optional[List[str]] = None,
+    fetch_resolutions: bool = False,
+) -> Tuple[pd.DataFrame, float]:
+    """
+    Ejecuta el backtest sobre todos los CSV de `sources` (por defecto DATA_DIR).
     Usa capital compuesto: las ganancias de cada mercado se suman
     al capital disponible para el siguiente.
+
+    Con workers > 1 los caminos de Montecarlo se reparten en un pool de procesos;
+    con la misma seed la distribución de ROI es idéntica a la ejecución en serie.
+
+    Con analytic=True cada mercado se simula una vez por bucket de capital
+    (buckets geométricos de ancho capital_step) y los caminos se componen
+    con productos de arrays; solo se imprime la distribución final. Los caminos
+    que pasan cerca de un umbral de min_order_value se repiten tick a tick
+    (ver run_analytic_montecarlo). Corre en el proceso actual (workers no
+    aplica) y no admite journal.
+
+    Los trades no se guardan salvo que se pase un journal (p. ej. MemoryJournal
+    o FileJournal de trade_journal); solo en modo serie.
+
+    Con book_recording + market_assets ({mercado: (yes_asset_id, no_asset_id)})
+    las órdenes de esos mercados se ejecutan contra el ask ladder grabado
+    (VWAP y fills parciales) en vez de al mid con tamaño ilimitado.
+
+    Devuelve (DataFrame, capital final del último camino): los resultados por
+    mercado del último camino o, con analytic=True, capital_final y roi_% de
+    cada camino.
     """
+    if analytic and journal is not None:
+        raise ValueError("journal no está disponible en modo analítico (no hay trades por camino)")
+
     roi_list = []
     capital_final_list = []
-    markets = load_all_markets()
-
-    for sim in range(1, n_simulations + 1):
-        starting_capital = float(initial_capital)
-        current_capital = float(initial_capital)
-        total_profit = 0.0
-        results = []
-        safe = 0
-        shuffled_markets = np.random.permutation(markets)
-        current_capital = float(initial_capital)
-
-        for market in shuffled_markets:
-            df = market["data"]
-            name = market["name"]
-
-            # Capital antes de operar este mercado
-            capital_before = current_capital
-
-            # La estrategia ve como "initial_capital" el capital disponible en este mercado
-            strategy = GabagoolStrategy(initial_capital=capital_before)
-            strategy.reset()
-
-            # print(
-            #     f"Procesando → {name} ({len(df)} ticks) - "
-            #     f"Capital actual: ${capital_before:.2f}"
-            # )
-
-            total_ticks = len(df)  # Total de ticks en este mercado
-            tendency = 0
-            for tick_index, (_, row) in enumerate(df.iterrows(), start=1):  # tick_index empieza en 1
-                p_yes = float(row["price_yes"])
-                p_no = float(row["price_no"])
-                ts = row["timestamp"]
-                if p_yes > p_no:
-                    tendency += p_yes - p_no
-                else:
-                    tendency -= p_yes - p_no
-                # Pasamos tick_index y total_ticks al strategy
-                strategy.decide_and_execute(p_yes, p_no, ts, tendency, tick_index=tick_index, total_ticks=total_ticks)
-            # --------------------------------------------------------------
-            # Cálculo de beneficio real del mercado
-            # --------------------------------------------------------------
-            safe += strategy.safe
-            last_row = df.iloc[-1]
-            final_price_yes = float(last_row["price_yes"])
-            final_price_no = float(last_row["price_no"])
-            # Heurística simple: si YES está cerca de 1, asumimos que ganó YES, etc.
-            if final_price_yes > 0.9 and final_price_yes >= final_price_no:
-                winner = "YES"
-                payout = strategy.qty_yes * 1.0
-            elif final_price_no > 0.9 and final_price_no >= final_price_yes:
-                winner = "NO"
-                payout = strategy.qty_no * 1.0
-            else:
-                winner = "UNKNOWN"
-                payout = 0.0
-
-            total_cost = strategy.cost_yes + strategy.cost_no
-            profit_real = payout - total_cost
-            profit_lockeado = strategy.guaranteed_profit()
-            profit_final = max(profit_lockeado, profit_real)
-
-            # Actualizar capital compuesto (capital_before + beneficio del mercado)
-            current_capital = capital_before + profit_final
-            total_profit += profit_final
-
-            # Capital efectivamente utilizado en este mercado
-            capital_used = strategy.initial_capital - strategy.capital            
-
-            results.append(
-                {
-                    "market": name,
-                    "market_number": sim,
-                    "capital_before": round(capital_before, 2),
-                    "profit_final": round(profit_final, 3),
-                    "capital_after": round(current_capital, 2),
-                    "profit_real": round(profit_real, 3),
-                    "profit_lockeado": round(profit_lockeado, 3),
-                    "winner": winner,
-                    "final_pair_cost": round(strategy.pair_cost(), 4),
-                    "trades": len(strategy.trades),
-                    "roi_%": round(
-                        (profit_final / capital_used * 100) if capital_used > 0 else 0,
-                        2,
-                    ),
-                }
-            )
+    markets = load_all_markets(sources=sources, fetch_resolutions=fetch_resolutions)
+    if book_recording and market_assets:
+        histories = load_book_histories(book_recording)
+        attached = attach_fill_models(markets, histories, market_assets)
+        print(f"Mercados con fills contra book grabado: {attached}/{len(markets)}")
+    seeds = simulation_seeds(n_simulations, seed)
+    starting_capital = float(initial_capital)
+    current_capital = float(initial_capital)
+
+    if analytic:
+        capital_final = run_analytic_montecarlo(markets, seeds, initial_capital, capital_step)
+        if len(capital_final) == 0:
+            return pd.DataFrame(), current_capital
+        roi_array = (capital_final - starting_capital) / starting_capital * 100
+        _print_montecarlo_summary(roi_array, n_simulations)
+        df_paths = pd.DataFrame({"capital_final": capital_final, "roi_%": roi_array})
+        return df_paths, float(capital_final[-1])
 
-            # Log detallado de este mercado
-            # log_file = os.path.join(
-            #     LOG_DIR, f"{os.path.splitext(name)[0]}_log.json"
-            # )
-            # with open(log_file, "w", encoding="utf-8") as f:
-            #     json.dump(
-            #         {
-            #             "market": name,
-            #             "capital_before": round(capital_before, 2),
-            #             "profit_final": round(profit_final, 3),
-            #             "capital_after": round(current_capital, 2),
-            #             "trades": strategy.trades,
-            #         },
-            #         f,
-            #         indent=2,
-            #         default=str,
-            #     )
-        # --------------------------------------------------------------
-        # Resumen global
-        # --------------------------------------------------------------
+    paths = _iter_paths(markets, seeds, initial_capital, workers, journal)
+    for sim, (results, current_capital, total_profit, safe) in enumerate(paths, start=1):
         df_res = pd.DataFrame(results)
         if len(df_res) == 0:
             print("No hay resultados de backtest (¿no se cargaron mercados válidos?).")
@@ -201,18 +619,9 @@ def run_backtest(initial_capital: float = 1000.0, n_simulations = 500) -> Tuple[
         if sim % max(1, n_simulations // 10) == 0:
             print(f"Simulación {sim}/{n_simulations} → ROI: {roi:.2f}%")
         roi_array = np.array(roi_list)
-    print("\n" + "="*80)
-    print("RESULTADOS MONTECARLO")
-    print("="*80)
-    print(f"Número de simulaciones: {n_simulations}")
-    print(f"ROI medio: {roi_array.mean():.2f}%")
-    print(f"ROI mediana: {np.median(roi_array):.2f}%")
-    print(f"ROI mínimo: {roi_array.min():.2f}%")
-    print(f"ROI máximo: {roi_array.max():.2f}%")
-    print(f"Desviación estándar: {roi_array.std():.2f}%")
-    print("="*80)
+    _print_montecarlo_summary(roi_array, n_simulations)
 
-    return current_capital
+    return df_res, current_capital
 
 if __name__ == "__main__":
     run_backtest(initial_capital=1000.0, n_simulations=10)
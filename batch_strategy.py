@@ -0,0 +1,244 @@
+# batch_strategy.py - Kernel vectorizado: N configuraciones de Strategy en una sola pasada por los ticks
+import math
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from backtest import market_payoffs, simulate_path
+from strategy import Strategy
+
+YES, NO = 1, 2
+
+
+class BatchStrategy:
+    """
+    Estado de N configuraciones de Strategy como arrays NumPy.
+
+    step() reproduce Strategy.decide_and_execute para todas las configuraciones
+    a la vez (mismas operaciones float en el mismo orden), así que el resultado
+    coincide exactamente con N instancias escalares. No registra trades en disco.
+    """
+
+    def __init__(self, params_list: Sequence[dict], initial_capital=1000.0):
+        # Los defaults salen del propio Strategy para no duplicarlos
+        configs = [Strategy(**params) for params in params_list]
+        n = len(configs)
+
+        self.n = n
+        self.initial_capital = np.broadcast_to(
+            np.asarray(initial_capital, dtype=np.float64), (n,)
+        ).copy()
+        self.target = np.array([c.target for c in configs], dtype=np.float64)
+        self.max_order_pct = np.array([c.max_order_pct for c in configs], dtype=np.float64)
+        self.min_order_value = np.array([c.min_order_value for c in configs], dtype=np.float64)
+        self.entry_threshold = np.array([c.entry_threshold for c in configs], dtype=np.float64)
+        self.entry_floor = np.array([c.entry_floor for c in configs], dtype=np.float64)
+        self.reset()
+
+    # ------------------- Helpers ------------------- #
+    def reset(self):
+        self.capital = self.initial_capital.copy()
+        self.qty_yes = np.zeros(self.n)
+        self.cost_yes = np.zeros(self.n)
+        self.qty_no = np.zeros(self.n)
+        self.cost_no = np.zeros(self.n)
+        self.locked = np.zeros(self.n, dtype=bool)
+        self.n_trades = np.zeros(self.n, dtype=np.int64)
+
+    @staticmethod
+    def _avg(cost: np.ndarray, qty: np.ndarray) -> np.ndarray:
+        has_qty = qty > 0
+        return np.where(has_qty, cost / np.where(has_qty, qty, 1.0), 0.0)
+
+    def avg_yes(self) -> np.ndarray:
+        return self._avg(self.cost_yes, self.qty_yes)
+
+    def avg_no(self) -> np.ndarray:
+        return self._avg(self.cost_no, self.qty_no)
+
+    def pair_cost(self) -> np.ndarray:
+        return self.avg_yes() + self.avg_no()
+
+    def guaranteed_profit(self) -> np.ndarray:
+        return np.minimum(self.qty_yes, self.qty_no) - (self.cost_yes + self.cost_no)
+
+    def _simulate_new_pair(
+        self, side: int, qty: np.ndarray, price: float, avg_yes: np.ndarray, avg_no: np.ndarray
+    ) -> np.ndarray:
+        if side == YES:
+            new_cost = self.cost_yes + qty * price
+            new_qty = self.qty_yes + qty
+            new_pair = self._avg(new_cost, new_qty) + avg_no
+        else:
+            new_cost = self.cost_no + qty * price
+            new_qty = self.qty_no + qty
+            new_pair = avg_yes + self._avg(new_cost, new_qty)
+        return np.where(qty > 0, new_pair, avg_yes + avg_no)
+
+    # ------------------- Core ------------------- #
+    def step(self, price_yes: float, price_no: float) -> None:
+        """Un tick para todas las configuraciones (equivale a decide_and_execute)."""
+        active = ~self.locked
+        newly_locked = active & (self.guaranteed_profit() > 0)
+        self.locked |= newly_locked
+        active &= ~newly_locked
+        if not active.any():
+            return
+
+        avg_yes = self.avg_yes()
+        avg_no = self.avg_no()
+        max_cash_this_trade = self.capital * self.max_order_pct
+        empty = (self.qty_yes == 0) & (self.qty_no == 0)
+        can_trade = active & ~(self.capital < self.min_order_value)
+
+        best_side = np.zeros(self.n, dtype=np.int8)
+        best_qty = np.zeros(self.n)
+        best_price = np.zeros(self.n)
+
+        for side, price in ((YES, price_yes), (NO, price_no)):
+            if price <= 0:
+                continue
+
+            ok = can_trade.copy()
+            # Primera entrada
+            ok &= ~(empty & ((price > self.entry_threshold) | (price < self.entry_floor)))
+            # No comprar mismo lado dos veces seguidas
+            if side == YES:
+                ok &= ~((self.qty_yes > 0) & (self.qty_no == 0))
+                imbalance_qty = np.maximum(self.qty_no - self.qty_yes, 0.0)
+            else:
+                ok &= ~((self.qty_no > 0) & (self.qty_yes == 0))
+                imbalance_qty = np.maximum(self.qty_yes - self.qty_no, 0.0)
+            if not ok.any():
+                continue
+
+            qty_by_cash = max_cash_this_trade / price
+            qty = np.minimum(np.maximum(qty_by_cash, imbalance_qty), self.capital / price)
+            ok &= ~(qty * price < self.min_order_value)
+
+            new_pair = self._simulate_new_pair(side, qty, price, avg_yes, avg_no)
+            accept = ok & ((new_pair < self.target) | empty)
+
+            best_side[accept] = side
+            best_qty[accept] = qty[accept]
+            best_price[accept] = price
+
+        # Ejecutar
+        execute = (best_side > 0) & (best_qty > 0)
+        if not execute.any():
+            return
+
+        cost = best_qty * best_price
+        self.capital[execute] -= cost[execute]
+        buy_yes = execute & (best_side == YES)
+        buy_no = execute & (best_side == NO)
+        self.qty_yes[buy_yes] += best_qty[buy_yes]
+        self.cost_yes[buy_yes] += cost[buy_yes]
+        self.qty_no[buy_no] += best_qty[buy_no]
+        self.cost_no[buy_no] += cost[buy_no]
+        self.n_trades[execute] += 1
+
+
+def replay_market_batch(batch: BatchStrategy, arrays: dict) -> BatchStrategy:
+    """Una sola pasada por los ticks del mercado para todas las configuraciones."""
+    for p_yes, p_no in zip(arrays["price_yes"].tolist(), arrays["price_no"].tolist()):
+        if batch.locked.all():
+            break
+        batch.step(p_yes, p_no)
+    return batch
+
+
+def simulate_market_batch(
+    arrays: dict, capital_before, params_list: Sequence[dict]
+) -> np.ndarray:
+    """
+    Equivalente vectorizado de backtest.simulate_market: profit_final por configuración.
+    capital_before puede ser un escalar o un array (un capital por configuración).
+    """
+    batch = replay_market_batch(BatchStrategy(params_list, capital_before), arrays)
+
+    payoff_yes, payoff_no = market_payoffs(arrays)
+    payout = batch.qty_yes * payoff_yes + batch.qty_no * payoff_no
+
+    profit_real = payout - (batch.cost_yes + batch.cost_no)
+    return np.maximum(batch.guaranteed_profit(), profit_real)
+
+
+# --------------------------------------------------------------
+# Montecarlo analítico para muchas configuraciones a la vez
+# --------------------------------------------------------------
+def run_batched_analytic_montecarlo(
+    markets: List[dict],
+    seeds: List[np.random.SeedSequence],
+    initial_capital: float,
+    params_list: Sequence[dict],
+    capital_step: float = 0.05,
+    exact_near: bool = True,
+    tolerance: float = 1e-3,
+) -> np.ndarray:
+    """
+    Igual que backtest.run_analytic_montecarlo pero para todas las configuraciones a la vez.
+    Los (bucket, configuración) que faltan de cada mercado se simulan juntos en una
+    sola pasada del kernel, así que compensa a partir de decenas de configuraciones.
+    Con exact_near=True los caminos que pasan por un bucket donde el multiplicador
+    salta (difiere del bucket siguiente en más de `tolerance`) se repiten con
+    simulate_path, como en el modo analítico escalar.
+    Devuelve el capital final con forma (n_configs, n_simulaciones).
+    """
+    n_configs = len(params_list)
+    n_markets = len(markets)
+    capital = np.full((n_configs, len(seeds)), float(initial_capital))
+    if n_configs == 0 or n_markets == 0 or len(seeds) == 0:
+        return capital
+
+    orders = np.stack([np.random.default_rng(s).permutation(n_markets) for s in seeds])
+    log_step = math.log1p(capital_step)
+    min_capital = np.array([Strategy(**p).min_order_value for p in params_list])[:, None]
+    # (mercado, bucket, configuración) -> multiplicador
+    table: Dict[Tuple[int, int, int], float] = {}
+    config_idx = np.broadcast_to(np.arange(n_configs)[:, None], capital.shape).ravel()
+    near = np.zeros(capital.shape, dtype=bool)
+
+    for step in range(n_markets):
+        market_idx = np.broadcast_to(orders[:, step][None, :], capital.shape).ravel()
+        ratio = np.maximum(capital, min_capital) / initial_capital
+        buckets = np.floor(np.log(ratio) / log_step).astype(np.int64).ravel()
+
+        keys = np.stack([market_idx, buckets, config_idx], axis=1)
+        uniq, inverse = np.unique(keys, axis=0, return_inverse=True)
+        uniq_keys = [tuple(int(v) for v in row) for row in uniq]
+        next_keys = [(m, b + 1, c) for m, b, c in uniq_keys] if exact_near else []
+
+        # Lo que falta se agrupa por mercado: una sola pasada del kernel por mercado,
+        # con una fila por (bucket, configuración) y su propio capital inicial
+        missing: Dict[int, List[Tuple[int, int, int]]] = {}
+        for key in dict.fromkeys(uniq_keys + next_keys):
+            if key not in table:
+                missing.setdefault(key[0], []).append(key)
+        for m, market_keys in missing.items():
+            bucket_capital = np.array(
+                [initial_capital * math.exp(b * log_step) for _, b, _ in market_keys]
+            )
+            profit = simulate_market_batch(
+                markets[m]["arrays"], bucket_capital, [params_list[c] for _, _, c in market_keys]
+            )
+            for key, mult_key in zip(market_keys, (bucket_capital + profit) / bucket_capital):
+                table[key] = float(mult_key)
+
+        values = np.array([table[key] for key in uniq_keys])
+        below = capital < min_capital
+        if exact_near:
+            jump = np.array(
+                [abs(table[k] - table[n]) > tolerance for k, n in zip(uniq_keys, next_keys)]
+            )
+            near |= jump[inverse.ravel()].reshape(capital.shape) & ~below
+        mult = values[inverse.ravel()].reshape(capital.shape)
+        mult[below] = 1.0
+        capital = capital * mult
+
+    for c, path in zip(*np.nonzero(near)):
+        capital[c, path] = simulate_path(
+            markets, orders[path], initial_capital, int(path) + 1, params_list[c]
+        )[1]
+
+    return capital
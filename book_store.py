@@ -0,0 +1,334 @@
+# book_store.py - Lectura en streaming de grabaciones del websocket y almacén compacto por asset
+import gzip
+import json
+import os
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from order_book import BUY, SELL, OrderBook
+
+BOOK_RECORDING = "market_data.json"
+STORE_DIR = "book_store"
+MANIFEST_FILE = "manifest.json"
+
+# Tipos de evento en el almacén
+SNAPSHOT = 0
+DELTA = 1
+
+# Lados de nivel en el almacén
+SIDE_BID = 0
+SIDE_ASK = 1
+
+EVENT_DTYPE = np.dtype([
+    ("ts", "<i8"),
+    ("kind", "i1"),
+    ("row_start", "<i8"),
+    ("n_rows", "<i4"),
+    ("best_bid", "<f4"),
+    ("best_ask", "<f4"),
+])
+LEVEL_DTYPE = np.dtype([
+    ("side", "i1"),
+    ("price", "<f4"),
+    ("size", "<f4"),
+])
+
+
+# -------------------------
+# Lectura en streaming
+# -------------------------
+def _open_text(path: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, "r", encoding="utf-8")
+
+
+def iter_frames(path: str = BOOK_RECORDING) -> Iterator[object]:
+    """Frames crudos de una grabación JSON-lines (.json o .json.gz), uno por línea."""
+    with _open_text(path) as f:
+        try:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+        except EOFError:
+            # Último bloque gzip a medias (grabación cortada): se ignora
+            return
+
+
+def _to_float(value) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _levels(raw: list) -> List[Tuple[float, float]]:
+    out = []
+    for level in raw or []:
+        price = _to_float(level.get("price")) if isinstance(level, dict) else None
+        size = _to_float(level.get("size")) if isinstance(level, dict) else None
+        if price is not None and size is not None:
+            out.append((price, size))
+    return out
+
+
+def normalize_frame(frame) -> Iterator[dict]:
+    """
+    Convierte un frame del websocket en eventos de book normalizados:
+      {"event_type": "book", "asset_id", "ts", "bids": [(p, s)], "asks": [(p, s)]}
+      {"event_type": "price_change", "asset_id", "ts", "side", "price", "size",
+       "best_bid", "best_ask"}
+    El resto de payloads (trades, tick_size, ...) se ignoran.
+    """
+    for msg in frame if isinstance(frame, list) else [frame]:
+        if not isinstance(msg, dict):
+            continue
+        event_type = msg.get("event_type")
+        try:
+            ts = int(msg.get("timestamp"))
+        except (TypeError, ValueError):
+            continue
+
+        if event_type == "book":
+            yield {
+                "event_type": "book",
+                "asset_id": msg.get("asset_id"),
+                "ts": ts,
+                "bids": _levels(msg.get("bids")),
+                "asks": _levels(msg.get("asks")),
+            }
+        elif event_type == "price_change":
+            for change in msg.get("price_changes", []):
+                price = _to_float(change.get("price"))
+                size = _to_float(change.get("size"))
+                if price is None or size is None:
+                    continue
+                yield {
+                    "event_type": "price_change",
+                    "asset_id": change.get("asset_id"),
+                    "ts": ts,
+                    "side": change.get("side"),
+                    "price": price,
+                    "size": size,
+                    "best_bid": _to_float(change.get("best_bid")),
+                    "best_ask": _to_float(change.get("best_ask")),
+                }
+
+
+def iter_book_events(path: str = BOOK_RECORDING) -> Iterator[dict]:
+    """Eventos de book normalizados, leídos de forma perezosa línea a línea."""
+    for frame in iter_frames(path):
+        yield from normalize_frame(frame)
+
+
+def apply_event(book: OrderBook, event: dict) -> None:
+    """Aplica un evento normalizado sobre un OrderBook."""
+    if event["event_type"] == "book":
+        book.apply_levels(event["bids"], event["asks"], timestamp=event["ts"])
+    else:
+        book.apply_change(event["side"], event["price"], event["size"], timestamp=event["ts"])
+        book.sync_top(event.get("best_bid"), event.get("best_ask"))
+
+
+# -------------------------
+# Conversión a almacén compacto
+# -------------------------
+class _AssetWriter:
+    """Acumula eventos de un asset y los vuelca a disco en bloques (append binario)."""
+
+    def __init__(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        self.events_path = os.path.join(directory, "events.bin")
+        self.levels_path = os.path.join(directory, "levels.bin")
+        self.events: List[tuple] = []
+        self.levels: List[tuple] = []
+        self.n_events = 0
+        self.n_levels = 0
+        self.ts_min: Optional[int] = None
+        self.ts_max: Optional[int] = None
+        # Se reescribe desde cero en cada conversión
+        open(self.events_path, "wb").close()
+        open(self.levels_path, "wb").close()
+
+    def add(self, event: dict) -> None:
+        row_start = self.n_levels + len(self.levels)
+        if event["event_type"] == "book":
+            rows = [(SIDE_BID, p, s) for p, s in event["bids"]]
+            rows += [(SIDE_ASK, p, s) for p, s in event["asks"]]
+            kind, best_bid, best_ask = SNAPSHOT, np.nan, np.nan
+        else:
+            side = SIDE_BID if event["side"] == BUY else SIDE_ASK
+            rows = [(side, event["price"], event["size"])]
+            kind = DELTA
+            best_bid = event["best_bid"] if event["best_bid"] is not None else np.nan
+            best_ask = event["best_ask"] if event["best_ask"] is not None else np.nan
+
+        self.levels.extend(rows)
+        self.events.append((event["ts"], kind, row_start, len(rows), best_bid, best_ask))
+        self.ts_min = event["ts"] if self.ts_min is None else min(self.ts_min, event["ts"])
+        self.ts_max = event["ts"] if self.ts_max is None else max(self.ts_max, event["ts"])
+
+    def pending(self) -> int:
+        return len(self.levels) + len(self.events)
+
+    def flush(self) -> None:
+        if self.events:
+            with open(self.events_path, "ab") as f:
+                np.array(self.events, dtype=EVENT_DTYPE).tofile(f)
+            self.n_events += len(self.events)
+            self.events.clear()
+        if self.levels:
+            with open(self.levels_path, "ab") as f:
+                np.array(self.levels, dtype=LEVEL_DTYPE).tofile(f)
+            self.n_levels += len(self.levels)
+            self.levels.clear()
+
+
+def convert_recording(
+    path: str = BOOK_RECORDING, store_dir: str = STORE_DIR, flush_rows: int = 200_000
+) -> Dict[str, dict]:
+    """
+    Convierte una grabación en un almacén por asset_id (una pasada, memoria acotada):
+      {store_dir}/{asset_id}/events.bin  (EVENT_DTYPE)
+      {store_dir}/{asset_id}/levels.bin  (LEVEL_DTYPE, float32)
+      {store_dir}/manifest.json          (conteos y rango de timestamps)
+    Los eventos se guardan en orden de llegada; el índice por timestamp
+    asume que la grabación está ordenada en el tiempo (como la escribe el websocket).
+    """
+    writers: Dict[str, _AssetWriter] = {}
+    for event in iter_book_events(path):
+        asset_id = event.get("asset_id")
+        if not asset_id:
+            continue
+        writer = writers.get(asset_id)
+        if writer is None:
+            writer = writers[asset_id] = _AssetWriter(os.path.join(store_dir, asset_id))
+        writer.add(event)
+        if writer.pending() >= flush_rows:
+            writer.flush()
+
+    manifest = {}
+    for asset_id, writer in writers.items():
+        writer.flush()
+        manifest[asset_id] = {
+            "events": writer.n_events,
+            "levels": writer.n_levels,
+            "ts_min": writer.ts_min,
+            "ts_max": writer.ts_max,
+        }
+
+    os.makedirs(store_dir, exist_ok=True)
+    with open(os.path.join(store_dir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump({"source": os.path.abspath(path), "assets": manifest}, f, indent=2)
+    return manifest
+
+
+# -------------------------
+# Consulta
+# -------------------------
+class AssetBook:
+    """Eventos de un asset en memoria mapeada, con índice por timestamp."""
+
+    def __init__(self, directory: str):
+        self.events = _memmap(os.path.join(directory, "events.bin"), EVENT_DTYPE)
+        self.levels = _memmap(os.path.join(directory, "levels.bin"), LEVEL_DTYPE)
+        self.ts = self.events["ts"]
+        self._snapshots = np.flatnonzero(self.events["kind"] == SNAPSHOT)
+
+    def __len__(self) -> int:
+        return len(self.events)
+
+    def range(self, ts_from: int, ts_to: int) -> Tuple[int, int]:
+        """Índices [lo, hi) de los eventos con ts_from <= ts < ts_to."""
+        lo = int(np.searchsorted(self.ts, ts_from, side="left"))
+        hi = int(np.searchsorted(self.ts, ts_to, side="left"))
+        return lo, hi
+
+    def event_levels(self, idx: int) -> np.ndarray:
+        ev = self.events[idx]
+        start = int(ev["row_start"])
+        return self.levels[start:start + int(ev["n_rows"])]
+
+    def iter_events(self, ts_from: int, ts_to: int) -> Iterator[dict]:
+        """Eventos normalizados del rango (mismo formato que iter_book_events)."""
+        lo, hi = self.range(ts_from, ts_to)
+        for idx in range(lo, hi):
+            yield self._event(idx)
+
+    def book_at(self, ts: int, asset_id: str = "") -> Optional[OrderBook]:
+        """Reconstruye el libro en ts: último snapshot <= ts más los deltas posteriores."""
+        last = int(np.searchsorted(self.ts, ts, side="right"))
+        pos = int(np.searchsorted(self._snapshots, last, side="left")) - 1
+        if pos < 0:
+            return None
+        book = OrderBook(asset_id)
+        for idx in range(int(self._snapshots[pos]), last):
+            apply_event(book, self._event(idx))
+        return book
+
+    def _event(self, idx: int) -> dict:
+        ev = self.events[idx]
+        rows = self.event_levels(idx)
+        ts = int(ev["ts"])
+        if ev["kind"] == SNAPSHOT:
+            bids = rows[rows["side"] == SIDE_BID]
+            asks = rows[rows["side"] == SIDE_ASK]
+            return {
+                "event_type": "book",
+                "ts": ts,
+                "bids": list(zip(bids["price"].astype(float).tolist(), bids["size"].astype(float).tolist())),
+                "asks": list(zip(asks["price"].astype(float).tolist(), asks["size"].astype(float).tolist())),
+            }
+        row = rows[0]
+        best_bid = float(ev["best_bid"])
+        best_ask = float(ev["best_ask"])
+        return {
+            "event_type": "price_change",
+            "ts": ts,
+            "side": BUY if row["side"] == SIDE_BID else SELL,
+            "price": float(row["price"]),
+            "size": float(row["size"]),
+            "best_bid": None if np.isnan(best_bid) else best_bid,
+            "best_ask": None if np.isnan(best_ask) else best_ask,
+        }
+
+
+class BookStore:
+    """Almacén completo (un AssetBook por asset_id), abierto bajo demanda."""
+
+    def __init__(self, store_dir: str = STORE_DIR):
+        self.store_dir = store_dir
+        with open(os.path.join(store_dir, MANIFEST_FILE), "r", encoding="utf-8") as f:
+            self.manifest: Dict[str, dict] = json.load(f)["assets"]
+        self._assets: Dict[str, AssetBook] = {}
+
+    def asset_ids(self) -> List[str]:
+        return list(self.manifest)
+
+    def asset(self, asset_id: str) -> AssetBook:
+        book = self._assets.get(asset_id)
+        if book is None:
+            book = self._assets[asset_id] = AssetBook(os.path.join(self.store_dir, asset_id))
+        return book
+
+    def iter_events(self, asset_id: str, ts_from: int, ts_to: int) -> Iterator[dict]:
+        for event in self.asset(asset_id).iter_events(ts_from, ts_to):
+            yield {**event, "asset_id": asset_id}
+
+
+def _memmap(path: str, dtype: np.dtype) -> np.ndarray:
+    if os.path.getsize(path) == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r")
+
+
+if __name__ == "__main__":
+    summary = convert_recording()
+    for asset, info in summary.items():
+        print(f"{asset[:12]}…: {info['events']} eventos, {info['levels']} niveles")
@@ -0,0 +1,64 @@
+# bot_logging.py - Logging del bot con cola: el formateo se hace en un hilo aparte
+import atexit
+import logging
+import os
+import queue
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional, Union
+
+LOGGER_NAME = "PolyPolyBot"
+LOG_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+LOG_LEVEL_ENV = "POLYPOLY_LOG_LEVEL"
+
+_listener: Optional[QueueListener] = None
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    QueueHandler que no formatea en el hilo que loguea: el record viaja con su
+    mensaje %-style y sus args y el QueueListener lo formatea al escribirlo.
+    Los args deben ser valores que no cambien después (números, str, dicts que
+    ya no se modifican).
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def setup_logging(
+    level: Union[int, str, None] = None, queued: bool = True, fmt: str = LOG_FORMAT
+) -> logging.Logger:
+    """
+    Configura el logger del bot (una sola vez por proceso).
+    level: nivel del logger; por defecto $POLYPOLY_LOG_LEVEL o INFO.
+    queued: True = la salida a consola va por cola + hilo (no bloquea el bucle).
+    """
+    global _listener
+    logger = logging.getLogger(LOGGER_NAME)
+    if logger.handlers:
+        return logger
+
+    if level is None:
+        level = os.environ.get(LOG_LEVEL_ENV, "INFO")
+    logger.setLevel(level.upper() if isinstance(level, str) else level)
+
+    console = logging.StreamHandler()
+    console.setFormatter(logging.Formatter(fmt))
+
+    if queued:
+        log_queue: "queue.SimpleQueue" = queue.SimpleQueue()
+        logger.addHandler(DeferredQueueHandler(log_queue))
+        _listener = QueueListener(log_queue, console, respect_handler_level=True)
+        _listener.start()
+        atexit.register(stop_logging)
+    else:
+        logger.addHandler(console)
+    return logger
+
+
+def stop_logging() -> None:
+    """Vacía la cola pendiente y para el hilo del listener."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
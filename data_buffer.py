@@ -1,50 +1,245 @@
 # data_buffer.py
+import asyncio
+import itertools
 import threading
-from datetime import datetime
-from typing import Optional, Dict
+from typing import Optional, Dict, Set, Tuple
+
+from latency import LATENCY, RECV_TO_BUFFER, now_ns
+
+
+# -------------------------
+# Registro de tick
+# -------------------------
+class Tick:
+    """
+    Top of book de un asset. Inmutable una vez publicado: add_tick crea un
+    registro nuevo y sustituye la referencia, así que un lector nunca ve
+    un tick a medio escribir y no hace falta copiarlo.
+    seq crece en cada publicación (contador global, luego también por asset).
+    recv_ns/pub_ns: perf_counter_ns de recepción del frame y de publicación (latencias).
+    """
+
+    __slots__ = (
+        "asset_id", "seq", "timestamp", "bid", "ask", "mid", "bid_size", "ask_size",
+        "recv_ns", "pub_ns",
+    )
+
+    def __init__(
+        self, asset_id, seq, timestamp, bid, ask, mid, bid_size=None, ask_size=None,
+        recv_ns=None, pub_ns=None,
+    ):
+        self.asset_id = asset_id
+        self.seq = seq
+        self.timestamp = timestamp
+        self.bid = bid
+        self.ask = ask
+        self.mid = mid
+        self.bid_size = bid_size
+        self.ask_size = ask_size
+        self.recv_ns = recv_ns
+        self.pub_ns = pub_ns
+
+    def get(self, key, default=None):
+        """Acceso tipo dict (compatibilidad con el tick como dict)."""
+        return getattr(self, key, default)
+
+    def as_dict(self) -> dict:
+        return {k: getattr(self, k) for k in self.__slots__}
+
+    def __repr__(self) -> str:
+        return f"Tick({self.asset_id[:8]}…, seq={self.seq}, bid={self.bid}, ask={self.ask})"
+
 
 # -------------------------
 # Estado interno
 # -------------------------
 _lock = threading.Lock()
 
-# Último tick por asset_id (cache fijo)
-_ticks: Dict[str, dict] = {}
+# Último tick por asset_id (cache fijo). Solo se reemplazan referencias:
+# las lecturas no toman el lock.
+_ticks: Dict[str, Tick] = {}
+
+# Secuencia global de publicación (next() sobre count es atómico con el GIL)
+_seq = itertools.count(1)
+
+# Suscriptores a nuevos ticks: (loop, Event) de cada consumidor asyncio.
+# Copy-on-write: se sustituye la tupla entera al (des)suscribir.
+_listeners: Tuple[Tuple[asyncio.AbstractEventLoop, asyncio.Event], ...] = ()
+
+
+class ChangeSet:
+    """
+    Suscripción con detalle: además del Event, acumula qué assets tuvieron
+    tick nuevo desde el último drain(). Un consumidor con muchos mercados
+    solo evalúa los que cambiaron, sin recorrer todos.
+    Pensado para productor y consumidor en el mismo event loop.
+    """
+
+    __slots__ = ("event", "_changed")
+
+    def __init__(self):
+        self.event = asyncio.Event()
+        self._changed: Set[str] = set()
+
+    def drain(self) -> Set[str]:
+        changed, self._changed = self._changed, set()
+        return changed
+
+
+_change_sets: Tuple[ChangeSet, ...] = ()
 
 # -------------------------
 # API pública
 # -------------------------
-def add_tick(tick: dict) -> None:
+def publish_tick(
+    asset_id, timestamp, bid, ask, bid_size=None, ask_size=None, recv_ns=None
+) -> Tick:
+    """Publica el top of book de un asset y devuelve el registro creado."""
+    pub_ns = now_ns()
+    tick = Tick(
+        asset_id, next(_seq), timestamp, bid, ask, (bid + ask) / 2, bid_size, ask_size,
+        recv_ns, pub_ns,
+    )
+    LATENCY.record_ns(RECV_TO_BUFFER, recv_ns, pub_ns)
+    _ticks[asset_id] = tick
+    for change_set in _change_sets:
+        change_set._changed.add(asset_id)
+        change_set.event.set()
+    _notify(_listeners)
+    return tick
+
+
+def add_tick(tick: dict) -> Optional[Tick]:
     """
-    Guarda el último tick de un asset.
+    Guarda el último tick de un asset (formato dict).
     El tamaño de _ticks es fijo (1 entrada por asset_id).
     """
     asset_id = tick.get("asset_id")
     if not asset_id:
+        return None
+    try:
+        return publish_tick(
+            asset_id,
+            tick["timestamp"],
+            tick["bid"],
+            tick["ask"],
+            tick.get("bid_size"),
+            tick.get("ask_size"),
+        )
+    except (KeyError, TypeError):
+        # ⚠️ Tick incompleto: se descarta
+        return None
+
+
+def get_tick(asset_id: str) -> Optional[Tick]:
+    return _ticks.get(asset_id)
+
+
+def get_seq(asset_id: str) -> int:
+    """Secuencia del último tick del asset (0 si no hay)."""
+    tick = _ticks.get(asset_id)
+    return tick.seq if tick is not None else 0
+
+
+def get_pair(yes_token: str, no_token: str) -> Optional[Tuple[Tick, Tick]]:
+    """Últimos ticks YES/NO sin copiar (None si falta alguno)."""
+    yes = _ticks.get(yes_token)
+    no = _ticks.get(no_token)
+    if yes is None or no is None:
+        return None
+    return yes, no
+
+
+def get_pair_since(yes_token: str, no_token: str, seq: int) -> Optional[Tuple[Tick, Tick]]:
+    """
+    Como get_pair, pero solo si alguno de los dos lados es más nuevo que `seq`.
+    El consumidor guarda max(yes.seq, no.seq) de lo último que procesó.
+    """
+    yes = _ticks.get(yes_token)
+    no = _ticks.get(no_token)
+    if yes is None or no is None:
+        return None
+    if yes.seq <= seq and no.seq <= seq:
+        return None
+    return yes, no
+
+
+def clear_ticks(asset_ids=None) -> None:
+    """Olvida los ticks de los assets indicados (todos si None)."""
+    if asset_ids is None:
+        _ticks.clear()
+        return
+    for asset_id in asset_ids:
+        _ticks.pop(asset_id, None)
+
+
+# -------------------------
+# Notificación de ticks (push)
+# -------------------------
+def _notify(listeners) -> None:
+    """
+    Despierta a los consumidores. Un Event ya activo no se vuelve a encolar,
+    así que una ráfaga de ticks se coalesce en un solo despertar.
+    """
+    if not listeners:
         return
+    try:
+        current = asyncio.get_running_loop()
+    except RuntimeError:
+        current = None
+
+    for loop, event in listeners:
+        if loop is current:
+            event.set()
+        elif not loop.is_closed():
+            loop.call_soon_threadsafe(event.set)
+
 
+def subscribe_updates() -> asyncio.Event:
+    """
+    Devuelve un asyncio.Event que se activa en cada add_tick.
+    El consumidor hace clear() antes de leer el snapshot y así solo evalúa el más reciente.
+    """
+    global _listeners
+    event = asyncio.Event()
     with _lock:
-        _ticks[asset_id] = tick
+        _listeners = _listeners + ((asyncio.get_running_loop(), event),)
+    return event
 
 
-def get_latest_snapshot(yes_token: str, no_token: str) -> Optional[dict]:
+def unsubscribe_updates(event: asyncio.Event) -> None:
+    global _listeners
     with _lock:
-        yes = _ticks.get(yes_token)
-        no  = _ticks.get(no_token)
+        _listeners = tuple((loop, ev) for loop, ev in _listeners if ev is not event)
 
-    # ⚠️ Protege contra ticks incompletos
-    required_keys = ["bid", "ask", "mid", "timestamp"]
-    if not yes or not no:
-        return None
-    if not all(k in yes for k in required_keys) or not all(k in no for k in required_keys):
+
+def subscribe_changes() -> ChangeSet:
+    """Como subscribe_updates pero indicando qué assets cambiaron (ver ChangeSet)."""
+    global _change_sets
+    change_set = ChangeSet()
+    with _lock:
+        _change_sets = _change_sets + (change_set,)
+    return change_set
+
+
+def unsubscribe_changes(change_set: ChangeSet) -> None:
+    global _change_sets
+    with _lock:
+        _change_sets = tuple(cs for cs in _change_sets if cs is not change_set)
+
+
+def get_latest_snapshot(yes_token: str, no_token: str) -> Optional[dict]:
+    pair = get_pair(yes_token, no_token)
+    if pair is None:
         return None
+    yes, no = pair
 
     return {
-        "timestamp": max(yes["timestamp"], no["timestamp"]),
-        "mid_yes": yes["mid"],
-        "mid_no": no["mid"],
-        "bid_yes": yes["bid"],
-        "ask_yes": yes["ask"],
-        "bid_no": no["bid"],
-        "ask_no": no["ask"],
+        "timestamp": max(yes.timestamp, no.timestamp),
+        "mid_yes": yes.mid,
+        "mid_no": no.mid,
+        "bid_yes": yes.bid,
+        "ask_yes": yes.ask,
+        "bid_no": no.bid,
+        "ask_no": no.ask,
     }
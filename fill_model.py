@@ -0,0 +1,205 @@
+# fill_model.py - Ejecución simulada contra books grabados (VWAP y fills parciales)
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from book_store import BOOK_RECORDING, BookStore, apply_event, iter_book_events
+from order_book import BUY, SELL, OrderBook
+
+
+# -------------------------
+# Historial de books por asset
+# -------------------------
+class BookHistory:
+    """
+    Estados sucesivos del libro de un asset indexados por timestamp (ms).
+    ladder(ts) devuelve el libro vigente en ts (último estado con timestamp <= ts)
+    mediante búsqueda binaria sobre el array de timestamps.
+    """
+
+    def __init__(self, asset_id: str):
+        self.asset_id = asset_id
+        self._ts: List[int] = []
+        self._asks: List[Tuple[np.ndarray, np.ndarray]] = []
+        self._bids: List[Tuple[np.ndarray, np.ndarray]] = []
+        self.timestamps = np.empty(0, dtype=np.int64)
+
+    def append(self, ts_ms: int, book: OrderBook) -> None:
+        """Guarda el estado actual de `book` (mejor precio primero)."""
+        if self._ts and ts_ms == self._ts[-1]:
+            # Varios eventos en el mismo ms: solo cuenta el último estado
+            self._ts.pop()
+            self._asks.pop()
+            self._bids.pop()
+        self._ts.append(ts_ms)
+        self._asks.append(_ladder_arrays(book.depth(SELL)))
+        self._bids.append(_ladder_arrays(book.depth(BUY)))
+
+    def freeze(self) -> "BookHistory":
+        self.timestamps = np.asarray(self._ts, dtype=np.int64)
+        return self
+
+    def __len__(self) -> int:
+        return len(self._ts)
+
+    def ladder(self, ts_ms: int, side: str = SELL) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        idx = int(np.searchsorted(self.timestamps, ts_ms, side="right")) - 1
+        if idx < 0:
+            return None
+        return (self._bids if side == BUY else self._asks)[idx]
+
+
+def _ladder_arrays(levels: List[Tuple[float, float]]) -> Tuple[np.ndarray, np.ndarray]:
+    if not levels:
+        return np.empty(0), np.empty(0)
+    prices, sizes = zip(*levels)
+    return np.asarray(prices, dtype=np.float64), np.asarray(sizes, dtype=np.float64)
+
+
+def build_book_histories(events: Iterable[dict]) -> Dict[str, BookHistory]:
+    """
+    Reproduce eventos normalizados (book_store.normalize_frame) sobre OrderBook
+    y guarda el estado de cada asset tras cada cambio.
+    """
+    books: Dict[str, OrderBook] = {}
+    histories: Dict[str, BookHistory] = {}
+
+    for event in events:
+        asset_id = event.get("asset_id")
+        book = books.get(asset_id)
+        if book is None:
+            # Un delta sin snapshot previo no tiene libro al que aplicarse
+            if event["event_type"] != "book":
+                continue
+            book = books[asset_id] = OrderBook(asset_id)
+        apply_event(book, event)
+        histories.setdefault(asset_id, BookHistory(asset_id)).append(event["ts"], book)
+
+    return {asset_id: h.freeze() for asset_id, h in histories.items()}
+
+
+def load_book_histories(path: str = BOOK_RECORDING) -> Dict[str, BookHistory]:
+    """Carga una grabación JSON-lines de frames del websocket (como market_data.json)."""
+    return build_book_histories(iter_book_events(path))
+
+
+def store_book_histories(
+    store: BookStore, asset_ids: Iterable[str], ts_from: int = 0, ts_to: int = 2**62
+) -> Dict[str, BookHistory]:
+    """Igual que load_book_histories pero desde el almacén compacto y solo para ciertos assets."""
+    events = (
+        event for asset_id in asset_ids for event in store.iter_events(asset_id, ts_from, ts_to)
+    )
+    return build_book_histories(events)
+
+
+# -------------------------
+# Ejecución contra el ladder
+# -------------------------
+def walk_ladder(
+    prices: np.ndarray, sizes: np.ndarray, qty: float, max_cost: float = float("inf")
+) -> Tuple[float, float]:
+    """
+    Compra recorriendo los niveles (mejor precio primero) hasta qty o hasta max_cost.
+    Devuelve (qty_llenada, precio_medio_ponderado). Sin liquidez -> (0.0, 0.0).
+    """
+    if qty <= 0 or len(prices) == 0 or max_cost <= 0:
+        return 0.0, 0.0
+
+    cum_size = np.cumsum(sizes)
+    cum_cost = np.cumsum(prices * sizes)
+
+    # Límite por cantidad (y por liquidez total del libro)
+    filled = min(qty, float(cum_size[-1]))
+
+    # Límite por caja: cantidad máxima comprable con max_cost
+    if max_cost < cum_cost[-1]:
+        i = int(np.searchsorted(cum_cost, max_cost, side="right"))
+        base_size = cum_size[i - 1] if i > 0 else 0.0
+        base_cost = cum_cost[i - 1] if i > 0 else 0.0
+        filled = min(filled, float(base_size + (max_cost - base_cost) / prices[i]))
+
+    if filled <= 0:
+        return 0.0, 0.0
+
+    i = int(np.searchsorted(cum_size, filled, side="left"))
+    i = min(i, len(prices) - 1)
+    base_size = cum_size[i - 1] if i > 0 else 0.0
+    base_cost = cum_cost[i - 1] if i > 0 else 0.0
+    cost = float(base_cost + (filled - base_size) * prices[i])
+    return filled, cost / filled
+
+
+def to_epoch_ms(ts) -> int:
+    """Timestamp de tick (datetime64, pandas, datetime o ms en str/int) -> epoch ms."""
+    if isinstance(ts, (int, np.integer)):
+        return int(ts)
+    if isinstance(ts, str) and ts.isdigit():
+        return int(ts)
+    return int(np.datetime64(ts, "ms").astype(np.int64))
+
+
+def infer_ts_offset_ms(timestamps: np.ndarray, slot_ts: int) -> int:
+    """
+    Los CSV de polling guardan hora local sin zona. El primer tick cae dentro del
+    slot de 15 minutos, así que la diferencia con el inicio del slot (UTC),
+    redondeada a horas, es el desfase de zona horaria a corregir.
+    """
+    first_ms = int(np.asarray(timestamps[:1]).astype("datetime64[ms]").astype(np.int64)[0])
+    hours = round((first_ms - slot_ts * 1000) / 3_600_000)
+    return -hours * 3_600_000
+
+
+class DepthFillModel:
+    """
+    Modelo de fill para Strategy(fill_model=...): cada orden se ejecuta contra
+    el ask ladder grabado del lado correspondiente en el instante del tick.
+    Sin book grabado para ese instante la orden no se llena.
+    """
+
+    def __init__(self, yes_book: BookHistory, no_book: BookHistory, ts_offset_ms: int = 0):
+        self.books = {"YES": yes_book, "NO": no_book}
+        self.ts_offset_ms = ts_offset_ms
+        self.requested_qty = 0.0
+        self.filled_qty = 0.0
+
+    def __call__(self, side: str, qty: float, ts, max_cost: float) -> Tuple[float, float]:
+        ladder = self.books[side].ladder(to_epoch_ms(ts) + self.ts_offset_ms)
+        self.requested_qty += qty
+        if ladder is None:
+            return 0.0, 0.0
+        filled, avg_price = walk_ladder(ladder[0], ladder[1], qty, max_cost)
+        self.filled_qty += filled
+        return filled, avg_price
+
+    @property
+    def fill_ratio(self) -> float:
+        return self.filled_qty / self.requested_qty if self.requested_qty > 0 else 1.0
+
+
+def attach_fill_models(
+    markets: List[dict],
+    histories: Dict[str, BookHistory],
+    market_assets: Dict[str, Tuple[str, str]],
+) -> int:
+    """
+    Asigna un DepthFillModel a cada mercado del backtest con books grabados.
+    market_assets: nombre de mercado (CSV o slug) -> (yes_asset_id, no_asset_id).
+    Devuelve cuántos mercados quedaron con modelo de fill.
+    """
+    attached = 0
+    for market in markets:
+        name = market["name"]
+        slug = name.split("_polling")[0]
+        assets = market_assets.get(name) or market_assets.get(slug)
+        if not assets or assets[0] not in histories or assets[1] not in histories:
+            continue
+
+        offset = 0
+        try:
+            offset = infer_ts_offset_ms(market["arrays"]["timestamp"], int(slug.rsplit("-", 1)[1]))
+        except (IndexError, ValueError):
+            pass
+        market["fill_model"] = DepthFillModel(histories[assets[0]], histories[assets[1]], offset)
+        attached += 1
+    return attached
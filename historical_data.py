@@ -1,131 +1,351 @@
 # data_historical.py - VERSIÓN FINAL CORREGIDA: interval válido y filtro preciso para 15min recientes
+import argparse
+import random
+import threading
 import requests
 import pandas as pd
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 import os
 import json
+from typing import Dict, List, Optional
+
+from requests.adapters import HTTPAdapter
+
+from market_catalog import MarketCatalog
+from tick_cache import align_legs
 
-GAMMA_URL = "https://gamma-api.polymarket.com/markets"
 CLOB_HISTORY_URL = "https://clob.polymarket.com/prices-history"
 
 OUTPUT_DIR = "historical_data"
+MANIFEST_FILE = "manifest.json"
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
-def get_up_down_markets(max_pages=20, limit=500):
-    all_markets = []
-    offset = 0
-    for page in range(max_pages):
-        params = {
-            "ascending": "false",
-            "order": "startDate",
-            "limit": limit,
-            "offset": offset,
-            "closed": "true",  # Cerrados recientes tienen los 15min completos
-            "tag_id": 235,     # Bitcoin
-        }
-        response = requests.get(GAMMA_URL, params=params)
-        if response.status_code != 200:
-            print(f"Error Gamma API: {response.text}")
-            break
-        
-        markets_page = response.json()
-        if not markets_page:
-            break
-        
-        for m in markets_page:
-            question = m.get("question", "").lower()
-            if "bitcoin up or down" in question.lower() and "?" in question:
-                all_markets.append(m)
-                print(f"Encontrado válido: {question[:100]}")
-        
-        print(f"Página {page+1}: {len(markets_page)} mercados, acumulados {len(all_markets)} 15min válidos.")
-        offset += limit
-        time.sleep(0.5)
-    
-    print(f"\nTotal mercados 15min Bitcoin Up/Down encontrados: {len(all_markets)}")
-    return all_markets
-
-def download_price_history(asset_id, interval="1m"):
+# Estados del manifest: los terminados no se vuelven a descargar
+DONE = "done"
+EMPTY = "empty"      # el mercado no tiene datos suficientes (definitivo)
+FAILED = "failed"    # error de red/API (se reintenta en la siguiente ejecución)
+FINISHED = (DONE, EMPTY)
+
+
+# -------------------------
+# Cliente HTTP: pool, rate limit y reintentos
+# -------------------------
+class RateLimiter:
+    """Token bucket compartido entre hilos: como mucho `rate` peticiones/s (ráfagas de `burst`)."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class HttpClient:
+    """
+    Sesión con conexiones keep-alive reutilizadas por todos los hilos.
+    get_json reintenta 429/5xx y errores de red con backoff exponencial + jitter
+    (respeta Retry-After) y devuelve None si se agotan los intentos o el error es definitivo.
+    """
+
+    RETRY_STATUS = (429, 500, 502, 503, 504)
+
+    def __init__(
+        self,
+        rate: float = 10.0,
+        pool_size: int = 8,
+        retries: int = 5,
+        backoff: float = 0.5,
+        max_backoff: float = 30.0,
+        timeout: float = 15.0,
+    ):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.limiter = RateLimiter(rate, burst=pool_size)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+
+    def _sleep_backoff(self, attempt: int, retry_after: Optional[str] = None) -> None:
+        delay = min(self.max_backoff, self.backoff * (2 ** attempt))
+        if retry_after:
+            try:
+                delay = max(delay, float(retry_after))
+            except ValueError:
+                pass
+        time.sleep(delay * (0.5 + random.random() / 2))
+
+    def get_json(self, url: str, params: Optional[dict] = None):
+        for attempt in range(self.retries + 1):
+            self.limiter.acquire()
+            try:
+                response = self.session.get(url, params=params, timeout=self.timeout)
+            except requests.RequestException as e:
+                if attempt == self.retries:
+                    print(f"Error de red en {url}: {e}")
+                    return None
+                self._sleep_backoff(attempt)
+                continue
+
+            if response.status_code == 200:
+                return response.json()
+            if response.status_code in self.RETRY_STATUS and attempt < self.retries:
+                self._sleep_backoff(attempt, response.headers.get("Retry-After"))
+                continue
+            print(f"Error {response.status_code} en {url}: {response.text[:200]}")
+            return None
+        return None
+
+    def close(self) -> None:
+        self.session.close()
+
+
+_default_client: Optional[HttpClient] = None
+
+
+def get_client() -> HttpClient:
+    global _default_client
+    if _default_client is None:
+        _default_client = HttpClient()
+    return _default_client
+
+
+# -------------------------
+# Manifest de progreso (reanudable)
+# -------------------------
+def load_manifest(output_dir: str = OUTPUT_DIR) -> Dict[str, dict]:
+    path = os.path.join(output_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        print(f"Manifest ilegible en {path}, se empieza de cero")
+        return {}
+
+
+def save_manifest(manifest: Dict[str, dict], output_dir: str = OUTPUT_DIR) -> None:
+    """Escritura atómica: un corte nunca deja el manifest a medias."""
+    path = os.path.join(output_dir, MANIFEST_FILE)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+# -------------------------
+# Gamma + CLOB
+# -------------------------
+def get_up_down_markets(
+    catalog: Optional[MarketCatalog] = None,
+    client: Optional[HttpClient] = None,
+    max_pages: int = 20,
+    ts_from: Optional[float] = None,
+    ts_to: Optional[float] = None,
+    refresh: bool = True,
+) -> List[dict]:
+    """
+    Mercados Bitcoin Up/Down cerrados entre ts_from y ts_to (inicio de slot).
+    Se sirven del catálogo local, que antes se pone al día con Gamma de forma
+    incremental (solo lo publicado desde la última vez).
+    """
+    catalog = catalog if catalog is not None else MarketCatalog()
+    if refresh:
+        catalog.refresh(get_json=(client or get_client()).get_json, max_pages=max_pages)
+    markets = [
+        m for m in catalog.range(ts_from, ts_to, closed=True)
+        if m["question"].lower().startswith("bitcoin up or down")
+    ]
+    print(f"\nTotal mercados 15min Bitcoin Up/Down en el catálogo: {len(markets)}")
+    return markets
+
+
+class DownloadError(Exception):
+    """Fallo de red/API al descargar un histórico (reintentable)."""
+
+
+def download_price_history(asset_id, interval="1m", client: Optional[HttpClient] = None):
     params = {
         "market": asset_id,
         "interval": interval,
         "fidelity": 10,
     }
-    print(f"Descargando con interval={interval} para market {asset_id}")
-    
-    response = requests.get(CLOB_HISTORY_URL, params=params)
-    if response.status_code != 200:
-        print(f"Error CLOB: {response.text}")
-        return pd.DataFrame()
-    
-    data = response.json().get("history", [])
+    payload = (client or get_client()).get_json(CLOB_HISTORY_URL, params)
+    if payload is None:
+        raise DownloadError(f"Sin respuesta de CLOB para {asset_id}")
+
+    data = payload.get("history", [])
     if not data:
-        print(f"Sin datos para {asset_id}")
         return pd.DataFrame()
-    
+
     df = pd.DataFrame(data)
     df["timestamp"] = pd.to_datetime(df["t"], unit="s")
     df["price"] = df["p"].astype(float)
     df = df[["timestamp", "price"]]
-    print(f"¡ÉXITO! {len(df)} puntos descargados para {asset_id}")
     return df
 
-def download_market_history(market):
+
+def market_slug(market: dict) -> str:
+    return market.get("slug", market["question"].replace("?", ""))
+
+
+def download_market_history(
+    market, client: Optional[HttpClient] = None, output_dir: str = OUTPUT_DIR
+) -> dict:
+    """
+    Descarga YES y NO de un mercado y guarda el CSV combinado.
+    Devuelve la entrada del manifest: {"status": done/empty/failed, ...}.
+    """
     question = market["question"]
-    slug = market.get("slug", question.replace("?", ""))
-    
-    clob_tokens_str = market.get("clobTokenIds")
-    if not clob_tokens_str:
-        print("Sin clobTokenIds")
-        return False  # ← Cambiado a False
-    
+    slug = market_slug(market)
+
+    if "yes_token" in market:  # entrada del catálogo
+        yes_token, no_token = market["yes_token"], market["no_token"]
+    else:
+        clob_tokens_str = market.get("clobTokenIds")
+        if not clob_tokens_str:
+            return {"status": EMPTY, "reason": "Sin clobTokenIds"}
+
+        try:
+            tokens = json.loads(clob_tokens_str)
+            if len(tokens) != 2:
+                return {"status": EMPTY, "reason": f"{len(tokens)} tokens, esperado 2"}
+            yes_token, no_token = tokens
+        except Exception as e:
+            return {"status": EMPTY, "reason": f"Error parseando tokens: {e}"}
+
     try:
-        tokens = json.loads(clob_tokens_str)
-        if len(tokens) != 2:
-            print(f"{len(tokens)} tokens, esperado 2")
-            return False  # ← False
-        yes_token, no_token = tokens
-        print(f"Tokens → YES: {yes_token} | NO: {no_token}")
-    except Exception as e:
-        print(f"Error parseando tokens: {e}")
-        return False  # ← False
-    
-    print(f"\nDescargando datos para: {question}")
-    
-    df_yes = download_price_history(yes_token, "1m")
-    df_no = download_price_history(no_token, "1m")
-    
+        df_yes = download_price_history(yes_token, "1m", client)
+        df_no = download_price_history(no_token, "1m", client)
+    except DownloadError as e:
+        return {"status": FAILED, "reason": str(e)}
+
     if df_yes.empty or df_no.empty:
-        print("Uno de los lados sin datos")
-        return False  # ← False
-    
-    df_yes = df_yes.set_index("timestamp")
-    df_no = df_no.set_index("timestamp")
-    df = pd.concat([df_yes.add_suffix("_yes"), df_no.add_suffix("_no")], axis=1)
-    df = df.dropna(thresh=2)
-    
+        return {"status": EMPTY, "reason": "Uno de los lados sin datos"}
+
+    # Formato canónico (timestamp, price_yes, price_no) alineado as-of
+    df = align_legs(df_yes, df_no)
+
     if len(df) < 20:  # Umbral razonable
-        print(f"Pocos datos combinados: {len(df)} filas")
-        return False  # ← False
-    
-    filename = f"{OUTPUT_DIR}/{slug}_15min.csv"
-    df.to_csv(filename)
-    print(f"¡GUARDADO! {len(df)} filas en {filename} ✓")
-    return True  # ← ¡ÉXITO! Devuelve True
+        return {"status": EMPTY, "reason": f"Pocos datos combinados: {len(df)} filas"}
+
+    filename = f"{output_dir}/{slug}_15min.csv"
+    tmp = filename + ".tmp"
+    df.to_csv(tmp, index=False)
+    os.replace(tmp, filename)
+    print(f"¡GUARDADO! {question[:60]} → {len(df)} filas en {filename} ✓")
+    return {"status": DONE, "rows": len(df), "file": filename}
+
+
+# -------------------------
+# Descarga masiva
+# -------------------------
+def bulk_download(
+    markets: List[dict],
+    concurrency: int = 8,
+    client: Optional[HttpClient] = None,
+    output_dir: str = OUTPUT_DIR,
+    max_markets: Optional[int] = None,
+    retry_failed: bool = True,
+) -> Dict[str, dict]:
+    """
+    Descarga en paralelo (como mucho `concurrency` mercados a la vez) los
+    mercados que el manifest no da por terminados. El manifest se guarda tras
+    cada mercado, así que una ejecución interrumpida continúa donde se quedó.
+    """
+    client = client or get_client()
+    manifest = load_manifest(output_dir)
+
+    pending = []
+    for market in markets:
+        entry = manifest.get(market_slug(market))
+        if entry and entry["status"] in FINISHED:
+            continue
+        if entry and entry["status"] == FAILED and not retry_failed:
+            continue
+        pending.append(market)
+    skipped = len(markets) - len(pending)
+    if max_markets is not None:
+        pending = pending[:max_markets]
+
+    print(f"{len(markets)} mercados, {skipped} ya descargados, {len(pending)} pendientes")
+    if not pending:
+        return manifest
+
+    counts = {DONE: 0, EMPTY: 0, FAILED: 0}
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = {
+            pool.submit(download_market_history, market, client, output_dir): market
+            for market in pending
+        }
+        for i, future in enumerate(as_completed(futures), 1):
+            slug = market_slug(futures[future])
+            try:
+                entry = future.result()
+            except Exception as e:
+                entry = {"status": FAILED, "reason": str(e)}
+            previous = manifest.get(slug, {})
+            entry["attempts"] = previous.get("attempts", 0) + 1
+            entry["updated"] = datetime.now().isoformat(timespec="seconds")
+            manifest[slug] = entry
+            counts[entry["status"]] += 1
+            save_manifest(manifest, output_dir)
+
+            if i % 25 == 0 or i == len(pending):
+                rate = i / max(time.time() - start, 1e-9)
+                print(f"[{i}/{len(pending)}] ok={counts[DONE]} vacíos={counts[EMPTY]} "
+                      f"fallidos={counts[FAILED]} ({rate:.1f} mercados/s)")
+
+    return manifest
+
 
 def main():
-    markets = get_up_down_markets(max_pages=20)  # Aumenta si quieres más
-    
-    successful = 0
-    for i, market in enumerate(markets):
-        print(f"\n--- Procesando {i+1}/{len(markets)} ---")
-        if download_market_history(market):  # Ahora sí funciona porque devuelve True/False
-            successful += 1
-        if successful >= 40:
-            print("¡Suficientes mercados descargados!")
-            break
-        time.sleep(1)
+    parser = argparse.ArgumentParser(description="Descarga masiva de históricos BTC Up/Down")
+    parser.add_argument("--pages", type=int, default=20, help="Máximo de páginas de Gamma por refresco")
+    parser.add_argument("--days", type=float, default=None, help="Solo mercados de los últimos N días")
+    parser.add_argument("--offline", action="store_true", help="No refrescar el catálogo")
+    parser.add_argument("--concurrency", type=int, default=8, help="Mercados en paralelo")
+    parser.add_argument("--rate", type=float, default=10.0, help="Peticiones por segundo")
+    parser.add_argument("--max-markets", type=int, default=None, help="Límite de mercados nuevos")
+    parser.add_argument("--skip-failed", action="store_true", help="No reintentar los fallidos")
+    args = parser.parse_args()
+
+    client = HttpClient(rate=args.rate, pool_size=args.concurrency)
+    try:
+        ts_from = time.time() - args.days * 86400 if args.days else None
+        markets = get_up_down_markets(
+            client=client, max_pages=args.pages, ts_from=ts_from, refresh=not args.offline
+        )
+        bulk_download(
+            markets,
+            concurrency=args.concurrency,
+            client=client,
+            max_markets=args.max_markets,
+            retry_failed=not args.skip_failed,
+        )
+    finally:
+        client.close()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,213 @@
+# latency.py - Histogramas de latencia por etapa (estilo HDR) y exportación periódica
+import asyncio
+import json
+import logging
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+logger = logging.getLogger("PolyPolyBot")
+
+LATENCY_FILE = Path("latency_stats.jsonl")
+
+# Etapas del camino de un tick (todas en microsegundos)
+EXCHANGE_TO_RECV = "exchange_to_recv"      # timestamp del mensaje -> recepción (reloj de pared)
+RECV_TO_BUFFER = "recv_to_buffer"          # recepción -> tick publicado en data_buffer
+BUFFER_TO_DECISION = "buffer_to_decision"  # tick publicado -> el bot lo evalúa
+DECISION = "decision"                      # duración de decide_and_execute
+RECV_TO_ORDER = "recv_to_order"            # recepción -> orden emitida
+
+STAGES = (EXCHANGE_TO_RECV, RECV_TO_BUFFER, BUFFER_TO_DECISION, DECISION, RECV_TO_ORDER)
+
+PERCENTILES = (50.0, 90.0, 99.0, 99.9)
+
+
+class LatencyHistogram:
+    """
+    Histograma log-lineal tipo HdrHistogram sobre enteros (µs).
+    Los valores < 2**sub_bits se guardan exactos; por encima cada potencia de 2
+    se divide en 2**(sub_bits-1) cubetas, así que el error relativo es < 2**(1-sub_bits)
+    (~1.6% con sub_bits=7) con memoria fija y record() O(1).
+    """
+
+    __slots__ = ("sub_bits", "_sub_count", "_half", "counts", "count", "total", "min", "max")
+
+    def __init__(self, sub_bits: int = 7, max_value_bits: int = 40):
+        self.sub_bits = sub_bits
+        self._sub_count = 1 << sub_bits
+        self._half = self._sub_count >> 1
+        n_buckets = self._sub_count + (max_value_bits - sub_bits + 1) * self._half
+        self.counts: List[int] = [0] * n_buckets
+        self.count = 0
+        self.total = 0
+        self.min: Optional[int] = None
+        self.max = 0
+
+    def _index(self, value: int) -> int:
+        if value < self._sub_count:
+            return value
+        shift = value.bit_length() - self.sub_bits
+        return self._sub_count + (shift - 1) * self._half + (value >> shift) - self._half
+
+    def _value(self, index: int) -> int:
+        """Límite inferior de la cubeta."""
+        if index < self._sub_count:
+            return index
+        shift, offset = divmod(index - self._sub_count, self._half)
+        return (offset + self._half) << (shift + 1)
+
+    def record(self, value: float) -> None:
+        value = int(value) if value > 0 else 0
+        index = self._index(value)
+        if index >= len(self.counts):
+            index = len(self.counts) - 1
+        self.counts[index] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+        if self.min is None or value < self.min:
+            self.min = value
+
+    def percentile(self, p: float) -> int:
+        if self.count == 0:
+            return 0
+        target = max(1, int(round(self.count * p / 100.0)))
+        seen = 0
+        for index, n in enumerate(self.counts):
+            if n:
+                seen += n
+                if seen >= target:
+                    return min(self._value(index), self.max)
+        return self.max
+
+    def merge(self, other: "LatencyHistogram") -> None:
+        for index, n in enumerate(other.counts):
+            if n:
+                self.counts[index] += n
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+
+    def reset(self) -> None:
+        self.counts = [0] * len(self.counts)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def summary(self) -> dict:
+        out = {
+            "count": self.count,
+            "mean_us": round(self.total / self.count, 1) if self.count else 0.0,
+            "min_us": self.min or 0,
+            "max_us": self.max,
+        }
+        for p in PERCENTILES:
+            out[f"p{p:g}_us"] = self.percentile(p)
+        return out
+
+
+class LatencyRecorder:
+    """Un histograma por etapa. Desactivado, record() no hace nada."""
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.histograms: Dict[str, LatencyHistogram] = {stage: LatencyHistogram() for stage in STAGES}
+        self.since = time.time()
+
+    def record(self, stage: str, value_us: float) -> None:
+        if not self.enabled:
+            return
+        hist = self.histograms.get(stage)
+        if hist is None:
+            hist = self.histograms[stage] = LatencyHistogram()
+        hist.record(value_us)
+
+    def record_ns(self, stage: str, start_ns: Optional[int], end_ns: int) -> None:
+        """Intervalo entre dos lecturas de time.perf_counter_ns()."""
+        if self.enabled and start_ns is not None:
+            self.record(stage, (end_ns - start_ns) / 1000)
+
+    def snapshot(self, reset: bool = False) -> dict:
+        now = time.time()
+        out = {
+            "ts": now,
+            "window_s": round(now - self.since, 3),
+            "stages": {stage: hist.summary() for stage, hist in self.histograms.items()},
+        }
+        if reset:
+            for hist in self.histograms.values():
+                hist.reset()
+            self.since = now
+        return out
+
+
+# Registro del proceso (lo usan polymarket_client, data_buffer y poly_poly)
+LATENCY = LatencyRecorder()
+
+
+def now_ns() -> int:
+    return time.perf_counter_ns()
+
+
+# -------------------------
+# Exportación
+# -------------------------
+async def export_loop(
+    interval: float = 60.0,
+    path: Optional[Union[str, Path]] = LATENCY_FILE,
+    http_port: Optional[int] = None,
+    recorder: LatencyRecorder = LATENCY,
+) -> None:
+    """
+    Cada `interval` segundos añade una línea JSON con los percentiles de la
+    ventana a `path` y reinicia los histogramas. Con http_port, además sirve el
+    último resumen en http://127.0.0.1:{http_port}/ (GET).
+    """
+    latest = {"stages": {}}
+
+    async def handle(reader, writer):
+        try:
+            await reader.readuntil(b"\r\n\r\n")
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass
+        body = json.dumps(latest).encode("utf-8")
+        writer.write(
+            b"HTTP/1.0 200 OK\r\nContent-Type: application/json\r\n"
+            + f"Content-Length: {len(body)}\r\n\r\n".encode("ascii")
+            + body
+        )
+        await writer.drain()
+        writer.close()
+
+    server = None
+    if http_port is not None:
+        server = await asyncio.start_server(handle, "127.0.0.1", http_port)
+
+    try:
+        while True:
+            await asyncio.sleep(interval)
+            latest = recorder.snapshot(reset=True)
+            if path is not None:
+                try:
+                    # Una línea pequeña por intervalo: no compensa un hilo escritor
+                    with open(path, "a", encoding="utf-8") as f:
+                        f.write(json.dumps(latest) + "\n")
+                except OSError as e:
+                    logger.error(f"No se pudieron exportar las latencias: {e}")
+            stages = latest["stages"]
+            order = stages.get(RECV_TO_ORDER, {})
+            logger.info(
+                f"Latencias ({latest['window_s']:.0f}s): "
+                + " | ".join(
+                    f"{stage} p50={s['p50_us']}µs p99={s['p99_us']}µs"
+                    for stage, s in stages.items() if s["count"]
+                )
+                + (f" | órdenes={order.get('count', 0)}" if order else "")
+            )
+    finally:
+        if server is not None:
+            server.close()
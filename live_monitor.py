@@ -1,13 +1,21 @@
 # live_polling_monitor.py - Polling estable + detector automático + cambio cada 15min
+import argparse
+import asyncio
 import time
 import csv
 from datetime import datetime
 import os
+from typing import Dict, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
 from py_clob_client.client import ClobClient
 from market_detector import get_active_15min_market
 
+CLOB_URL = "https://clob.polymarket.com"
+
 # Cliente read-only (no necesita key)
-clob = ClobClient("https://clob.polymarket.com")
+clob = ClobClient(CLOB_URL)
 
 OUTPUT_DIR = "live_data_polling"
 os.makedirs(OUTPUT_DIR, exist_ok=True)
@@ -64,6 +72,167 @@ def monitor_market(market):
     
     print(f"\nMercado terminado. CSV completo: {filename}")
 
+# -------------------------
+# Polling asíncrono (YES/NO simultáneos, cadencia fija)
+# -------------------------
+class UnexpectedMidpoints(ValueError):
+    """/midpoints respondió JSON válido pero con otra forma: no es el endpoint esperado."""
+
+
+class MidpointPoller:
+    """
+    Consulta midpoints sobre una sesión HTTP con conexiones keep-alive.
+    Usa POST /midpoints (ambos tokens en una sola petición). Si el endpoint no
+    existe (404/405 o JSON válido con otra forma) pasa para siempre a dos GET
+    /midpoint lanzados a la vez; ante errores transitorios (timeout, conexión,
+    5xx, cuerpo que no es JSON) solo esa consulta va por peticiones individuales.
+    """
+
+    PERMANENT_STATUS = (404, 405)
+
+    def __init__(self, base_url: str = CLOB_URL, timeout: float = 2.0, batched: bool = True):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.batched = batched
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=4)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def close(self) -> None:
+        self.session.close()
+
+    def _get_midpoint(self, token_id: str) -> float:
+        r = self.session.get(
+            f"{self.base_url}/midpoint", params={"token_id": token_id}, timeout=self.timeout
+        )
+        r.raise_for_status()
+        data = r.json()
+        return float(data.get("mid", "0")) if isinstance(data, dict) else 0.0
+
+    def _get_midpoints(self, token_ids: List[str]) -> Dict[str, float]:
+        r = self.session.post(
+            f"{self.base_url}/midpoints",
+            json=[{"token_id": t} for t in token_ids],
+            timeout=self.timeout,
+        )
+        r.raise_for_status()
+        data = r.json()
+        try:
+            return {t: float(data[t]) for t in token_ids}
+        except (KeyError, TypeError, ValueError):
+            raise UnexpectedMidpoints(f"Respuesta inesperada de /midpoints: {data}") from None
+
+    async def fetch(self, yes_token: str, no_token: str) -> Tuple[float, float]:
+        if self.batched:
+            try:
+                mids = await asyncio.to_thread(self._get_midpoints, [yes_token, no_token])
+                return mids[yes_token], mids[no_token]
+            except requests.HTTPError as e:
+                status = e.response.status_code if e.response is not None else None
+                if status in self.PERMANENT_STATUS:
+                    print(f"/midpoints no disponible ({status}), usando peticiones individuales")
+                    self.batched = False
+            except UnexpectedMidpoints as e:
+                print(f"/midpoints no disponible ({e}), usando peticiones individuales")
+                self.batched = False
+            except (requests.RequestException, ValueError):
+                # Transitorio (incluye un 200 truncado o HTML de un proxy): esta consulta
+                # va por GET y la siguiente vuelve a intentar el lote
+                pass
+
+        price_yes, price_no = await asyncio.gather(
+            asyncio.to_thread(self._get_midpoint, yes_token),
+            asyncio.to_thread(self._get_midpoint, no_token),
+        )
+        return price_yes, price_no
+
+
+async def monitor_market_async(
+    market, interval: float = 0.5, poller: Optional[MidpointPoller] = None
+):
+    """
+    Igual que monitor_market pero con una muestra cada `interval` segundos exactos:
+    ambos lados se piden a la vez y llevan el mismo timestamp (instante de captura).
+    Si una consulta tarda más que el intervalo, se saltan los instantes perdidos.
+    """
+    yes_token = market["yes_token"]
+    no_token = market["no_token"]
+    slug = market["slug"]
+    own_poller = poller is None
+    poller = poller or MidpointPoller()
+
+    filename = f"{OUTPUT_DIR}/{slug}_polling.csv"
+    with open(filename, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["timestamp", "price_yes", "price_no", "sum_prices"])
+
+        print(f"\n>>> INICIANDO MONITOREO DE {slug}")
+        print(f"    Archivo: {filename}")
+        print(f"    Muestra cada {interval}s (solo imprime cambios)\n")
+
+        last_yes = None
+        last_no = None
+        end_time = market["end_ts"] + 60  # Margen
+        next_tick = time.monotonic()
+        last_flush = next_tick
+
+        try:
+            while time.time() < end_time:
+                ts = datetime.now().isoformat()
+                try:
+                    price_yes, price_no = await poller.fetch(yes_token, no_token)
+                except Exception as e:
+                    print(f"Error consulta precios: {e}")
+                else:
+                    sum_p = price_yes + price_no
+                    changed = (last_yes is None or abs(price_yes - last_yes) > 1e-6 or
+                               last_no is None or abs(price_no - last_no) > 1e-6)
+                    if changed:
+                        print(f"{ts} | YES: {price_yes:.5f} | NO: {price_no:.5f} | Sum: {sum_p:.5f}")
+                        last_yes = price_yes
+                        last_no = price_no
+                    writer.writerow([ts, price_yes, price_no, sum_p])
+
+                now = time.monotonic()
+                if now - last_flush >= 1.0:
+                    f.flush()
+                    last_flush = now
+
+                # Cadencia fija: el siguiente instante no depende de la latencia
+                next_tick += interval
+                if next_tick < now:
+                    next_tick += ((now - next_tick) // interval + 1) * interval
+                await asyncio.sleep(next_tick - now)
+        finally:
+            if own_poller:
+                poller.close()
+
+    print(f"\nMercado terminado. CSV completo: {filename}")
+
+
+async def main_async(interval: float = 0.5):
+    print("MONITOR POLLING ASÍNCRONO BTC Up/Down 15min")
+    print("Cambia automáticamente cada 15 minutos\n")
+
+    poller = MidpointPoller()
+    try:
+        while True:
+            market = await asyncio.to_thread(get_active_15min_market)
+            if market:
+                await monitor_market_async(market, interval=interval, poller=poller)
+                next_slot = market["end_ts"] + 60
+                sleep_time = next_slot - time.time()
+                if sleep_time > 0:
+                    print(f"\nEsperando próximo mercado ({sleep_time:.0f}s)...")
+                    await asyncio.sleep(sleep_time)
+            else:
+                print("No mercado activo. Reintentando en 30s...")
+                await asyncio.sleep(30)
+    finally:
+        poller.close()
+
+
 def main():
     print("MONITOR POLLING AUTOMÁTICO BTC Up/Down 15min")
     print("Cambia automáticamente cada 15 minutos\n")
@@ -83,4 +252,15 @@ def main():
             time.sleep(30)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Monitor de precios BTC Up/Down 15min")
+    parser.add_argument("--sync", action="store_true", help="Polling secuencial clásico")
+    parser.add_argument("--interval", type=float, default=0.5, help="Segundos entre muestras")
+    args = parser.parse_args()
+
+    try:
+        if args.sync:
+            main()
+        else:
+            asyncio.run(main_async(args.interval))
+    except KeyboardInterrupt:
+        print("\nDetenido por usuario")
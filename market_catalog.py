@@ -0,0 +1,389 @@
+# market_catalog.py - Catálogo local de mercados up/down de Gamma, indexado por slot y refrescado de forma incremental
+import argparse
+import bisect
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+import requests
+
+GAMMA_URL = "https://gamma-api.polymarket.com/markets"
+CATALOG_FILE = Path("historical_data") / "market_catalog.jsonl"
+
+BITCOIN_TAG = 235
+SLOT_SECONDS = 900
+STALE_OPEN = 2 * 86400  # un mercado "abierto" que terminó hace más de esto no frena el refresco
+
+GetJson = Callable[[str, dict], Optional[list]]
+
+
+# -------------------------
+# Conversión desde Gamma
+# -------------------------
+def _parse_date(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return None
+
+
+def _json_list(value) -> list:
+    if isinstance(value, list):
+        return value
+    try:
+        return json.loads(value) if value else []
+    except ValueError:
+        return []
+
+
+def market_resolution(m: dict) -> Optional[str]:
+    """
+    "YES"/"NO" según outcomePrices de un mercado cerrado ("1"/"0" tras la
+    resolución). None si sigue abierto o los precios no son concluyentes.
+    """
+    if not m.get("closed"):
+        return None
+    prices = _json_list(m.get("outcomePrices"))
+    if len(prices) != 2:
+        return None
+    try:
+        yes, no = float(prices[0]), float(prices[1])
+    except (TypeError, ValueError):
+        return None
+    if yes >= 0.99 and no <= 0.01:
+        return "YES"
+    if no >= 0.99 and yes <= 0.01:
+        return "NO"
+    return None
+
+
+def entry_from_gamma(m: dict) -> Optional[dict]:
+    """Entrada del catálogo a partir del dict de Gamma (None si no es un mercado binario válido)."""
+    slug = m.get("slug")
+    tokens = _json_list(m.get("clobTokenIds"))
+    if not slug or len(tokens) != 2:
+        return None
+
+    end_ts = _parse_date(m.get("endDate"))
+    suffix = slug.rsplit("-", 1)[-1]
+    if suffix.isdigit():
+        start_ts = int(suffix)  # {asset}-updown-{15m|1h}-{slot_ts}
+    else:
+        start = _parse_date(m.get("eventStartTime"))
+        if start is None and end_ts is None:
+            return None
+        start_ts = int(start if start is not None else end_ts - SLOT_SECONDS)
+
+    return {
+        "slug": slug,
+        "question": m.get("question", ""),
+        "start_ts": start_ts,
+        "end_ts": int(end_ts) if end_ts is not None else start_ts + SLOT_SECONDS,
+        "yes_token": tokens[0],
+        "no_token": tokens[1],
+        "closed": bool(m.get("closed")),
+        "resolution": market_resolution(m),
+        "listed_ts": _parse_date(m.get("startDate")),
+    }
+
+
+def slug_from_filename(name: str) -> str:
+    """btc-updown-15m-1765393200_polling.csv -> btc-updown-15m-1765393200"""
+    stem = os.path.splitext(os.path.basename(name))[0]
+    for suffix in ("_polling", "_15min"):
+        if stem.endswith(suffix):
+            return stem[: -len(suffix)]
+    return stem
+
+
+def _requests_get_json(session: requests.Session) -> GetJson:
+    def get_json(url: str, params: dict):
+        try:
+            response = session.get(url, params=params, timeout=15)
+        except requests.RequestException as e:
+            print(f"Error de red en {url}: {e}")
+            return None
+        if response.status_code != 200:
+            print(f"Error Gamma API: {response.status_code} {response.text[:200]}")
+            return None
+        return response.json()
+
+    return get_json
+
+
+# -------------------------
+# Catálogo
+# -------------------------
+class MarketCatalog:
+    """
+    Catálogo persistente slug -> mercado (JSON Lines append-only: la última
+    línea de un slug manda) con un índice ordenado por inicio de slot.
+
+    refresh() solo pide a Gamma lo publicado desde el startDate más reciente
+    conocido (o desde el mercado abierto más antiguo, para recoger su cierre y
+    su resolución), así que tras la primera carga cuesta una o dos páginas.
+    """
+
+    def __init__(self, path: Optional[Union[str, Path]] = CATALOG_FILE):
+        self.path = Path(path) if path is not None else None
+        self.entries: Dict[str, dict] = {}
+        self._index: List[Tuple[int, str]] = []  # (start_ts, slug) ordenado
+        self._lock = threading.Lock()
+        if self.path is not None and self.path.exists():
+            self._load()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    # ------------------- Persistencia ------------------- #
+    def _load(self) -> None:
+        lines = 0
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # última línea cortada
+                lines += 1
+                self.entries[entry["slug"]] = entry
+        self._index = sorted((e["start_ts"], slug) for slug, e in self.entries.items())
+        if lines > 2 * len(self.entries) + 1000:
+            self.compact()
+
+    def _append(self, entries: List[dict]) -> None:
+        if self.path is None or not entries:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(e) + "\n" for e in entries))
+
+    def compact(self) -> None:
+        """Reescribe el fichero con una línea por mercado (escritura atómica)."""
+        if self.path is None:
+            return
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                for _, slug in self._index:
+                    f.write(json.dumps(self.entries[slug]) + "\n")
+            os.replace(tmp, self.path)
+
+    # ------------------- Altas ------------------- #
+    def _upsert(self, entry: dict) -> bool:
+        """True si la entrada es nueva o cambió (hay que persistirla)."""
+        slug = entry["slug"]
+        old = self.entries.get(slug)
+        if old == entry:
+            return False
+        if old is not None:
+            if entry.get("listed_ts") is None:
+                entry["listed_ts"] = old.get("listed_ts")
+            if old["start_ts"] != entry["start_ts"]:
+                self._index.remove((old["start_ts"], slug))
+                bisect.insort(self._index, (entry["start_ts"], slug))
+        else:
+            bisect.insort(self._index, (entry["start_ts"], slug))
+        self.entries[slug] = entry
+        return True
+
+    def add(self, entries: List[dict]) -> int:
+        with self._lock:
+            changed = [e for e in entries if self._upsert(e)]
+            self._append(changed)
+        return len(changed)
+
+    def remember(self, market: dict) -> None:
+        """Añade un mercado resuelto en vivo (dict de market_detector) si aún no está."""
+        if market["slug"] in self.entries:
+            return
+        self.add([{
+            "slug": market["slug"],
+            "question": market.get("question", ""),
+            "start_ts": market["start_ts"],
+            "end_ts": market["end_ts"],
+            "yes_token": market["yes_token"],
+            "no_token": market["no_token"],
+            "closed": False,
+            "resolution": None,
+            "listed_ts": None,
+        }])
+
+    # ------------------- Consultas ------------------- #
+    def lookup(self, slug: str) -> Optional[dict]:
+        return self.entries.get(slug)
+
+    def range(
+        self,
+        ts_from: Optional[float] = None,
+        ts_to: Optional[float] = None,
+        prefix: Optional[str] = None,
+        closed: Optional[bool] = None,
+    ) -> List[dict]:
+        """
+        Mercados con ts_from <= start_ts < ts_to, ordenados por slot.
+        prefix filtra por slug (p.ej. "btc-updown-15m-"); closed por estado.
+        """
+        with self._lock:
+            lo = 0 if ts_from is None else bisect.bisect_left(self._index, (int(ts_from), ""))
+            hi = len(self._index) if ts_to is None else bisect.bisect_left(self._index, (int(ts_to), ""))
+            slugs = [slug for _, slug in self._index[lo:hi]]
+        out = []
+        for slug in slugs:
+            if prefix is not None and not slug.startswith(prefix):
+                continue
+            entry = self.entries[slug]
+            if closed is not None and entry["closed"] != closed:
+                continue
+            out.append(entry)
+        return out
+
+    def watermark(self, now: Optional[float] = None) -> Optional[float]:
+        """startDate desde el que hay que volver a pedir a Gamma (None = catálogo vacío)."""
+        now = time.time() if now is None else now
+        listed = [e["listed_ts"] for e in self.entries.values() if e.get("listed_ts") is not None]
+        if not listed:
+            return None
+        open_listed = [
+            e["listed_ts"] for e in self.entries.values()
+            if not e["closed"] and e.get("listed_ts") is not None and e["end_ts"] > now - STALE_OPEN
+        ]
+        return min(open_listed) if open_listed else max(listed)
+
+    # ------------------- Refresco ------------------- #
+    def refresh(
+        self,
+        get_json: Optional[GetJson] = None,
+        tag_id: Optional[int] = BITCOIN_TAG,
+        limit: int = 500,
+        max_pages: int = 20,
+        match: str = "up or down",
+    ) -> int:
+        """
+        Pagina Gamma por startDate descendente hasta pasar la marca de agua.
+        get_json(url, params) permite reutilizar un cliente con rate limit/reintentos.
+        Devuelve cuántas entradas se añadieron o cambiaron.
+        """
+        session = None
+        if get_json is None:
+            session = requests.Session()
+            get_json = _requests_get_json(session)
+
+        since = self.watermark()
+        changed = 0
+        try:
+            for page in range(max_pages):
+                params = {
+                    "ascending": "false",
+                    "order": "startDate",
+                    "limit": limit,
+                    "offset": page * limit,
+                }
+                if tag_id is not None:
+                    params["tag_id"] = tag_id
+                markets_page = get_json(GAMMA_URL, params)
+                if not markets_page:
+                    break
+
+                entries = []
+                for m in markets_page:
+                    if match and match not in m.get("question", "").lower():
+                        continue
+                    entry = entry_from_gamma(m)
+                    if entry is not None:
+                        entries.append(entry)
+                changed += self.add(entries)
+
+                oldest = min(
+                    (t for t in (_parse_date(m.get("startDate")) for m in markets_page) if t is not None),
+                    default=None,
+                )
+                if since is not None and oldest is not None and oldest < since:
+                    break
+                if len(markets_page) < limit:
+                    break
+        finally:
+            if session is not None:
+                session.close()
+
+        print(f"Catálogo: {changed} mercados nuevos/actualizados, {len(self)} en total")
+        return changed
+
+    # ------------------- Resoluciones ------------------- #
+    def fetch_slugs(self, slugs: List[str], get_json: Optional[GetJson] = None, batch: int = 50) -> int:
+        """Pide a Gamma los mercados cerrados de `slugs` (en lotes) y los añade al catálogo."""
+        session = None
+        if get_json is None:
+            session = requests.Session()
+            get_json = _requests_get_json(session)
+        changed = 0
+        try:
+            for i in range(0, len(slugs), batch):
+                chunk = slugs[i:i + batch]
+                markets = get_json(GAMMA_URL, {"slug": chunk, "closed": "true", "limit": len(chunk)})
+                if markets is None:
+                    break
+                entries = [e for e in (entry_from_gamma(m) for m in markets) if e is not None]
+                changed += self.add(entries)
+        finally:
+            if session is not None:
+                session.close()
+        return changed
+
+    def resolutions(
+        self,
+        slugs: List[str],
+        get_json: Optional[GetJson] = None,
+        fetch_missing: bool = True,
+        now: Optional[float] = None,
+    ) -> Dict[str, Optional[str]]:
+        """
+        slug -> "YES"/"NO"/None. Solo se consulta Gamma por los slugs que no están
+        en el catálogo o que, ya terminados, seguían sin resolución (abiertos o
+        cerrados con precios aún no concluyentes); lo resuelto queda guardado
+        para las siguientes ejecuciones.
+        """
+        now = time.time() if now is None else now
+        if fetch_missing:
+            missing = [
+                slug for slug in slugs
+                if slug not in self.entries
+                or (self.entries[slug]["resolution"] is None and self.entries[slug]["end_ts"] < now)
+            ]
+            if missing:
+                self.fetch_slugs(missing, get_json)
+        return {slug: (self.entries.get(slug) or {}).get("resolution") for slug in slugs}
+
+
+# -------------------------
+# Main: refresco explícito del catálogo
+# -------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Refresca el catálogo local de mercados up/down")
+    parser.add_argument("--pages", type=int, default=20, help="Máximo de páginas de Gamma")
+    parser.add_argument("--no-refresh", action="store_true", help="No paginar Gamma")
+    parser.add_argument("--resolve", nargs="*", default=[], metavar="DIR",
+                        help="Directorios de CSV cuyos mercados hay que resolver")
+    args = parser.parse_args()
+
+    catalog = MarketCatalog()
+    if not args.no_refresh:
+        catalog.refresh(max_pages=args.pages)
+    if args.resolve:
+        slugs = sorted({
+            slug_from_filename(f)
+            for directory in args.resolve
+            for f in os.listdir(directory) if f.endswith(".csv")
+        })
+        resolutions = catalog.resolutions(slugs, fetch_missing=True)
+        known = sum(r is not None for r in resolutions.values())
+        print(f"Resoluciones: {known}/{len(slugs)} mercados")
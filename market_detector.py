@@ -1,24 +1,60 @@
+import asyncio
 import requests
 import json
+import threading
 import time
 from datetime import datetime
+from typing import Dict, NamedTuple, Optional, Sequence, Tuple
+
+from market_catalog import MarketCatalog
 
 GAMMA_URL = "https://gamma-api.polymarket.com/markets"
 
+SLOT_SECONDS = 900  # 15 minutos
+
+
 def get_current_15min_slot_timestamp():
     """Calcula el timestamp del slot actual de 15 minutos (redondea hacia abajo)"""
     now = int(time.time())
-    slot_duration = 900  # 15 minutos en segundos
+    slot_duration = SLOT_SECONDS
     current_slot = (now // slot_duration) * slot_duration
     return current_slot
 
-def get_active_15min_market():
+
+class MarketSeries(NamedTuple):
+    """Serie de mercados up/down de duración fija: {asset}-updown-{15m|1h|...}-{slot_ts}."""
+
+    asset: str = "btc"
+    slot_seconds: int = SLOT_SECONDS
+
+    @property
+    def label(self) -> str:
+        minutes = self.slot_seconds // 60
+        return f"{minutes}m" if minutes < 60 else f"{minutes // 60}h"
+
+    def slug(self, slot_ts: int) -> str:
+        return f"{self.asset}-updown-{self.label}-{slot_ts}"
+
+    def current_slot(self, now: Optional[float] = None) -> int:
+        now = int(time.time() if now is None else now)
+        return (now // self.slot_seconds) * self.slot_seconds
+
+
+BTC_15M = MarketSeries("btc", SLOT_SECONDS)
+
+
+def slot_slug(slot_ts: int, series: MarketSeries = BTC_15M) -> str:
+    return series.slug(slot_ts)
+
+
+def fetch_15min_market(
+    slot_ts: int, session=None, verbose: bool = True, series: MarketSeries = BTC_15M
+) -> Optional[dict]:
     """
-    Busca el mercado BTC Up/Down 15min activo actual.
-    Calcula el timestamp esperado y busca directamente ese slug.
+    Consulta a Gamma el mercado del slot `slot_ts` (el slug es determinista).
+    Devuelve el dict del mercado o None si no existe todavía / hay error.
     """
-    current_slot_ts = get_current_15min_slot_timestamp()
-    expected_slug = f"btc-updown-15m-{current_slot_ts}"
+    expected_slug = series.slug(slot_ts)
 
     # Buscar directamente por slug
     params = {
@@ -26,15 +62,17 @@ def get_active_15min_market():
         "active": "true",
         "closed": "false"
     }
+    http = session or requests
     try:
-        response = requests.get(GAMMA_URL, params=params, timeout=10)
+        response = http.get(GAMMA_URL, params=params, timeout=10)
         if response.status_code != 200:
             print(f"Error Gamma API: {response.status_code} {response.text}")
             return None
 
         markets = response.json()
         if not markets:
-            print(f"No se encontró mercado con slug {expected_slug}")
+            if verbose:
+                print(f"No se encontró mercado con slug {expected_slug}")
             return None
 
         m = markets[0]  # El primero debería ser el correcto
@@ -48,29 +86,179 @@ def get_active_15min_market():
             print(f"Tokens inesperados: {len(tokens)}")
             return None
 
-        print(f"\nMERCADO ACTIVO ENCONTRADO:")
-        print(f"  Pregunta: {m['question']}")
-        print(f"  Slug: {m['slug']}")
-        print(f"  Inicio: {datetime.fromtimestamp(current_slot_ts)}")
-        print(f"  Fin estimado: {datetime.fromtimestamp(current_slot_ts + 900)}")
-
         return {
             "slug": m["slug"],
             "question": m["question"],
             "yes_token": tokens[0],
             "no_token": tokens[1],
-            "start_ts": current_slot_ts,
-            "end_ts": current_slot_ts + 900
+            "start_ts": slot_ts,
+            "end_ts": slot_ts + series.slot_seconds,
+            "series": series,
         }
 
     except Exception as e:
-        print(f"Error buscando mercado activo: {e}")
+        print(f"Error buscando mercado {expected_slug}: {e}")
         return None
 
+
+def market_from_entry(entry: dict, series: MarketSeries = BTC_15M) -> dict:
+    """Entrada de MarketCatalog -> dict de mercado como el de fetch_15min_market."""
+    return {
+        "slug": entry["slug"],
+        "question": entry["question"],
+        "yes_token": entry["yes_token"],
+        "no_token": entry["no_token"],
+        "start_ts": entry["start_ts"],
+        "end_ts": entry["start_ts"] + series.slot_seconds,
+        "series": series,
+    }
+
+
+def _print_market(market: dict) -> None:
+    print(f"\nMERCADO ACTIVO ENCONTRADO:")
+    print(f"  Pregunta: {market['question']}")
+    print(f"  Slug: {market['slug']}")
+    print(f"  Inicio: {datetime.fromtimestamp(market['start_ts'])}")
+    print(f"  Fin estimado: {datetime.fromtimestamp(market['end_ts'])}")
+
+
+# -------------------------
+# Resolver con caché y prefetch
+# -------------------------
+class MarketResolver:
+    """
+    Caché slug -> mercado con TTL (cualquier MarketSeries).
+
+    Los token ids de un slot no cambian, así que un mercado encontrado vale
+    hasta que termina su slot (+ ttl); un "no encontrado" solo se recuerda
+    miss_ttl segundos para volver a preguntar pronto. prefetch_loop() resuelve
+    los próximos slots antes de la frontera, de modo que el cambio de mercado
+    a las :00/:15/:30/:45 sale de la caché sin tocar la red.
+
+    Con un MarketCatalog, los slots ya catalogados no consultan Gamma y los
+    que se resuelven por red se añaden al catálogo.
+    """
+
+    def __init__(
+        self, ttl: float = 300.0, miss_ttl: float = 5.0, catalog: Optional[MarketCatalog] = None
+    ):
+        self.ttl = ttl
+        self.miss_ttl = miss_ttl
+        self.catalog = catalog
+        self.session = requests.Session()
+        self._cache: Dict[str, Tuple[float, Optional[dict]]] = {}
+        self._lock = threading.Lock()
+
+    def cached(self, slot_ts: int, series: MarketSeries = BTC_15M) -> Optional[dict]:
+        with self._lock:
+            entry = self._cache.get(series.slug(slot_ts))
+        if entry is None or entry[0] < time.time():
+            return None
+        return entry[1]
+
+    def resolve(
+        self, slot_ts: int, verbose: bool = True, series: MarketSeries = BTC_15M
+    ) -> Optional[dict]:
+        """Bloqueante: caché o Gamma."""
+        key = series.slug(slot_ts)
+        with self._lock:
+            entry = self._cache.get(key)
+        if entry is not None and entry[0] >= time.time():
+            return entry[1]
+
+        entry = self.catalog.lookup(key) if self.catalog is not None else None
+        if entry is not None:
+            market = market_from_entry(entry, series)
+        else:
+            market = fetch_15min_market(slot_ts, session=self.session, verbose=verbose, series=series)
+            if market and self.catalog is not None:
+                self.catalog.remember(market)
+        if market:
+            expires = slot_ts + series.slot_seconds + self.ttl
+            if verbose:
+                _print_market(market)
+        else:
+            expires = time.time() + self.miss_ttl
+        with self._lock:
+            self._cache[key] = (expires, market)
+            # Limpiar slots caducados
+            now = time.time()
+            for slug in [slug for slug, (exp, _) in self._cache.items() if exp < now]:
+                del self._cache[slug]
+        return market
+
+    async def resolve_async(
+        self, slot_ts: int, verbose: bool = True, series: MarketSeries = BTC_15M
+    ) -> Optional[dict]:
+        """Igual que resolve pero sin bloquear el event loop (la red va en un hilo)."""
+        market = self.cached(slot_ts, series)
+        if market is not None:
+            return market
+        return await asyncio.to_thread(self.resolve, slot_ts, verbose, series)
+
+    def active_market(self) -> Optional[dict]:
+        return self.resolve(get_current_15min_slot_timestamp())
+
+    async def active_market_async(self) -> Optional[dict]:
+        return await self.resolve_async(get_current_15min_slot_timestamp())
+
+    async def prefetch_loop(
+        self,
+        slots_ahead: int = 1,
+        lead: float = 120.0,
+        retry: float = 10.0,
+        series_list: Sequence[MarketSeries] = (BTC_15M,),
+    ):
+        """
+        Tarea de fondo: resuelve el slot actual y los `slots_ahead` siguientes de cada serie.
+        Los slots futuros se piden a partir de `lead` segundos antes de su inicio
+        y se reintentan cada `retry` segundos hasta que Gamma los publique.
+        """
+        while True:
+            pending = False
+            next_lead = float("inf")
+            for series in series_list:
+                now = time.time()
+                current = series.current_slot(now)
+                for k in range(slots_ahead + 1):
+                    slot_ts = current + k * series.slot_seconds
+                    if slot_ts - now > lead or self.cached(slot_ts, series) is not None:
+                        continue
+                    market = await self.resolve_async(slot_ts, verbose=False, series=series)
+                    pending = pending or market is None
+                next_lead = min(next_lead, current + series.slot_seconds - lead - time.time())
+
+            await asyncio.sleep(retry if pending else max(min(next_lead, retry * 6), 1.0))
+
+
+_default_resolver: Optional[MarketResolver] = None
+
+
+def get_resolver() -> MarketResolver:
+    """Resolver compartido del proceso (apoyado en el catálogo local)."""
+    global _default_resolver
+    if _default_resolver is None:
+        _default_resolver = MarketResolver(catalog=MarketCatalog())
+    return _default_resolver
+
+
+def get_active_15min_market():
+    """
+    Busca el mercado BTC Up/Down 15min activo actual.
+    Calcula el timestamp esperado y busca directamente ese slug (con caché).
+    """
+    return get_resolver().active_market()
+
+
+async def get_active_15min_market_async():
+    """Versión asíncrona de get_active_15min_market para usar dentro del event loop."""
+    return await get_resolver().active_market_async()
+
+
 # Prueba rápida
 if __name__ == "__main__":
     market = get_active_15min_market()
     if market:
         print("¡Listo para monitorear!")
     else:
-        print("No se encontró mercado activo en este momento.")
\ No newline at end of file
+        print("No se encontró mercado activo en este momento.")
@@ -0,0 +1,246 @@
+# multi_market.py - Varios mercados up/down a la vez: un feed, una estrategia por mercado, capital compartido
+import argparse
+import asyncio
+import atexit
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence
+
+from data_buffer import subscribe_changes, unsubscribe_changes
+from latency import export_loop
+from market_catalog import MarketCatalog
+from market_detector import SLOT_SECONDS, MarketSeries
+from poly_poly import PolyPolyBot
+from polymarket_client import LiveFeed
+from tick_recorder import TickRecorder
+
+logger = logging.getLogger("PolyPolyBot")
+
+
+# -------------------------
+# Capital compartido
+# -------------------------
+class CapitalPool:
+    """
+    Caja común de todos los mercados.
+    Cada mercado recibe una asignación al empezar y la devuelve al cerrar
+    (capital sin usar + pago garantizado de los pares cubiertos). Las acciones
+    no cubiertas quedan como posición abierta (lado, cantidad, coste) valorada
+    a coste hasta que settle() conoce la resolución: si ganó ese lado se cobra
+    1 por acción, si perdió se pierde el coste.
+    """
+
+    def __init__(self, total: float, per_market_pct: float = 0.10, min_allocation: float = 10.0):
+        self.available = float(total)
+        self.per_market_pct = per_market_pct
+        self.min_allocation = min_allocation
+        self.allocated: Dict[str, float] = {}
+        self.positions: Dict[str, dict] = {}  # slug -> {"side", "qty", "cost"}
+        self.realized = 0.0
+
+    @property
+    def pending_cost(self) -> float:
+        return sum(p["cost"] for p in self.positions.values())
+
+    @property
+    def equity(self) -> float:
+        return self.available + sum(self.allocated.values()) + self.pending_cost
+
+    def allocate(self, slug: str) -> float:
+        """Asignación para un mercado nuevo (0 si no queda caja suficiente)."""
+        amount = min(self.equity * self.per_market_pct, self.available)
+        if amount < self.min_allocation:
+            return 0.0
+        self.available -= amount
+        self.allocated[slug] = amount
+        return amount
+
+    def release(
+        self,
+        slug: str,
+        returned: float,
+        side: Optional[str] = None,
+        qty: float = 0.0,
+        cost: float = 0.0,
+    ) -> None:
+        """
+        Cierra la asignación de `slug`: `returned` vuelve a la caja y, si quedan
+        `qty` acciones sin cubrir del lado `side` ("YES"/"NO"), se guardan como
+        posición con su coste `cost` hasta la resolución.
+        """
+        allocated = self.allocated.pop(slug, 0.0)
+        self.available += returned
+        if side is not None and qty > 0:
+            self.positions[slug] = {"side": side, "qty": qty, "cost": cost}
+        else:
+            cost = 0.0
+        # La posición abierta cuenta a coste: su resultado se realiza en settle()
+        self.realized += returned + cost - allocated
+
+    def settle(self, resolutions: Dict[str, Optional[str]]) -> int:
+        """Liquida las posiciones con resolución conocida (slug -> "YES"/"NO"/None)."""
+        settled = 0
+        for slug, winner in resolutions.items():
+            position = self.positions.get(slug)
+            if position is None or winner is None:
+                continue
+            payout = position["qty"] if winner == position["side"] else 0.0
+            self.available += payout
+            self.realized += payout - position["cost"]
+            del self.positions[slug]
+            settled += 1
+        return settled
+
+
+# -------------------------
+# Runner multi-mercado
+# -------------------------
+class MultiMarketRunner:
+    """
+    Un LiveFeed para todas las series y un PolyPolyBot (estado aislado) por mercado.
+
+    El scheduler despierta con cada ráfaga de ticks y solo evalúa los mercados
+    cuyos assets cambiaron (data_buffer.ChangeSet), así que el coste por tick
+    no crece con el número de mercados seguidos. Cada `batch` mercados cede el
+    event loop para no retrasar la recepción del websocket.
+    """
+
+    def __init__(
+        self,
+        series: Sequence[MarketSeries],
+        capital: CapitalPool,
+        recorder: Optional[TickRecorder] = None,
+        strategy_params: Optional[dict] = None,
+        batch: int = 16,
+        catalog: Optional[MarketCatalog] = None,
+        settle_interval: float = 60.0,
+    ):
+        self.capital = capital
+        self.strategy_params = strategy_params or {}
+        self.batch = batch
+        self.settle_interval = settle_interval
+        self.bots: Dict[str, PolyPolyBot] = {}       # slug -> bot
+        self.asset_bot: Dict[str, PolyPolyBot] = {}  # asset_id -> bot
+        self.feed = LiveFeed(
+            on_market_change=self.start_market,
+            on_market_end=self.end_market,
+            recorder=recorder,
+            series=series,
+        )
+        # Resoluciones de las posiciones abiertas: el catálogo del resolver del feed
+        if catalog is None:
+            # Explícito: un MarketCatalog vacío es falsy (__len__) y no debe abrirse otra copia
+            catalog = self.feed.resolver.catalog
+        self.catalog = catalog if catalog is not None else MarketCatalog()
+
+    # ------------------- Ciclo de vida de mercados ------------------- #
+    def start_market(self, yes_token=None, no_token=None, slug=None) -> None:
+        if slug in self.bots:
+            return
+        amount = self.capital.allocate(slug)
+        if amount <= 0:
+            logger.info(f"{slug}: sin capital disponible, no se opera")
+            return
+
+        bot = PolyPolyBot(
+            initial_capital=amount,
+            yes_token=yes_token,
+            no_token=no_token,
+            slug=slug,
+            strategy_params=self.strategy_params,
+        )
+        self.bots[slug] = bot
+        self.asset_bot[yes_token] = bot
+        self.asset_bot[no_token] = bot
+        logger.info(f"{slug}: asignados {amount:.2f} (caja libre {self.capital.available:.2f})")
+
+    def end_market(self, market: dict) -> None:
+        bot = self.bots.pop(market["slug"], None)
+        if bot is None:
+            return
+        self.asset_bot.pop(market["yes_token"], None)
+        self.asset_bot.pop(market["no_token"], None)
+
+        s = bot.strategy
+        hedged = min(s.qty_yes, s.qty_no)
+        if s.qty_yes > s.qty_no:
+            side, qty, avg = "YES", s.qty_yes - hedged, s.avg_yes()
+        else:
+            side, qty, avg = "NO", s.qty_no - hedged, s.avg_no()
+        self.capital.release(market["slug"], s.capital + hedged, side, qty, qty * avg)
+        logger.info(
+            f"{market['slug']}: cerrado con {len(s.trades)} trades | "
+            f"caja libre {self.capital.available:.2f} | realizado {self.capital.realized:.2f}"
+        )
+
+    # ------------------- Resoluciones ------------------- #
+    async def _settle_loop(self) -> None:
+        """Cada settle_interval segundos liquida las posiciones cuyo mercado ya se resolvió."""
+        while True:
+            await asyncio.sleep(self.settle_interval)
+            slugs = list(self.capital.positions)
+            if not slugs:
+                continue
+            try:
+                resolutions = await asyncio.to_thread(self.catalog.resolutions, slugs)
+            except Exception as e:
+                logger.warning("No se pudieron consultar las resoluciones: %s", e)
+                continue
+            if self.capital.settle(resolutions):
+                logger.info(
+                    f"Posiciones liquidadas | caja libre {self.capital.available:.2f} | "
+                    f"realizado {self.capital.realized:.2f} | abiertas {len(self.capital.positions)}"
+                )
+
+    # ------------------- Scheduler ------------------- #
+    async def _schedule(self) -> None:
+        changes = subscribe_changes()
+        try:
+            while True:
+                await changes.event.wait()
+                changes.event.clear()
+
+                bots = {self.asset_bot[a] for a in changes.drain() if a in self.asset_bot}
+                for i, bot in enumerate(bots, 1):
+                    bot.step()
+                    if i % self.batch == 0:
+                        await asyncio.sleep(0)
+        finally:
+            unsubscribe_changes(changes)
+
+    async def run(self) -> None:
+        await asyncio.gather(self.feed.run(), self._schedule(), self._settle_loop(), export_loop())
+
+
+def parse_series(assets: str, minutes: str) -> List[MarketSeries]:
+    return [
+        MarketSeries(asset.strip().lower(), int(m) * 60)
+        for asset in assets.split(",") if asset.strip()
+        for m in minutes.split(",") if m.strip()
+    ]
+
+
+# -------------------------
+# Main
+# -------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bot multi-mercado up/down")
+    parser.add_argument("--assets", default="btc,eth,sol,xrp", help="Activos separados por comas")
+    parser.add_argument("--minutes", default=str(SLOT_SECONDS // 60), help="Duraciones en minutos")
+    parser.add_argument("--capital", type=float, default=1000.0)
+    parser.add_argument("--per-market", type=float, default=0.10, help="Fracción del capital por mercado")
+    parser.add_argument("--no-record", action="store_true", help="No grabar frames")
+    args = parser.parse_args()
+
+    series = parse_series(args.assets, args.minutes)
+    print(f"[{datetime.now()}] Series: {[s.slug(0).rsplit('-', 1)[0] for s in series]}")
+
+    recorder = None
+    if not args.no_record:
+        recorder = TickRecorder()
+        atexit.register(recorder.close)
+
+    runner = MultiMarketRunner(
+        series, CapitalPool(args.capital, per_market_pct=args.per_market), recorder=recorder
+    )
+    asyncio.run(runner.run())
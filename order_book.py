@@ -0,0 +1,158 @@
+# order_book.py - Order book local por asset_id (snapshots "book" + deltas "price_change")
+from bisect import bisect_left, insort
+from typing import Dict, Iterable, List, Optional, Tuple
+
+BUY = "BUY"
+SELL = "SELL"
+
+
+class BookSide:
+    """
+    Niveles de precio de un lado del libro.
+    Precios en una lista ordenada ascendente (bisect) + dict precio -> tamaño:
+    búsqueda O(log n), cambiar el tamaño de un nivel existente O(1) y mejor
+    precio O(1) (primer o último elemento). Crear o borrar un nivel desplaza la
+    lista: O(n), barato con los pocos cientos de niveles de un libro de 0.01.
+    """
+
+    __slots__ = ("_prices", "_sizes", "_descending")
+
+    def __init__(self, descending: bool):
+        self._prices: List[float] = []
+        self._sizes: Dict[float, float] = {}
+        # Bids: el mejor precio es el más alto (final de la lista)
+        self._descending = descending
+
+    def clear(self) -> None:
+        self._prices.clear()
+        self._sizes.clear()
+
+    def load(self, levels: Iterable[Tuple[float, float]]) -> None:
+        self.clear()
+        for price, size in levels:
+            if size > 0:
+                self._sizes[price] = size
+        self._prices = sorted(self._sizes)
+
+    def update(self, price: float, size: float) -> None:
+        """Fija el tamaño de un nivel; size 0 lo elimina."""
+        if size <= 0:
+            if self._sizes.pop(price, None) is not None:
+                idx = bisect_left(self._prices, price)
+                del self._prices[idx]
+            return
+        if price not in self._sizes:
+            insort(self._prices, price)
+        self._sizes[price] = size
+
+    def drop_better_than(self, price: float) -> None:
+        """Elimina los niveles con mejor precio que `price` (niveles ya cruzados/ejecutados)."""
+        if self._descending:
+            while self._prices and self._prices[-1] > price:
+                del self._sizes[self._prices.pop()]
+        else:
+            cut = bisect_left(self._prices, price)
+            for p in self._prices[:cut]:
+                del self._sizes[p]
+            del self._prices[:cut]
+
+    def best(self) -> Optional[float]:
+        if not self._prices:
+            return None
+        return self._prices[-1] if self._descending else self._prices[0]
+
+    def size_at(self, price: float) -> float:
+        return self._sizes.get(price, 0.0)
+
+    def levels(self, n: Optional[int] = None) -> List[Tuple[float, float]]:
+        """Niveles (precio, tamaño) desde el mejor precio hacia fuera."""
+        prices = reversed(self._prices) if self._descending else iter(self._prices)
+        out = []
+        for price in prices:
+            if n is not None and len(out) >= n:
+                break
+            out.append((price, self._sizes[price]))
+        return out
+
+    def __len__(self) -> int:
+        return len(self._prices)
+
+
+class OrderBook:
+    """Libro completo de un asset, actualizado in-place."""
+
+    __slots__ = ("asset_id", "bids", "asks", "timestamp", "hash")
+
+    def __init__(self, asset_id: str):
+        self.asset_id = asset_id
+        self.bids = BookSide(descending=True)
+        self.asks = BookSide(descending=False)
+        self.timestamp = None
+        self.hash = None
+
+    # ------------------- Actualizaciones ------------------- #
+    def apply_snapshot(self, bids: list, asks: list, timestamp=None, hash=None) -> None:
+        """Mensaje "book": reemplaza todos los niveles."""
+        self.apply_levels(parse_levels(bids), parse_levels(asks), timestamp, hash)
+
+    def apply_levels(
+        self,
+        bids: Iterable[Tuple[float, float]],
+        asks: Iterable[Tuple[float, float]],
+        timestamp=None,
+        hash=None,
+    ) -> None:
+        """Como apply_snapshot pero con niveles ya parseados (precio, tamaño)."""
+        self.bids.load(bids)
+        self.asks.load(asks)
+        self.timestamp = timestamp
+        self.hash = hash
+
+    def apply_change(self, side: str, price: float, size: float, timestamp=None, hash=None) -> None:
+        """Delta de "price_change": BUY actualiza bids, SELL actualiza asks."""
+        book_side = self.bids if side == BUY else self.asks
+        book_side.update(price, size)
+        if timestamp is not None:
+            self.timestamp = timestamp
+        if hash is not None:
+            self.hash = hash
+
+    def sync_top(self, best_bid: Optional[float], best_ask: Optional[float]) -> None:
+        """
+        Alinea el libro con el top of book que informa el exchange.
+        Los deltas no borran los niveles consumidos por trades; si el exchange
+        dice que el mejor bid es X, todo bid por encima de X ya no existe.
+        """
+        if best_bid is not None:
+            self.bids.drop_better_than(best_bid)
+        if best_ask is not None:
+            self.asks.drop_better_than(best_ask)
+
+    # ------------------- Consultas ------------------- #
+    def best_bid(self) -> Optional[float]:
+        return self.bids.best()
+
+    def best_ask(self) -> Optional[float]:
+        return self.asks.best()
+
+    def mid(self) -> Optional[float]:
+        bid, ask = self.bids.best(), self.asks.best()
+        if bid is None or ask is None:
+            return None
+        return (bid + ask) / 2
+
+    def size_at(self, side: str, price: float) -> float:
+        return (self.bids if side == BUY else self.asks).size_at(price)
+
+    def depth(self, side: str, levels: Optional[int] = None) -> List[Tuple[float, float]]:
+        return (self.bids if side == BUY else self.asks).levels(levels)
+
+
+def parse_levels(levels: list) -> List[Tuple[float, float]]:
+    out = []
+    for level in levels:
+        try:
+            out.append((float(level["price"]), float(level["size"])))
+        except (KeyError, TypeError, ValueError):
+            continue
+    return out
@@ -1,27 +1,24 @@
 import asyncio
+import atexit
 import logging
+import time
 from datetime import datetime, timezone
 
-from data_buffer import get_latest_snapshot
+from data_buffer import get_pair_since, subscribe_updates, unsubscribe_updates
 from market_detector import get_active_15min_market
+from bot_logging import setup_logging
+from latency import BUFFER_TO_DECISION, DECISION, LATENCY, RECV_TO_ORDER, export_loop, now_ns
 from strategy import Strategy
 from polymarket_client import live_prices
+from tick_recorder import TickRecorder
 
 
 # -------------------------
 # Logging
 # -------------------------
-logger = logging.getLogger("PolyPolyBot")
-
-if not logger.handlers:
-    logger.setLevel(logging.DEBUG)
-    console = logging.StreamHandler()
-    console.setLevel(logging.DEBUG)
-    formatter = logging.Formatter(
-        "%(asctime)s - %(levelname)s - %(message)s"
-    )
-    console.setFormatter(formatter)
-    logger.addHandler(console)
+# Nivel por defecto INFO (POLYPOLY_LOG_LEVEL=DEBUG para el detalle por tick);
+# la salida se formatea en el hilo de bot_logging, no en el bucle
+logger = setup_logging()
 
 
 # -------------------------
@@ -34,101 +31,164 @@ def get_market_start_ts(ts=None):
     return int(ts // MARKET_DURATION) * MARKET_DURATION
 
 
+def _latest_ns(a, b):
+    """El más reciente de dos perf_counter_ns opcionales (None si no hay ninguno)."""
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return max(a, b)
+
+
 # -------------------------
 # Bot
 # -------------------------
 class PolyPolyBot:
-    def __init__(self, initial_capital=1000.0, yes_token=None, no_token=None):
-        self.strategy = Strategy(initial_capital=initial_capital)
+    def __init__(
+        self,
+        initial_capital=1000.0,
+        yes_token=None,
+        no_token=None,
+        slug=None,
+        strategy_params=None,
+        clock=None,
+    ):
+        self.strategy = Strategy(
+            initial_capital=initial_capital, market_slug=slug or "", **(strategy_params or {})
+        )
+        # Reloj de pared por defecto; el replay pasa un reloj virtual (ver replay.py)
+        self.clock = clock or time.time
         self.tendency = 0.0
         self.tick_index = 0
-        self.market_start_ts = get_market_start_ts()
+        self.market_start_ts = get_market_start_ts(self.clock())
         self._last_prices = {"mid_yes": None, "mid_no": None}
+        # Secuencia del último par YES/NO procesado (data_buffer)
+        self._last_seq = 0
 
         if yes_token and no_token:
             self.strategy.yes_token = yes_token
             self.strategy.no_token = no_token
             logger.info(f"Tokens iniciales: YES={yes_token}, NO={no_token}")
 
-    def reset_market(self, yes_token=None, no_token=None):
+    def reset_market(self, yes_token=None, no_token=None, slug=None):
         self.tendency = 0.0
         self.tick_index = 0
-        self.market_start_ts = get_market_start_ts()
+        self.market_start_ts = get_market_start_ts(self.clock())
         logger.info("Cambio de mercado: estado reseteado")
 
         if yes_token and no_token:
             self.strategy.yes_token = yes_token
             self.strategy.no_token = no_token
+        if slug:
+            self.strategy.market_slug = slug
 
         self.strategy.reset()
 
-    async def run(self, tick_interval=0.5):
+    async def _wait_next(self, updates, tick_interval):
+        """
+        Modo push: espera al siguiente book (tick_interval solo es el máximo de espera).
+        Modo polling (updates=None): duerme tick_interval como antes.
+        """
+        if updates is None:
+            await asyncio.sleep(tick_interval)
+            return
+        try:
+            await asyncio.wait_for(updates.wait(), timeout=tick_interval)
+        except asyncio.TimeoutError:
+            pass
+        # clear antes de leer el snapshot: lo que llegue después vuelve a despertar
+        updates.clear()
+
+    async def run(self, tick_interval=0.5, event_driven=True):
         logger.info("Bot iniciado, esperando snapshots...")
+        updates = subscribe_updates() if event_driven else None
+        try:
+            await self._run_loop(updates, tick_interval)
+        finally:
+            if updates is not None:
+                unsubscribe_updates(updates)
+
+    def step(self):
+        """
+        Evalúa el par YES/NO más reciente si hay algo nuevo.
+        Devuelve la orden emitida o None.
+        """
+        pair = get_pair_since(
+            self.strategy.yes_token,
+            self.strategy.no_token,
+            self._last_seq,
+        )
 
-        while True:
-            snapshot = get_latest_snapshot(
-                self.strategy.yes_token,
-                self.strategy.no_token
-            )
-
-            if snapshot is None:
-                logger.debug("Snapshot incompleto, esperando...")
-                await asyncio.sleep(tick_interval)
-                continue
+        if pair is None:
+            # Falta algún lado o no hay nada más nuevo que lo ya procesado
+            return None
 
-            mid_yes = snapshot["mid_yes"]
-            mid_no = snapshot["mid_no"]
+        yes, no = pair
+        self._last_seq = max(yes.seq, no.seq)
+        mid_yes = yes.mid
+        mid_no = no.mid
 
-            # Evitar ticks duplicados
-            if (
-                self._last_prices["mid_yes"] == mid_yes
-                and self._last_prices["mid_no"] == mid_no
-            ):
-                await asyncio.sleep(tick_interval)
-                continue
+        # Evitar ticks duplicados (book nuevo pero mismo mid)
+        if (
+            self._last_prices["mid_yes"] == mid_yes
+            and self._last_prices["mid_no"] == mid_no
+        ):
+            return None
 
-            self._last_prices["mid_yes"] = mid_yes
-            self._last_prices["mid_no"] = mid_no
+        self._last_prices["mid_yes"] = mid_yes
+        self._last_prices["mid_no"] = mid_no
 
-            self.tick_index += 1
-            ask_yes = snapshot["ask_yes"]
-            ask_no = snapshot["ask_no"]
+        self.tick_index += 1
+        ask_yes = yes.ask
+        ask_no = no.ask
 
-            self.tendency += mid_yes - mid_no
+        self.tendency += mid_yes - mid_no
 
+        if logger.isEnabledFor(logging.DEBUG):
             logger.debug(
-                f"\n[TICK {self.tick_index}] "
-                f"YES mid={mid_yes:.4f} ask={ask_yes:.4f} | "
-                f"NO mid={mid_no:.4f} ask={ask_no:.4f} | "
-                f"Tendency={self.tendency:.4f}"
+                "[TICK %d] YES mid=%.4f ask=%.4f | NO mid=%.4f ask=%.4f | Tendency=%.4f",
+                self.tick_index, mid_yes, ask_yes, mid_no, ask_no, self.tendency,
             )
 
-            if not self.strategy.locked:
-                action, qty, _ = self.strategy.decide_and_execute(
-                    ts=snapshot["timestamp"],
-                    price_yes=mid_yes,
-                    price_no=mid_no,
-                    tick_index=self.tick_index,
-                    tendency=self.tendency,
-                )
-
-                if action == "YES":
-                    exec_price = ask_yes
-                elif action == "NO":
-                    exec_price = ask_no
-                else:
-                    exec_price = 0.0
-
-                if action in ("YES", "NO", "SAFE_YES", "SAFE_NO"):
-                    order = {
-                        "timestamp": datetime.now(timezone.utc).timestamp(),
-                        "action": action,
-                        "qty": qty,
-                        "price": exec_price,
-                    }
-                    logger.info(f"[Tick {self.tick_index}] Orden: {order}")
-
-            await asyncio.sleep(tick_interval)
+        if self.strategy.locked:
+            return None
+
+        decision_ns = now_ns()
+        LATENCY.record_ns(BUFFER_TO_DECISION, _latest_ns(yes.pub_ns, no.pub_ns), decision_ns)
+        action, qty, _ = self.strategy.decide_and_execute(
+            ts=max(yes.timestamp, no.timestamp),
+            price_yes=mid_yes,
+            price_no=mid_no,
+            tick_index=self.tick_index,
+            tendency=self.tendency,
+        )
+        LATENCY.record_ns(DECISION, decision_ns, now_ns())
+
+        if action == "YES":
+            exec_price = ask_yes
+        elif action == "NO":
+            exec_price = ask_no
+        else:
+            exec_price = 0.0
+
+        if action not in ("YES", "NO", "SAFE_YES", "SAFE_NO"):
+            return None
+
+        order = {
+            "timestamp": self.clock(),
+            "action": action,
+            "qty": qty,
+            "price": exec_price,
+        }
+        # Latencia del dato más reciente que llevó a la orden
+        LATENCY.record_ns(RECV_TO_ORDER, _latest_ns(yes.recv_ns, no.recv_ns), now_ns())
+        logger.info("[Tick %d] Orden: %s", self.tick_index, order)
+        return order
+
+    async def _run_loop(self, updates, tick_interval):
+        while True:
+            self.step()
+            await self._wait_next(updates, tick_interval)
 
 
 # -------------------------
@@ -144,13 +204,19 @@ if __name__ == "__main__":
         initial_capital=1000.0,
         yes_token=market_info["yes_token"],
         no_token=market_info["no_token"],
+        slug=market_info["slug"],
     )
 
+    # Grabación de frames y top of book para replay (tick_store/{slug}/)
+    recorder = TickRecorder()
+    atexit.register(recorder.close)
+
     async def main_loop():
         ws_task = asyncio.create_task(
-            live_prices(on_market_change=bot.reset_market)
+            live_prices(on_market_change=bot.reset_market, recorder=recorder)
         )
         bot_task = asyncio.create_task(bot.run())
-        await asyncio.gather(ws_task, bot_task)
+        latency_task = asyncio.create_task(export_loop())
+        await asyncio.gather(ws_task, bot_task, latency_task)
 
     asyncio.run(main_loop())
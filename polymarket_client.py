@@ -1,126 +1,485 @@
 import asyncio
 import json
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from typing import Collection, Dict, List, Optional, Sequence, Tuple
 import websockets
 
-from market_detector import get_active_15min_market
-from data_buffer import add_tick
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:  # orjson es opcional: json estándar como respaldo
+    _json_loads = json.loads
+
+from market_detector import BTC_15M, MarketSeries, get_resolver
+from data_buffer import Tick, clear_ticks, publish_tick
+from latency import EXCHANGE_TO_RECV, LATENCY, now_ns
+from order_book import OrderBook, parse_levels
+from tick_recorder import TickRecorder
 
 WS_URL = "wss://ws-subscriptions-clob.polymarket.com/ws/market"
 
-# Estado local del order book (top of book)
-ORDER_BOOKS = {}
+# Order book local completo por asset_id
+ORDER_BOOKS: Dict[str, OrderBook] = {}
+
+# Último top of book enviado a data_buffer por asset_id: (best_bid, best_ask)
+_LAST_TOP: Dict[str, Tuple[float, float]] = {}
+
+
+def get_order_book(asset_id: str) -> OrderBook:
+    book = ORDER_BOOKS.get(asset_id)
+    if book is None:
+        book = ORDER_BOOKS[asset_id] = OrderBook(asset_id)
+    return book
+
+
+def reset_order_books() -> None:
+    ORDER_BOOKS.clear()
+    _LAST_TOP.clear()
+
+
+def drop_order_books(asset_ids) -> None:
+    for asset_id in asset_ids:
+        ORDER_BOOKS.pop(asset_id, None)
+        _LAST_TOP.pop(asset_id, None)
+    clear_ticks(asset_ids)
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _emit_tick(book: OrderBook, ts, recv_ns: Optional[int] = None) -> Optional[Tick]:
+    """Publica el top of book en data_buffer si cambió. Devuelve el tick publicado."""
+    best_bid = book.best_bid()
+    best_ask = book.best_ask()
+    if best_bid is None or best_ask is None:
+        return None
+    if best_bid <= 0 or best_ask <= 0:
+        return None
+
+    # Evitar ticks idénticos
+    if _LAST_TOP.get(book.asset_id) == (best_bid, best_ask):
+        return None
+    _LAST_TOP[book.asset_id] = (best_bid, best_ask)
+
+    return publish_tick(
+        book.asset_id,
+        ts,
+        best_bid,
+        best_ask,
+        book.bids.size_at(best_bid),
+        book.asks.size_at(best_ask),
+        recv_ns=recv_ns,
+    )
 
 
 # -------------------------
-# Procesar BOOK (fuente real de precios)
+# Procesar BOOK (snapshot completo)
 # -------------------------
-def process_book_message(message, yes_token, no_token):
+def process_book_message(message, yes_token, no_token, recv_ns=None) -> Optional[Tick]:
     asset_id = message.get("asset_id")
     if asset_id not in (yes_token, no_token):
-        return
+        return None
 
-    bids = message.get("bids", [])
-    asks = message.get("asks", [])
+    # Niveles ya parseados por decode_frame (posiblemente en el hilo decodificador)
+    levels = message.get("_levels")
+    if levels is None:
+        levels = (parse_levels(message.get("bids", [])), parse_levels(message.get("asks", [])))
+    bids, asks = levels
 
     if not bids or not asks:
-        return
+        return None
 
-    try:
-        best_bid = max(float(b["price"]) for b in bids)
-        best_ask = min(float(a["price"]) for a in asks)
-    except (KeyError, ValueError):
-        return
+    ts = message.get("timestamp")
+    book = get_order_book(asset_id)
+    book.apply_levels(bids, asks, timestamp=ts, hash=message.get("hash"))
+    return _emit_tick(book, ts, recv_ns)
 
-    if best_bid <= 0 or best_ask <= 0:
-        return
 
-    mid = (best_bid + best_ask) / 2
+# -------------------------
+# Procesar PRICE_CHANGE (deltas sobre el libro)
+# -------------------------
+def process_price_change(message, yes_token, no_token, recv_ns=None) -> List[Tick]:
     ts = message.get("timestamp")
+    touched = {}
 
-    # Evitar ticks idénticos
-    prev = ORDER_BOOKS.get(asset_id)
-    if prev and prev["best_bid"] == best_bid and prev["best_ask"] == best_ask:
-        return
+    for change in message.get("price_changes", []):
+        asset_id = change.get("asset_id")
+        if asset_id not in (yes_token, no_token):
+            continue
+        # Sin snapshot previo no hay libro al que aplicar el delta
+        book = ORDER_BOOKS.get(asset_id)
+        if book is None:
+            continue
+        try:
+            price = float(change["price"])
+            size = float(change["size"])
+        except (KeyError, TypeError, ValueError):
+            continue
+        book.apply_change(change.get("side"), price, size, timestamp=ts, hash=change.get("hash"))
+        book.sync_top(_to_float(change.get("best_bid")), _to_float(change.get("best_ask")))
+        touched[asset_id] = book
+
+    ticks = []
+    for book in touched.values():
+        tick = _emit_tick(book, ts, recv_ns)
+        if tick is not None:
+            ticks.append(tick)
+    return ticks
+
+
+# -------------------------
+# Decodificación de frames
+# -------------------------
+HANDLED_EVENTS = ("book", "price_change")
+
+# Valores de event_type tal como aparecen en el texto del frame
+_EVENT_MARKERS = tuple(f'"{event}"' for event in HANDLED_EVENTS)
 
-    ORDER_BOOKS[asset_id] = {
-        "best_bid": best_bid,
-        "best_ask": best_ask,
-        "mid": mid,
-        "timestamp": ts,
-    }
 
-    tick = {
-        "asset_id": asset_id,
-        "timestamp": ts,
-        "bid": best_bid,
-        "ask": best_ask,
-        "mid": mid,
-    }
+def prefilter_frame(raw: str, assets: Collection[str]) -> bool:
+    """
+    Descarte barato sobre el texto crudo, sin parsear: False si el frame no
+    trae ningún evento que procesemos o no menciona ningún asset suscrito.
+    """
+    for marker in _EVENT_MARKERS:
+        if marker in raw:
+            break
+    else:
+        return False
+    for asset in assets:
+        if asset in raw:
+            return True
+    return False
 
-    add_tick(tick)
+
+def decode_frame(raw, assets: Collection[str]) -> List[dict]:
+    """
+    Mensajes book/price_change del frame que afectan a `assets`.
+    Los "book" llevan sus niveles ya convertidos a float en "_levels",
+    que es la parte cara y puede hacerse fuera del event loop.
+    """
+    if isinstance(raw, bytes):
+        raw = raw.decode("utf-8")
+    if not prefilter_frame(raw, assets):
+        return []
+
+    data = _json_loads(raw)
+    if isinstance(data, dict):
+        messages = [data]
+    elif isinstance(data, list):
+        messages = data
+    else:
+        return []
+
+    out = []
+    for msg in messages:
+        if not isinstance(msg, dict):
+            continue
+        event_type = msg.get("event_type")
+        if event_type == "book":
+            if msg.get("asset_id") not in assets:
+                continue
+            msg["_levels"] = (parse_levels(msg.get("bids", [])), parse_levels(msg.get("asks", [])))
+        elif event_type == "price_change":
+            if not any(c.get("asset_id") in assets for c in msg.get("price_changes", [])):
+                continue
+        else:
+            continue
+        out.append(msg)
+    return out
 
 
 # -------------------------
-# Live tracking WS con cambio de mercado
+# Conexión persistente con cambio de mercado en caliente
 # -------------------------
-async def live_prices(on_market_change=None):
-    current_tokens = None
+class FeedStats:
+    """Contadores de la conexión websocket (latencia = recepción - timestamp del exchange)."""
+
+    def __init__(self):
+        self.connects = 0
+        self.reconnects = 0
+        self.messages = 0
+        self.connected_at: Optional[float] = None
+        self.latency_ms: Optional[float] = None      # último
+        self.latency_ewma_ms: Optional[float] = None
+        self.latency_max_ms = 0.0
 
-    while True:
+    def on_connect(self) -> None:
+        if self.connects:
+            self.reconnects += 1
+        self.connects += 1
+        self.connected_at = time.time()
+        self.latency_max_ms = 0.0
+
+    def observe(self, recv_ms: int, exchange_ts) -> None:
+        self.messages += 1
         try:
-            market_info = get_active_15min_market()
-            if not market_info:
-                print(f"[{datetime.now()}] No hay mercado activo. Esperando 5s...")
-                await asyncio.sleep(5)
+            latency = recv_ms - int(exchange_ts)
+        except (TypeError, ValueError):
+            return
+        self.latency_ms = latency
+        LATENCY.record(EXCHANGE_TO_RECV, latency * 1000)
+        if self.latency_ewma_ms is None:
+            self.latency_ewma_ms = float(latency)
+        else:
+            self.latency_ewma_ms += 0.05 * (latency - self.latency_ewma_ms)
+        self.latency_max_ms = max(self.latency_max_ms, latency)
+
+    def summary(self) -> str:
+        uptime = time.time() - self.connected_at if self.connected_at else 0.0
+        ewma = f"{self.latency_ewma_ms:.0f}" if self.latency_ewma_ms is not None else "-"
+        return (
+            f"conexiones={self.connects} reconexiones={self.reconnects} "
+            f"mensajes={self.messages} uptime={uptime:.0f}s "
+            f"latencia_ewma={ewma}ms latencia_max={self.latency_max_ms:.0f}ms"
+        )
+
+
+def _message_assets(msg: dict) -> List[str]:
+    if msg.get("event_type") == "price_change":
+        return [c.get("asset_id") for c in msg.get("price_changes", [])]
+    return [msg.get("asset_id")]
+
+
+class LiveFeed:
+    """
+    Un único websocket para todos los mercados de una o varias series.
+
+    `lead` segundos antes de cada frontera de slot se suscribe (sobre la misma
+    conexión) a los tokens del mercado siguiente, así que su libro ya está
+    caliente cuando empieza; en la frontera se cambia el mercado activo de la
+    serie y se avisa con on_market_change, y `grace` segundos después del cierre
+    se cancela la suscripción del mercado viejo (on_market_end). Solo se
+    reconecta si cae la conexión.
+
+    Los frames de más de `offload_bytes` (books completos) se decodifican en
+    un hilo aparte; mientras, el event loop sigue atendiendo al bot y al resto
+    de tareas. El orden de aplicación se mantiene: no se lee el siguiente frame
+    hasta aplicar el actual (websockets lo va acumulando en su buffer).
+    """
+
+    def __init__(
+        self,
+        on_market_change=None,
+        recorder: Optional[TickRecorder] = None,
+        lead: float = 30.0,
+        grace: float = 60.0,
+        series: Sequence[MarketSeries] = (BTC_15M,),
+        on_market_end=None,
+        offload_bytes: Optional[int] = 4096,
+    ):
+        self.on_market_change = on_market_change
+        self.on_market_end = on_market_end
+        self.recorder = recorder
+        self.lead = lead
+        self.grace = grace
+        self.series = tuple(series)
+        self.resolver = get_resolver()
+        self.stats = FeedStats()
+
+        self.markets: Dict[str, dict] = {}     # slug -> mercado suscrito
+        self.asset_slug: Dict[str, str] = {}   # asset_id -> slug
+        self.active: Dict[MarketSeries, dict] = {}   # serie -> mercado activo
+        self.ws = None
+
+        self.offload_bytes = offload_bytes
+        self._decoder = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ws-decode")
+
+    # ------------------- Suscripciones ------------------- #
+    def _tokens(self) -> List[str]:
+        return list(self.asset_slug)
+
+    async def _send(self, payload: dict) -> None:
+        if self.ws is not None:
+            await self.ws.send(json.dumps(payload))
+
+    async def subscribe(self, market: dict) -> None:
+        slug = market["slug"]
+        if slug in self.markets:
+            return
+        self.markets[slug] = market
+        tokens = [market["yes_token"], market["no_token"]]
+        for token in tokens:
+            self.asset_slug[token] = slug
+        await self._send({"assets_ids": tokens, "operation": "subscribe"})
+        print(f"[{datetime.now()}] Suscrito a {slug}")
+
+    async def unsubscribe(self, market: dict) -> None:
+        slug = market["slug"]
+        if self.markets.pop(slug, None) is None:
+            return
+        tokens = [market["yes_token"], market["no_token"]]
+        for token in tokens:
+            self.asset_slug.pop(token, None)
+        drop_order_books(tokens)
+        await self._send({"assets_ids": tokens, "operation": "unsubscribe"})
+        print(f"[{datetime.now()}] Baja de {slug}")
+        if self.on_market_end:
+            self.on_market_end(market)
+
+    async def activate_current(self) -> bool:
+        """
+        Fija como activo el mercado del slot actual de cada serie.
+        False si no se conoce ninguno todavía.
+        """
+        any_active = False
+        for series in self.series:
+            market = await self.resolver.resolve_async(series.current_slot(), series=series)
+            if not market:
+                any_active = any_active or series in self.active
                 continue
+            any_active = True
+            current = self.active.get(series)
+            if current is not None and current["slug"] == market["slug"]:
+                continue
+
+            await self.subscribe(market)
+            self.active[series] = market
+            if self.on_market_change:
+                self.on_market_change(
+                    yes_token=market["yes_token"], no_token=market["no_token"], slug=market["slug"]
+                )
+            print(f"[{datetime.now()}] Cambio de mercado: {market['slug']}")
+        return any_active
+
+    async def _schedule(self) -> None:
+        """Rotación de suscripciones alrededor de las fronteras de slot."""
+        while True:
+            now = time.time()
+            if any(self.active.get(s) is None or self.active[s]["end_ts"] <= now for s in self.series):
+                await self.activate_current()
+
+            wake = []
+            for series in self.series:
+                next_slot = series.current_slot(now) + series.slot_seconds
+                wake += [next_slot, next_slot - self.lead]
+                if next_slot - now <= self.lead and series.slug(next_slot) not in self.markets:
+                    market = await self.resolver.resolve_async(next_slot, verbose=False, series=series)
+                    if market:
+                        await self.subscribe(market)
+
+            for market in list(self.markets.values()):
+                if market["end_ts"] + self.grace <= now:
+                    await self.unsubscribe(market)
+
+            # Despertar justo en la frontera (o antes si hay algo pendiente)
+            wake += [m["end_ts"] for m in self.active.values()]
+            wake += [m["end_ts"] + self.grace for m in self.markets.values()]
+            delay = min((t for t in wake if t > now), default=now + 1.0) - time.time()
+            await asyncio.sleep(min(max(delay, 0.05), 5.0))
+
+    # ------------------- Recepción ------------------- #
+    def handle_frame(self, raw_msg, recv_ms: Optional[int] = None) -> None:
+        """
+        Decodifica y aplica un frame en el hilo actual.
+        recv_ms: hora de recepción (por defecto ahora; el replay pasa la de la grabación).
+        """
+        recv_ns = now_ns()
+        if recv_ms is None:
+            recv_ms = int(time.time() * 1000)
+        self.apply_messages(decode_frame(raw_msg, self.asset_slug), raw_msg, recv_ms, recv_ns)
+
+    async def handle_frame_async(self, raw_msg, recv_ms: Optional[int] = None) -> None:
+        """Como handle_frame, pero los frames grandes se decodifican en el hilo decodificador."""
+        recv_ns = now_ns()
+        if recv_ms is None:
+            recv_ms = int(time.time() * 1000)
+        if self.offload_bytes is not None and len(raw_msg) >= self.offload_bytes:
+            # Copia de los assets: el hilo no debe ver el dict mientras cambia
+            messages = await asyncio.get_running_loop().run_in_executor(
+                self._decoder, decode_frame, raw_msg, frozenset(self.asset_slug)
+            )
+        else:
+            messages = decode_frame(raw_msg, self.asset_slug)
+        self.apply_messages(messages, raw_msg, recv_ms, recv_ns)
+
+    def apply_messages(
+        self, messages: List[dict], raw_msg, recv_ms: int, recv_ns: Optional[int] = None
+    ) -> None:
+        frame_slug = None
+        for msg in messages:
+            self.stats.observe(recv_ms, msg.get("timestamp"))
+            event_type = msg.get("event_type")
+
+            slugs = {self.asset_slug.get(a) for a in _message_assets(msg)} - {None}
+            for slug in slugs:
+                market = self.markets[slug]
+                frame_slug = frame_slug or slug
+                if event_type == "book":
+                    tick = process_book_message(
+                        msg, market["yes_token"], market["no_token"], recv_ns
+                    )
+                    ticks = [tick] if tick is not None else []
+                else:
+                    ticks = process_price_change(
+                        msg, market["yes_token"], market["no_token"], recv_ns
+                    )
+
+                if self.recorder is not None:
+                    for tick in ticks:
+                        self.recorder.record_top(slug, tick, recv_ms)
+
+        if self.recorder is not None:
+            if frame_slug is None and self.active:
+                frame_slug = next(iter(self.active.values()))["slug"]
+            slug = frame_slug
+            self.recorder.record_frame(slug, raw_msg)
+
+    # ------------------- Bucle principal ------------------- #
+    async def run(self) -> None:
+        # Resolución anticipada de los próximos slots: el cambio de mercado sale de caché
+        prefetch = asyncio.create_task(self.resolver.prefetch_loop(series_list=self.series))
+        try:
+            while True:
+                try:
+                    if not await self.activate_current():
+                        print(f"[{datetime.now()}] No hay mercado activo. Esperando 5s...")
+                        await asyncio.sleep(5)
+                        continue
+
+                    async with websockets.connect(WS_URL, ping_interval=20) as ws:
+                        # Conexión nueva: los snapshots iniciales reconstruyen los libros
+                        reset_order_books()
+                        self.stats.on_connect()
+                        await ws.send(json.dumps({
+                            "type": "subscribe",
+                            "channel": "market",
+                            "assets_ids": self._tokens()
+                        }))
+                        self.ws = ws
+                        print(f"[{datetime.now()}] WS conectado y suscrito a {self._tokens()}")
+
+                        scheduler = asyncio.create_task(self._schedule())
+                        try:
+                            while True:
+                                if scheduler.done():
+                                    scheduler.result()
+                                await self.handle_frame_async(await ws.recv())
+                        finally:
+                            self.ws = None
+                            scheduler.cancel()
+
+                except websockets.ConnectionClosed:
+                    print(f"[{datetime.now()}] WS cerrado ({self.stats.summary()}), reconectando en 2s...")
+                    await asyncio.sleep(2)
+
+                except Exception as e:
+                    print(f"[{datetime.now()}] Error WS: {e} ({self.stats.summary()}), reconectando en 5s...")
+                    await asyncio.sleep(5)
+        finally:
+            prefetch.cancel()
+
 
-            yes_token = market_info["yes_token"]
-            no_token = market_info["no_token"]
-            token_ids = [yes_token, no_token]
-
-            if current_tokens != token_ids:
-                current_tokens = token_ids
-                ORDER_BOOKS.clear()
-                if on_market_change:
-                    on_market_change(yes_token=yes_token, no_token=no_token)
-                print(f"[{datetime.now()}] Cambio de mercado detectado. Tokens: {token_ids}")
-
-            try:
-                async with websockets.connect(WS_URL, ping_interval=20) as ws:
-                    await ws.send(json.dumps({
-                        "type": "subscribe",
-                        "channel": "market",
-                        "assets_ids": token_ids
-                    }))
-                    print(f"[{datetime.now()}] WS conectado y suscrito a {token_ids}")
-
-                    while True:
-                        raw_msg = await ws.recv()
-                        data = json.loads(raw_msg)
-
-                        if isinstance(data, dict):
-                            messages = [data]
-                        elif isinstance(data, list):
-                            messages = data
-                        else:
-                            continue
-
-                        for msg in messages:
-                            if (
-                                isinstance(msg, dict)
-                                and msg.get("event_type") == "book"
-                            ):
-                                process_book_message(msg, yes_token, no_token)
-
-            except websockets.ConnectionClosed:
-                print(f"[{datetime.now()}] WS cerrado, reconectando en 2s...")
-                await asyncio.sleep(2)
-
-            except Exception as e:
-                print(f"[{datetime.now()}] Error WS: {e}, reconectando en 5s...")
-                await asyncio.sleep(5)
-
-        except Exception as e:
-            print(f"[{datetime.now()}] Error general live_prices: {e}")
-            await asyncio.sleep(5)
+async def live_prices(on_market_change=None, recorder: Optional[TickRecorder] = None):
+    """
+    Precios en vivo sobre una conexión persistente (ver LiveFeed).
+    recorder: si se indica, cada frame crudo y cada tick emitido se graban
+    en el segmento de su mercado (solo se encolan, no bloquea la recepción).
+    """
+    await LiveFeed(on_market_change=on_market_change, recorder=recorder).run()
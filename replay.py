@@ -0,0 +1,326 @@
+# replay.py - Replay determinista de feeds grabados por el camino real polymarket_client -> data_buffer -> PolyPolyBot
+import argparse
+import asyncio
+import json
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from book_store import BOOK_RECORDING, iter_frames
+from data_buffer import clear_ticks, get_pair, subscribe_changes, unsubscribe_changes
+from latency import LATENCY
+from market_catalog import MarketCatalog
+from poly_poly import PolyPolyBot
+from polymarket_client import LiveFeed, reset_order_books
+from tick_recorder import iter_segment_frames
+from trade_journal import MemoryJournal
+
+SLOT_SECONDS = 900
+
+
+# -------------------------
+# Reloj virtual
+# -------------------------
+class VirtualClock:
+    """Reloj del replay: avanza con el timestamp de cada frame, nunca hacia atrás."""
+
+    def __init__(self, start: float = 0.0):
+        self.now = start
+
+    def advance(self, ts: float) -> None:
+        if ts > self.now:
+            self.now = ts
+
+    def time(self) -> float:
+        return self.now
+
+
+# -------------------------
+# Frames grabados
+# -------------------------
+def _messages(frame) -> List[dict]:
+    if isinstance(frame, list):
+        return [m for m in frame if isinstance(m, dict)]
+    return [frame] if isinstance(frame, dict) else []
+
+
+def frame_timestamp_ms(frame) -> Optional[int]:
+    """Timestamp (ms) más reciente de los mensajes del frame."""
+    best = None
+    for msg in _messages(frame):
+        try:
+            ts = int(msg.get("timestamp"))
+        except (TypeError, ValueError):
+            continue
+        if best is None or ts > best:
+            best = ts
+    return best
+
+
+def load_frames(source: str = BOOK_RECORDING) -> Tuple[List[object], List[Tuple[int, str]]]:
+    """
+    Frames de una grabación (market_data.json[.gz]) o de un segmento del tick
+    store (tick_store/{slug}/). Devuelve (frames parseados, [(ts_ms, texto crudo)]).
+    El texto se serializa aquí, antes del replay, para no medirlo en el benchmark.
+    Los frames sin timestamp heredan el del anterior.
+    """
+    path = Path(source)
+    frames = list(iter_segment_frames(path) if path.is_dir() else iter_frames(str(path)))
+    raw: List[Tuple[int, str]] = []
+    last_ts = 0
+    for frame in frames:
+        ts = frame_timestamp_ms(frame)
+        last_ts = max(last_ts, ts) if ts is not None else last_ts
+        raw.append((last_ts, json.dumps(frame)))
+    return frames, raw
+
+
+def infer_markets(frames: Iterable[object], catalog: Optional[MarketCatalog] = None) -> List[dict]:
+    """
+    Mercados presentes en la grabación: los assets se agrupan por "market"
+    (condition id). Si el catálogo los conoce se usan su slug y su orden
+    YES/NO; si no, el orden de aparición.
+    """
+    pairs: Dict[str, List[str]] = {}
+    first_ts: Dict[str, int] = {}
+    for frame in frames:
+        for msg in _messages(frame):
+            condition = msg.get("market")
+            if not condition:
+                continue
+            if msg.get("event_type") == "book":
+                assets = [msg.get("asset_id")]
+            elif msg.get("event_type") == "price_change":
+                assets = [c.get("asset_id") for c in msg.get("price_changes", [])]
+            else:
+                continue
+            tokens = pairs.setdefault(condition, [])
+            for asset in assets:
+                if asset and asset not in tokens:
+                    tokens.append(asset)
+            if condition not in first_ts:
+                try:
+                    first_ts[condition] = int(msg.get("timestamp")) // 1000
+                except (TypeError, ValueError):
+                    pass
+
+    by_token = {}
+    if catalog is not None:
+        by_token = {e["yes_token"]: e for e in catalog.entries.values()}
+
+    markets = []
+    for condition, tokens in pairs.items():
+        if len(tokens) != 2:
+            print(f"Saltando {condition[:12]}…: {len(tokens)} assets, esperado 2")
+            continue
+        entry = by_token.get(tokens[0]) or by_token.get(tokens[1])
+        if entry is not None:
+            markets.append({
+                "slug": entry["slug"],
+                "yes_token": entry["yes_token"],
+                "no_token": entry["no_token"],
+                "start_ts": entry["start_ts"],
+                "end_ts": entry["end_ts"],
+            })
+            continue
+        start_ts = first_ts.get(condition, 0) // SLOT_SECONDS * SLOT_SECONDS
+        markets.append({
+            "slug": f"replay-{condition[:10]}",
+            "yes_token": tokens[0],
+            "no_token": tokens[1],
+            "start_ts": start_ts,
+            "end_ts": start_ts + SLOT_SECONDS,
+        })
+    return markets
+
+
+# -------------------------
+# Harness
+# -------------------------
+class ReplayHarness:
+    """
+    Reproduce frames grabados por el mismo código que en vivo: LiveFeed.handle_frame
+    (decode + order books + data_buffer) y PolyPolyBot.step por cada mercado con
+    cambios (data_buffer.ChangeSet, como MultiMarketRunner). El reloj es virtual:
+    speed=None va tan rápido como se pueda; speed=N respeta los huecos entre
+    frames divididos por N (60 = un mercado de 15 min en 15 s).
+    """
+
+    def __init__(
+        self,
+        markets: List[dict],
+        initial_capital: float = 1000.0,
+        strategy_params: Optional[dict] = None,
+        speed: Optional[float] = None,
+        offload_bytes: Optional[int] = None,
+    ):
+        self.markets = markets
+        self.initial_capital = initial_capital
+        self.strategy_params = strategy_params or {}
+        self.speed = speed
+        self.offload_bytes = offload_bytes
+        self.clock = VirtualClock()
+
+    async def run_async(self, frames: List[Tuple[int, str]]) -> dict:
+        reset_order_books()
+        clear_ticks()
+        LATENCY.snapshot(reset=True)
+
+        feed = LiveFeed(series=(), offload_bytes=self.offload_bytes)
+        bots: Dict[str, PolyPolyBot] = {}
+        asset_bot: Dict[str, PolyPolyBot] = {}
+        orders: Dict[str, List[dict]] = {}
+        evaluated: Dict[str, List[tuple]] = {}
+        if frames:
+            self.clock.now = frames[0][0] / 1000
+        for market in self.markets:
+            await feed.subscribe(market)
+            bot = PolyPolyBot(
+                initial_capital=self.initial_capital,
+                yes_token=market["yes_token"],
+                no_token=market["no_token"],
+                slug=market["slug"],
+                strategy_params={"journal": MemoryJournal(), **self.strategy_params},
+                clock=self.clock.time,
+            )
+            bots[market["slug"]] = bot
+            asset_bot[market["yes_token"]] = asset_bot[market["no_token"]] = bot
+            orders[market["slug"]] = []
+            evaluated[market["slug"]] = []
+
+        changes = subscribe_changes()
+        start = time.perf_counter()
+        first_ms = frames[0][0] if frames else 0
+        try:
+            for ts_ms, raw in frames:
+                self.clock.advance(ts_ms / 1000)
+                if self.speed:
+                    delay = (ts_ms - first_ms) / 1000 / self.speed - (time.perf_counter() - start)
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+
+                if self.offload_bytes is None:
+                    feed.handle_frame(raw, recv_ms=ts_ms)
+                else:
+                    await feed.handle_frame_async(raw, recv_ms=ts_ms)
+
+                for bot in {asset_bot[a] for a in changes.drain() if a in asset_bot}:
+                    before = bot.tick_index
+                    order = bot.step()
+                    slug = bot.strategy.market_slug
+                    if bot.tick_index > before:
+                        yes, no = get_pair(bot.strategy.yes_token, bot.strategy.no_token)
+                        evaluated[slug].append((max(yes.timestamp, no.timestamp), yes.mid, no.mid))
+                    if order is not None:
+                        orders[slug].append(order)
+        finally:
+            unsubscribe_changes(changes)
+        wall = time.perf_counter() - start
+
+        virtual = (frames[-1][0] - first_ms) / 1000 if frames else 0.0
+        results = {}
+        for slug, bot in bots.items():
+            s = bot.strategy
+            results[slug] = {
+                "ticks": bot.tick_index,
+                "orders": orders[slug],
+                "trades": len(s.trades),
+                "qty_yes": s.qty_yes,
+                "qty_no": s.qty_no,
+                "cost": s.cost_yes + s.cost_no,
+                "pair_cost": s.pair_cost(),
+                "guaranteed_profit": s.guaranteed_profit(),
+                "evaluated": evaluated[slug],
+            }
+        return {
+            "frames": len(frames),
+            "messages": feed.stats.messages,
+            "wall_s": wall,
+            "virtual_s": virtual,
+            "frames_per_s": len(frames) / wall if wall > 0 else 0.0,
+            "speedup": virtual / wall if wall > 0 else 0.0,
+            "markets": results,
+            "latency": LATENCY.snapshot(reset=True)["stages"],
+        }
+
+    def run(self, frames: List[Tuple[int, str]]) -> dict:
+        return asyncio.run(self.run_async(frames))
+
+
+# -------------------------
+# Divergencia con el backtest
+# -------------------------
+def compare_with_backtest(
+    market_result: dict, initial_capital: float = 1000.0, strategy_params: Optional[dict] = None
+) -> dict:
+    """
+    Pasa los mismos pares (mid YES, mid NO) que evaluó el bot por
+    backtest.simulate_market y compara trades y posiciones finales.
+    Cualquier diferencia viene del envoltorio (tendencia, filtros), no de los datos.
+    """
+    import pandas as pd
+
+    from backtest import simulate_market
+    from tick_cache import build_market_arrays
+
+    evaluated = market_result["evaluated"]
+    if not evaluated:
+        return {"ticks": 0, "diverges": False}
+    df = pd.DataFrame(evaluated, columns=["timestamp", "price_yes", "price_no"])
+    df["timestamp"] = pd.to_datetime(df["timestamp"].astype("int64"), unit="ms")
+    strategy, *_ = simulate_market(build_market_arrays(df), initial_capital, strategy_params)
+
+    bot = {k: market_result[k] for k in ("trades", "qty_yes", "qty_no")}
+    backtest = {"trades": len(strategy.trades), "qty_yes": strategy.qty_yes, "qty_no": strategy.qty_no}
+    diverges = bot["trades"] != backtest["trades"] or any(
+        abs(bot[k] - backtest[k]) > 1e-9 for k in ("qty_yes", "qty_no")
+    )
+    return {"ticks": len(evaluated), "bot": bot, "backtest": backtest, "diverges": diverges}
+
+
+# -------------------------
+# Main
+# -------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay de un feed grabado contra PolyPolyBot")
+    parser.add_argument("source", nargs="?", default=BOOK_RECORDING,
+                        help="market_data.json[.gz] o segmento tick_store/{slug}")
+    parser.add_argument("--speed", type=float, default=None,
+                        help="Factor de aceleración (por defecto, sin esperas)")
+    parser.add_argument("--capital", type=float, default=1000.0)
+    parser.add_argument("--yes", help="Token YES (si no, se deduce de la grabación)")
+    parser.add_argument("--no", help="Token NO")
+    parser.add_argument("--offload", action="store_true",
+                        help="Decodificar frames grandes en el hilo decodificador como en vivo")
+    parser.add_argument("--compare", action="store_true", help="Comparar con backtest.simulate_market")
+    args = parser.parse_args()
+
+    frames, raw = load_frames(args.source)
+    if args.yes and args.no:
+        start_ts = raw[0][0] // 1000 // SLOT_SECONDS * SLOT_SECONDS if raw else 0
+        markets = [{"slug": Path(args.source).stem, "yes_token": args.yes, "no_token": args.no,
+                    "start_ts": start_ts, "end_ts": start_ts + SLOT_SECONDS}]
+    else:
+        markets = infer_markets(frames, MarketCatalog())
+    print(f"{len(raw)} frames, mercados: {[m['slug'] for m in markets]}")
+
+    harness = ReplayHarness(markets, args.capital, speed=args.speed,
+                            offload_bytes=4096 if args.offload else None)
+    result = harness.run(raw)
+
+    print("\n" + "=" * 80)
+    print(f"Frames: {result['frames']} | mensajes: {result['messages']} | "
+          f"{result['wall_s']:.3f}s reales para {result['virtual_s']:.0f}s grabados "
+          f"(x{result['speedup']:.0f}, {result['frames_per_s']:.0f} frames/s)")
+    for stage, s in result["latency"].items():
+        if s["count"]:
+            print(f"  {stage}: n={s['count']} p50={s['p50_us']}µs p99={s['p99_us']}µs max={s['max_us']}µs")
+    for slug, r in result["markets"].items():
+        print(f"{slug}: {r['ticks']} ticks, {len(r['orders'])} órdenes, {r['trades']} trades, "
+              f"YES={r['qty_yes']:.2f} NO={r['qty_no']:.2f} coste={r['cost']:.2f} "
+              f"pair_cost={r['pair_cost']:.4f}")
+        if args.compare:
+            cmp = compare_with_backtest(r, args.capital)
+            status = "DIVERGE" if cmp["diverges"] else "coincide"
+            print(f"  backtest {status}: bot={cmp.get('bot')} backtest={cmp.get('backtest')}")
+    print("=" * 80)
@@ -1,13 +1,12 @@
 # strategy.py
 from datetime import datetime, timezone
-from typing import Tuple
+from typing import Callable, Optional, Tuple
 import logging
-import json
-from pathlib import Path
+
+from trade_journal import TradeJournal, get_default_journal
 
 MARKET_DURATION = 15 * 60
 logger = logging.getLogger("PolyPolyBot")
-TRADES_LOG_FILE = Path("trades_log.json")
 
 def get_market_start_ts(ts=None):
     if ts is None:
@@ -23,8 +22,12 @@ class Strategy:
         max_order_pct: float = 0.20,
         min_order_value: float = 10.0,
         entry_threshold: float = 0.4,
+        entry_floor: float = 0.22,
         yes_token: str = "",
         no_token: str = "",
+        market_slug: str = "",
+        journal: Optional[TradeJournal] = None,
+        fill_model: Optional[Callable[[str, float, object, float], Tuple[float, float]]] = None,
     ):
         self.initial_capital = float(initial_capital)
         self.capital = float(initial_capital)
@@ -32,9 +35,18 @@ class Strategy:
         self.max_order_pct = float(max_order_pct)
         self.min_order_value = float(min_order_value)
         self.entry_threshold = float(entry_threshold)
+        self.entry_floor = float(entry_floor)
 
         self.yes_token = yes_token
         self.no_token = no_token
+        self.market_slug = market_slug
+
+        # None = diario por defecto del proceso (JSON Lines en segundo plano)
+        self.journal = journal
+
+        # fill_model(side, qty, ts, max_cost) -> (qty_filled, avg_price).
+        # None = se ejecuta todo al precio de decisión (mid)
+        self.fill_model = fill_model
 
         self.qty_yes = 0.0
         self.cost_yes = 0.0
@@ -86,20 +98,12 @@ class Strategy:
         return avg_yes + avg_no
 
     def _log_trade(self, trade: dict):
-        """Guarda el trade en trades_log.json"""
+        """Añade el trade al diario (append-only, la escritura va en otro hilo)"""
+        journal = self.journal if self.journal is not None else get_default_journal()
         try:
-            if TRADES_LOG_FILE.exists():
-                with open(TRADES_LOG_FILE, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-            else:
-                data = []
-
-            data.append(trade)
-
-            with open(TRADES_LOG_FILE, "w", encoding="utf-8") as f:
-                json.dump(data, f, indent=4)
+            journal.append({**trade, "market": self.market_slug})
         except Exception as e:
-            logger.error(f"No se pudo guardar el trade en JSON: {e}")
+            logger.error("No se pudo guardar el trade en el diario: %s", e)
 
     # ------------------- Core ------------------- #
     def decide_and_execute(
@@ -107,22 +111,22 @@ class Strategy:
     ) -> Tuple[str, float, float]:
 
         if self.locked:
-            logger.debug(f"[Tick {tick_index}] Estrategia bloqueada")
+            logger.debug("[Tick %d] Estrategia bloqueada", tick_index)
             return "LOCKED", 0.0, 0.0
 
         if self.guaranteed_profit() > 0:
             self.locked = True
-            logger.info(f"Strategy locked. GP={self.guaranteed_profit():.2f}")
+            logger.info("Strategy locked. GP=%.2f", self.guaranteed_profit())
             return "LOCKED", 0.0, 0.0
 
-        logger.debug(
-            f"\n[TICK {tick_index}] ===== STRATEGY STEP =====\n"
-            f"Capital={self.capital:.2f} | "
-            f"YES qty={self.qty_yes:.2f} avg={self.avg_yes():.4f} | "
-            f"NO qty={self.qty_no:.2f} avg={self.avg_no():.4f} | "
-            f"PairCost={self.pair_cost():.4f} | "
-            f"Tendency={tendency:.4f}"
-        )
+        # Solo se calculan los campos si alguien va a leer el mensaje
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "[TICK %d] STEP Capital=%.2f | YES qty=%.2f avg=%.4f | "
+                "NO qty=%.2f avg=%.4f | PairCost=%.4f | Tendency=%.4f",
+                tick_index, self.capital, self.qty_yes, self.avg_yes(),
+                self.qty_no, self.avg_no(), self.pair_cost(), tendency,
+            )
 
         current_pair = self.pair_cost()
         max_cash_this_trade = self.capital * self.max_order_pct
@@ -138,7 +142,7 @@ class Strategy:
 
             # Primera entrada
             if self.qty_yes == 0 and self.qty_no == 0:
-                if price > self.entry_threshold or price < 0.22:
+                if price > self.entry_threshold or price < self.entry_floor:
                     continue
 
             # No comprar mismo lado dos veces seguidas
@@ -170,6 +174,13 @@ class Strategy:
                 best_price = price
                 best_new_pair = new_pair
 
+        if best_action in ("YES", "NO") and best_qty > 0 and self.fill_model is not None:
+            # Ejecución contra el libro: puede llenar menos y a peor precio que el mid
+            best_qty, best_price = self.fill_model(best_action, best_qty, ts, self.capital)
+            if best_qty <= 0:
+                return "HOLD", 0.0, 0.0
+            best_new_pair = self._simulate_new_pair(best_action, best_qty, best_price)
+
         # Ejecutar
         if best_action in ("YES", "NO") and best_qty > 0:
             cost = best_qty * best_price
@@ -193,6 +204,6 @@ class Strategy:
 
             self.trades.append(trade)
             self._log_trade(trade)
-            logger.info(f"[Tick {tick_index}] Trade ejecutado: {trade}")
+            logger.info("[Tick %d] Trade ejecutado: %s", tick_index, trade)
 
         return best_action, best_qty, best_price
@@ -0,0 +1,220 @@
+# sweep.py - Barrido de parámetros de Strategy sobre los mercados del backtest
+import argparse
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from backtest import load_all_markets, run_analytic_montecarlo, simulate_path, simulation_seeds
+from batch_strategy import run_batched_analytic_montecarlo
+
+RESULTS_FILE = "sweep_results.csv"
+
+# Parámetros de Strategy que se pueden barrer
+DEFAULT_GRID: Dict[str, list] = {
+    "target_pair_cost": [0.96, 0.97, 0.98, 0.99],
+    "max_order_pct": [0.10, 0.20, 0.30],
+    "min_order_value": [5.0, 10.0],
+    "entry_threshold": [0.35, 0.40, 0.45],
+    "entry_floor": [0.18, 0.22, 0.26],
+}
+
+# Estado de cada proceso worker (mercados y seeds se reciben una sola vez)
+_WORKER_STATE: dict = {}
+
+
+def param_grid(grid: Dict[str, list]) -> List[dict]:
+    """Producto cartesiano del grid: una combinación de parámetros por dict."""
+    keys = list(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[k] for k in keys))]
+
+
+def roi_stats(roi: np.ndarray) -> dict:
+    return {
+        "roi_mean": float(roi.mean()),
+        "roi_median": float(np.median(roi)),
+        "roi_std": float(roi.std()),
+        "roi_min": float(roi.min()),
+        "roi_p05": float(np.percentile(roi, 5)),
+        "roi_p95": float(np.percentile(roi, 95)),
+        "roi_max": float(roi.max()),
+        "paths_profitable_%": float((roi > 0).mean() * 100),
+    }
+
+
+def evaluate_params(
+    markets: List[dict],
+    seeds: List[np.random.SeedSequence],
+    params: dict,
+    initial_capital: float = 1000.0,
+    analytic: bool = True,
+    capital_step: float = 0.05,
+) -> dict:
+    """Distribución de ROI de una combinación de parámetros sobre todos los caminos."""
+    if analytic:
+        capital_final = run_analytic_montecarlo(
+            markets, seeds, initial_capital, capital_step, strategy_params=params, verbose=False
+        )
+    else:
+        capital_final = np.array([
+            simulate_path(
+                markets,
+                np.random.default_rng(seed_seq).permutation(len(markets)),
+                initial_capital,
+                sim,
+                strategy_params=params,
+            )[1]
+            for sim, seed_seq in enumerate(seeds, start=1)
+        ])
+    roi = (capital_final - initial_capital) / initial_capital * 100
+    return {**params, **roi_stats(roi)}
+
+
+def evaluate_params_batch(
+    markets: List[dict],
+    seeds: List[np.random.SeedSequence],
+    params_list: List[dict],
+    initial_capital: float = 1000.0,
+    capital_step: float = 0.05,
+) -> List[dict]:
+    """Como evaluate_params (modo analítico) pero con el kernel batched: una pasada por mercado y bucket."""
+    capital_final = run_batched_analytic_montecarlo(
+        markets, seeds, initial_capital, params_list, capital_step
+    )
+    roi = (capital_final - initial_capital) / initial_capital * 100
+    return [{**params, **roi_stats(r)} for params, r in zip(params_list, roi)]
+
+
+def _init_worker(markets: List[dict], seeds: List[np.random.SeedSequence], options: dict) -> None:
+    _WORKER_STATE["markets"] = markets
+    _WORKER_STATE["seeds"] = seeds
+    _WORKER_STATE["options"] = options
+
+
+def _evaluate_worker(params: dict) -> dict:
+    return evaluate_params(
+        _WORKER_STATE["markets"], _WORKER_STATE["seeds"], params, **_WORKER_STATE["options"]
+    )
+
+
+def _evaluate_batch_worker(params_list: List[dict]) -> List[dict]:
+    options = _WORKER_STATE["options"]
+    return evaluate_params_batch(
+        _WORKER_STATE["markets"],
+        _WORKER_STATE["seeds"],
+        params_list,
+        initial_capital=options["initial_capital"],
+        capital_step=options["capital_step"],
+    )
+
+
+def run_sweep(
+    grid: Dict[str, list],
+    n_simulations: int = 200,
+    seed: Optional[int] = 0,
+    workers: Optional[int] = None,
+    initial_capital: float = 1000.0,
+    analytic: bool = True,
+    capital_step: float = 0.05,
+    out_file: Optional[str] = RESULTS_FILE,
+    batched: bool = False,
+) -> pd.DataFrame:
+    """
+    Evalúa todas las combinaciones del grid sobre los mismos mercados y caminos.
+    Los mercados se cargan una vez y se reparten a los workers en el initializer;
+    todas las combinaciones usan las mismas seeds, así que el ranking es comparable.
+    Con batched=True (solo modo analítico) cada worker recibe un bloque de
+    combinaciones y las evalúa juntas con el kernel de batch_strategy.
+    Devuelve la tabla ordenada por ROI medio (y la guarda en out_file).
+    """
+    markets = load_all_markets()
+    seeds = simulation_seeds(n_simulations, seed)
+    combos = param_grid(grid)
+    options = {"initial_capital": initial_capital, "analytic": analytic, "capital_step": capital_step}
+    workers = workers or os.cpu_count() or 1
+
+    print(f"Barrido: {len(combos)} combinaciones × {n_simulations} simulaciones ({workers} workers)")
+
+    rows: List[dict] = []
+    if batched:
+        if not analytic:
+            raise ValueError("batched solo está disponible en modo analítico")
+        chunks = [list(c) for c in np.array_split(np.array(combos, dtype=object), workers) if len(c)]
+        if workers <= 1:
+            _init_worker(markets, seeds, options)
+            results = map(_evaluate_batch_worker, chunks)
+            for chunk_rows in results:
+                rows.extend(chunk_rows)
+        else:
+            with ProcessPoolExecutor(
+                max_workers=workers, initializer=_init_worker, initargs=(markets, seeds, options)
+            ) as pool:
+                for i, chunk_rows in enumerate(pool.map(_evaluate_batch_worker, chunks), start=1):
+                    rows.extend(chunk_rows)
+                    print(f"[{i}/{len(chunks)}] bloques evaluados")
+    elif workers <= 1:
+        for i, params in enumerate(combos, start=1):
+            rows.append(evaluate_params(markets, seeds, params, **options))
+            print(f"[{i}/{len(combos)}] {params} → ROI medio {rows[-1]['roi_mean']:.2f}%")
+    else:
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker, initargs=(markets, seeds, options)
+        ) as pool:
+            for i, row in enumerate(pool.map(_evaluate_worker, combos), start=1):
+                rows.append(row)
+                if i % max(1, len(combos) // 10) == 0:
+                    print(f"[{i}/{len(combos)}] combinaciones evaluadas")
+
+    df = pd.DataFrame(rows).sort_values(["roi_mean", "roi_p05"], ascending=False)
+    df = df.reset_index(drop=True)
+    df.index.name = "rank"
+
+    if out_file:
+        df.to_csv(out_file)
+        print(f"Resultados guardados en {out_file}")
+
+    print("\nTOP 10 COMBINACIONES")
+    print(df.head(10).to_string())
+    return df
+
+
+def _parse_args() -> Tuple[Dict[str, list], argparse.Namespace]:
+    parser = argparse.ArgumentParser(description="Barrido de parámetros de Strategy")
+    parser.add_argument(
+        "--grid",
+        help="Ruta a un fichero JSON con {parámetro: [valores]} (por defecto DEFAULT_GRID)",
+    )
+    parser.add_argument("--simulations", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--capital", type=float, default=1000.0)
+    parser.add_argument("--exact", action="store_true", help="Replay tick a tick en cada camino")
+    parser.add_argument("--batched", action="store_true", help="Kernel vectorizado por bloques de combinaciones")
+    parser.add_argument("--capital-step", type=float, default=0.05)
+    parser.add_argument("--out", default=RESULTS_FILE)
+    args = parser.parse_args()
+
+    grid = DEFAULT_GRID
+    if args.grid:
+        with open(args.grid, "r", encoding="utf-8") as f:
+            grid = json.load(f)
+    return grid, args
+
+
+if __name__ == "__main__":
+    grid, args = _parse_args()
+    run_sweep(
+        grid,
+        n_simulations=args.simulations,
+        seed=args.seed,
+        workers=args.workers,
+        initial_capital=args.capital,
+        analytic=not args.exact,
+        capital_step=args.capital_step,
+        out_file=args.out,
+        batched=args.batched,
+    )
@@ -0,0 +1,209 @@
+# tick_cache.py - Formato canónico de ticks YES/NO y caché columnar (.npy memory-mapped)
+import json
+import os
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+CACHE_DIR = os.path.join("live_data_polling", ".cache")
+MANIFEST_FILE = "manifest.json"
+COLUMNS = ("timestamp", "price_yes", "price_no", "tendency")
+CACHE_VERSION = 1
+
+# Formato canónico en disco (CSV): una fila por instante con los dos lados alineados.
+# El polling de live_monitor ya lo escribe (más una columna sum_prices que se ignora)
+# y historical_data lo escribe tras alinear las dos series descargadas.
+TICK_COLUMNS = ("timestamp", "price_yes", "price_no")
+
+
+# -------------------------
+# Alineación YES/NO
+# -------------------------
+def _sorted_leg(ts: np.ndarray, prices: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    if len(ts) > 1 and (ts[1:] < ts[:-1]).any():
+        order = np.argsort(ts, kind="stable")
+        return ts[order], prices[order]
+    return ts, prices
+
+
+def asof_join(
+    ts_yes: np.ndarray, p_yes: np.ndarray, ts_no: np.ndarray, p_no: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Une dos series (timestamp, precio) en la rejilla de todos sus timestamps:
+    en cada instante cada lado vale su último precio conocido (as-of).
+    Las filas anteriores al primer precio de alguno de los dos lados se descartan.
+    Todo con searchsorted, sin bucles de Python.
+    """
+    ts_yes, p_yes = _sorted_leg(np.asarray(ts_yes), np.asarray(p_yes))
+    ts_no, p_no = _sorted_leg(np.asarray(ts_no), np.asarray(p_no))
+    ts = np.union1d(ts_yes, ts_no)
+    i_yes = np.searchsorted(ts_yes, ts, side="right") - 1
+    i_no = np.searchsorted(ts_no, ts, side="right") - 1
+    valid = (i_yes >= 0) & (i_no >= 0)
+    return ts[valid], p_yes[i_yes[valid]], p_no[i_no[valid]]
+
+
+def align_legs(df_yes: pd.DataFrame, df_no: pd.DataFrame) -> pd.DataFrame:
+    """DataFrames (timestamp, price) de cada lado -> DataFrame canónico (TICK_COLUMNS)."""
+    ts, p_yes, p_no = asof_join(
+        df_yes["timestamp"].to_numpy(dtype="datetime64[ns]"),
+        df_yes["price"].to_numpy(dtype=np.float64),
+        df_no["timestamp"].to_numpy(dtype="datetime64[ns]"),
+        df_no["price"].to_numpy(dtype=np.float64),
+    )
+    return pd.DataFrame({"timestamp": ts, "price_yes": p_yes, "price_no": p_no})
+
+
+# -------------------------
+# Arrays por mercado
+# -------------------------
+def build_market_arrays(df: pd.DataFrame) -> dict:
+    """
+    Convierte el CSV de polling (ya ordenado) en arrays NumPy contiguos.
+    Se hace una sola vez por mercado; las simulaciones solo leen los arrays.
+    """
+    price_yes = np.ascontiguousarray(df["price_yes"].to_numpy(dtype=np.float64))
+    price_no = np.ascontiguousarray(df["price_no"].to_numpy(dtype=np.float64))
+    timestamps = np.ascontiguousarray(df["timestamp"].to_numpy(dtype="datetime64[ns]"))
+
+    # Misma tendencia que el bucle original: suma acumulada de |p_yes - p_no|
+    # (np.cumsum es secuencial, así que el resultado es idéntico en float)
+    tendency = np.cumsum(np.abs(price_yes - price_no))
+
+    return {
+        "timestamp": timestamps,
+        "price_yes": price_yes,
+        "price_no": price_no,
+        "tendency": tendency,
+        "n_ticks": len(price_yes),
+    }
+
+
+def read_tick_csv(path: str) -> pd.DataFrame:
+    """
+    Lee un CSV de ticks (polling de live_monitor o histórico de historical_data)
+    en el formato canónico, ordenado por timestamp. Si algún lado tiene huecos
+    (CSV antiguos con las dos series unidas por concat) se realinea as-of.
+    """
+    df = pd.read_csv(path, usecols=list(TICK_COLUMNS), parse_dates=["timestamp"])
+    if df["price_yes"].isna().any() or df["price_no"].isna().any():
+        yes = df.loc[df["price_yes"].notna(), ["timestamp", "price_yes"]]
+        no = df.loc[df["price_no"].notna(), ["timestamp", "price_no"]]
+        return align_legs(
+            yes.rename(columns={"price_yes": "price"}), no.rename(columns={"price_no": "price"})
+        )
+    return df.sort_values("timestamp", kind="stable").reset_index(drop=True)
+
+
+# Nombre anterior (los CSV de polling ya estaban en el formato canónico)
+read_polling_csv = read_tick_csv
+
+
+# -------------------------
+# Manifest
+# -------------------------
+def load_manifest(cache_dir: str = CACHE_DIR) -> Dict[str, dict]:
+    path = os.path.join(cache_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if data.get("version") != CACHE_VERSION:
+        return {}
+    return data.get("markets", {})
+
+
+def save_manifest(manifest: Dict[str, dict], cache_dir: str = CACHE_DIR) -> None:
+    """Escritura atómica (tmp + replace) para no dejar un manifest a medias."""
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, MANIFEST_FILE)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"version": CACHE_VERSION, "markets": manifest}, f, indent=2)
+    os.replace(tmp, path)
+
+
+def _source_stamp(csv_path: str) -> dict:
+    st = os.stat(csv_path)
+    return {"mtime_ns": st.st_mtime_ns, "size": st.st_size}
+
+
+def _column_path(cache_dir: str, stem: str, column: str) -> str:
+    return os.path.join(cache_dir, f"{stem}.{column}.npy")
+
+
+def is_fresh(entry: Optional[dict], csv_path: str) -> bool:
+    if not entry:
+        return False
+    stamp = _source_stamp(csv_path)
+    return entry.get("mtime_ns") == stamp["mtime_ns"] and entry.get("size") == stamp["size"]
+
+
+# -------------------------
+# Lectura / escritura de la caché
+# -------------------------
+def write_market_cache(csv_path: str, arrays: dict, cache_dir: str = CACHE_DIR) -> dict:
+    """Guarda una columna .npy por array y devuelve la entrada de manifest."""
+    os.makedirs(cache_dir, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(csv_path))[0]
+    for column in COLUMNS:
+        np.save(_column_path(cache_dir, stem, column), arrays[column])
+
+    timestamps = arrays["timestamp"]
+    entry = {
+        **_source_stamp(csv_path),
+        "stem": stem,
+        "rows": int(arrays["n_ticks"]),
+        "ts_min": str(timestamps[0]) if len(timestamps) else None,
+        "ts_max": str(timestamps[-1]) if len(timestamps) else None,
+    }
+    return entry
+
+
+def read_market_cache(entry: dict, cache_dir: str = CACHE_DIR) -> dict:
+    """Abre las columnas en modo mmap: no se copian datos hasta que se leen."""
+    arrays = {
+        column: np.load(_column_path(cache_dir, entry["stem"], column), mmap_mode="r")
+        for column in COLUMNS
+    }
+    arrays["n_ticks"] = entry["rows"]
+    return arrays
+
+
+def load_market_arrays(
+    csv_path: str,
+    manifest: Dict[str, dict],
+    min_rows: int = 0,
+    cache_dir: str = CACHE_DIR,
+) -> Optional[dict]:
+    """
+    Devuelve los arrays del mercado desde la caché, reconstruyéndola si el CSV cambió.
+    Los mercados con menos de min_rows filas solo se registran en el manifest
+    (sin columnas), así la siguiente ejecución los descarta sin parsear el CSV.
+    Actualiza `manifest` in-place; el llamador decide cuándo guardarlo.
+    """
+    name = os.path.basename(csv_path)
+    entry = manifest.get(name)
+
+    if is_fresh(entry, csv_path):
+        if entry["rows"] < min_rows:
+            return None
+        if entry.get("cached"):
+            try:
+                return read_market_cache(entry, cache_dir)
+            except (OSError, ValueError):
+                pass  # Columnas borradas o corruptas: se reconstruyen
+
+    df = read_tick_csv(csv_path)
+    if len(df) < min_rows:
+        manifest[name] = {**_source_stamp(csv_path), "rows": len(df), "cached": False}
+        return None
+
+    arrays = build_market_arrays(df)
+    manifest[name] = {**write_market_cache(csv_path, arrays, cache_dir), "cached": True}
+    return read_market_cache(manifest[name], cache_dir)
@@ -0,0 +1,162 @@
+# tick_recorder.py - Grabación de frames del websocket en segmentos comprimidos por mercado
+import csv
+import gzip
+import io
+import logging
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Union
+
+from background_writer import BackgroundWriter
+from book_store import iter_frames
+
+logger = logging.getLogger("PolyPolyBot")
+
+RECORD_DIR = Path("tick_store")
+FRAMES_FILE = "frames.jsonl.gz"
+TOP_FILE = "top.csv.gz"
+TOP_COLUMNS = ["recv_ms", "timestamp", "asset_id", "bid", "ask", "bid_size", "ask_size"]
+
+SLOT_SECONDS = 900
+
+
+class _Segment:
+    """Buffers de un mercado (slug) pendientes de comprimir y añadir a disco."""
+
+    def __init__(self, directory: Path):
+        directory.mkdir(parents=True, exist_ok=True)
+        self.frames_path = directory / FRAMES_FILE
+        self.top_path = directory / TOP_FILE
+        self.frames = io.StringIO()
+        self.top = io.StringIO()
+        self.top_writer = csv.writer(self.top)
+        if not self.top_path.exists():
+            self.top_writer.writerow(TOP_COLUMNS)
+        self.last_write = time.monotonic()
+
+    def pending_bytes(self) -> int:
+        return self.frames.tell() + self.top.tell()
+
+    def flush(self, compresslevel: int) -> None:
+        """Cada volcado es un miembro gzip completo: el fichero sigue siendo legible tras un corte."""
+        for buffer, path in ((self.frames, self.frames_path), (self.top, self.top_path)):
+            data = buffer.getvalue()
+            if not data:
+                continue
+            with open(path, "ab") as f:
+                f.write(gzip.compress(data.encode("utf-8"), compresslevel=compresslevel))
+            buffer.seek(0)
+            buffer.truncate()
+        self.last_write = time.monotonic()
+
+
+class TickRecorder(BackgroundWriter):
+    """
+    Graba cada frame crudo del websocket y el top of book normalizado.
+
+    Segmentos append-only por slug (un mercado = un slot de 15 minutos):
+      {directory}/{slug}/frames.jsonl.gz  frames tal cual llegan (legible con book_store)
+      {directory}/{slug}/top.csv.gz       TOP_COLUMNS, una fila por tick emitido
+
+    record_frame()/record_top() solo encolan; un hilo escritor agrupa,
+    comprime en bloques de ~chunk_bytes o cada flush_interval segundos y
+    cierra los segmentos de slots ya terminados. El bucle de recepción nunca espera al disco.
+    """
+
+    thread_name = "tick-recorder"
+
+    def __init__(
+        self,
+        directory: Union[str, Path] = RECORD_DIR,
+        chunk_bytes: int = 256 * 1024,
+        flush_interval: float = 5.0,
+        compresslevel: int = 6,
+    ):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.chunk_bytes = chunk_bytes
+        self.flush_interval = flush_interval
+        self.compresslevel = compresslevel
+
+        self._segments: Dict[str, _Segment] = {}
+        super().__init__()
+
+    # ------------------- API ------------------- #
+    def record_frame(self, slug: str, raw: Union[str, bytes]) -> None:
+        if isinstance(raw, bytes):
+            raw = raw.decode("utf-8", errors="replace")
+        self._enqueue(("frame", slug, raw))
+
+    def record_top(self, slug: str, tick: dict, recv_ms: Optional[int] = None) -> None:
+        if recv_ms is None:
+            recv_ms = int(time.time() * 1000)
+        row = [recv_ms] + [tick.get(col) for col in TOP_COLUMNS[1:]]
+        self._enqueue(("top", slug, row))
+
+    # ------------------- Writer ------------------- #
+    def _segment(self, slug: str) -> _Segment:
+        segment = self._segments.get(slug)
+        if segment is None:
+            segment = self._segments[slug] = _Segment(self.directory / (slug or "unknown_market"))
+        return segment
+
+    def _write_item(self, kind: str, slug: str, payload) -> None:
+        segment = self._segment(slug)
+        if kind == "frame":
+            segment.frames.write(payload.rstrip("\n"))
+            segment.frames.write("\n")
+        else:
+            segment.top_writer.writerow(payload)
+
+    def _flush_segments(self, force: bool) -> None:
+        now = time.monotonic()
+        for slug, segment in list(self._segments.items()):
+            try:
+                if force or segment.pending_bytes() >= self.chunk_bytes or (
+                    segment.pending_bytes() and now - segment.last_write >= self.flush_interval
+                ):
+                    segment.flush(self.compresslevel)
+            except OSError as e:
+                logger.error(f"Error escribiendo segmento {slug}: {e}")
+            # Rotación: un slug sin datos durante un slot entero ya terminó
+            if now - segment.last_write >= SLOT_SECONDS and not segment.pending_bytes():
+                del self._segments[slug]
+
+    def _wait_timeout(self) -> float:
+        return self.flush_interval
+
+    def _write_batch(self, batch: List[tuple]) -> None:
+        for kind, slug, payload in batch:
+            try:
+                self._write_item(kind, slug, payload)
+            except Exception as e:
+                logger.error("No se pudo grabar %s de %s: %s", kind, slug, e)
+
+    def _after_batch(self, force: bool, stop: bool) -> None:
+        self._flush_segments(force)
+        if stop:
+            self._segments.clear()
+
+
+# -------------------------
+# Lectura
+# -------------------------
+def segment_dirs(directory: Union[str, Path] = RECORD_DIR) -> List[Path]:
+    return sorted(p for p in Path(directory).iterdir() if p.is_dir())
+
+
+def iter_segment_frames(segment_dir: Union[str, Path]) -> Iterator[object]:
+    """Frames de un segmento, en orden de llegada."""
+    path = Path(segment_dir) / FRAMES_FILE
+    if path.exists():
+        yield from iter_frames(str(path))
+
+
+def read_top(segment_dir: Union[str, Path]):
+    """Top of book grabado de un segmento como DataFrame (TOP_COLUMNS)."""
+    import pandas as pd
+
+    path = Path(segment_dir) / TOP_FILE
+    if not path.exists():
+        return pd.DataFrame(columns=TOP_COLUMNS)
+    return pd.read_csv(path, compression="gzip", dtype={"asset_id": str})
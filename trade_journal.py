@@ -0,0 +1,191 @@
+# trade_journal.py - Diario de trades append-only (JSON Lines) con escritor en segundo plano
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Union
+
+from background_writer import BackgroundWriter
+
+logger = logging.getLogger("PolyPolyBot")
+
+JOURNAL_DIR = Path("trades_journal")
+DEFAULT_MARKET = "unknown_market"
+
+
+class TradeJournal:
+    """
+    Diario desactivado: descarta los trades.
+    Es la base de los demás diarios y lo que usa el backtest por defecto.
+    """
+
+    def append(self, trade: dict) -> None:
+        pass
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class MemoryJournal(TradeJournal):
+    """Guarda los trades en una lista (backtests / inspección)."""
+
+    def __init__(self):
+        self.trades: List[dict] = []
+
+    def append(self, trade: dict) -> None:
+        self.trades.append(trade)
+
+
+class FileJournal(BackgroundWriter, TradeJournal):
+    """
+    Diario JSON Lines con un fichero por mercado (rotación por slug).
+
+    append() solo encola el trade; un hilo escritor agrupa lo pendiente,
+    lo escribe de una vez y hace fsync de lo pendiente como mucho fsync_interval
+    segundos después de escribirlo, aunque no lleguen más trades (0 = fsync en
+    cada lote, None = nunca). Así el bucle asyncio nunca espera al disco.
+    El fichero de un mercado se cierra tras idle_close segundos sin trades
+    (el bot cambia de slug cada 15 min) y se reabre si vuelve a llegar alguno.
+    """
+
+    thread_name = "trade-journal"
+
+    def __init__(
+        self,
+        directory: Union[str, Path] = JOURNAL_DIR,
+        fsync_interval: Optional[float] = 1.0,
+        idle_close: float = 60.0,
+    ):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.fsync_interval = fsync_interval
+        self.idle_close = idle_close
+
+        self._files: Dict[str, object] = {}
+        self._last_write: Dict[str, float] = {}
+        self._dirty: Set[str] = set()  # mercados escritos desde su último fsync
+        self._last_fsync = time.monotonic()
+        super().__init__()
+
+    # ------------------- API ------------------- #
+    def append(self, trade: dict) -> None:
+        if not self._enqueue(trade):
+            logger.error("Trade descartado: el diario ya no acepta escrituras")
+
+    # ------------------- Writer ------------------- #
+    def _path_for(self, market: str) -> Path:
+        return self.directory / f"{market}.jsonl"
+
+    def _file_for(self, market: str):
+        f = self._files.get(market)
+        if f is None:
+            f = open(self._path_for(market), "a", encoding="utf-8")
+            self._files[market] = f
+        self._last_write[market] = time.monotonic()
+        self._dirty.add(market)
+        return f
+
+    def _sync(self, force: bool = False) -> None:
+        for market in self._dirty:
+            self._files[market].flush()
+        if self.fsync_interval is None:
+            self._dirty.clear()
+            return
+        now = time.monotonic()
+        if self._dirty and (force or now - self._last_fsync >= self.fsync_interval):
+            for market in self._dirty:
+                os.fsync(self._files[market].fileno())
+            self._dirty.clear()
+            self._last_fsync = now
+
+    def _close_idle(self, force: bool = False) -> None:
+        now = time.monotonic()
+        for market, f in list(self._files.items()):
+            if force or (market not in self._dirty and now - self._last_write[market] >= self.idle_close):
+                f.close()
+                del self._files[market]
+                del self._last_write[market]
+
+    def _wait_timeout(self) -> float:
+        """Cada cuánto despierta el escritor sin trades nuevos (fsync diferido y cierres)."""
+        timeout = self.idle_close
+        if self.fsync_interval:
+            timeout = min(timeout, self.fsync_interval)
+        return max(timeout, 0.05)
+
+    def _write_batch(self, batch: List[dict]) -> None:
+        for trade in batch:
+            market = str(trade.get("market") or DEFAULT_MARKET)
+            try:
+                self._file_for(market).write(json.dumps(trade, default=str) + "\n")
+            except Exception as e:
+                logger.error(f"No se pudo guardar el trade en el diario: {e}")
+
+    def _after_batch(self, force: bool, stop: bool) -> None:
+        try:
+            self._sync(force=force)
+            self._close_idle(force=stop)
+        except OSError as e:
+            logger.error("Error sincronizando el diario de trades: %s", e)
+
+
+# -------------------------
+# Lectura
+# -------------------------
+def read_journal(path: Union[str, Path] = JOURNAL_DIR) -> List[dict]:
+    """
+    Carga trades desde un fichero .jsonl, un directorio de diarios
+    o un trades_log.json antiguo (array JSON).
+    """
+    path = Path(path)
+    if path.is_dir():
+        trades: List[dict] = []
+        for file in sorted(path.glob("*.jsonl")):
+            trades.extend(read_journal(file))
+        return trades
+
+    if path.suffix == ".json":
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    trades = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                trades.append(json.loads(line))
+            except ValueError:
+                # Última línea a medias tras un corte: se ignora
+                logger.warning(f"Línea corrupta en {path}, se ignora")
+    return trades
+
+
+# -------------------------
+# Diario por defecto del proceso
+# -------------------------
+_default_journal: Optional[TradeJournal] = None
+_default_lock = threading.Lock()
+
+
+def get_default_journal() -> TradeJournal:
+    """FileJournal compartido en JOURNAL_DIR, creado la primera vez que se usa."""
+    global _default_journal
+    with _default_lock:
+        if _default_journal is None:
+            _default_journal = FileJournal(JOURNAL_DIR)
+            atexit.register(_default_journal.close)
+        return _default_journal
+
+
+def set_default_journal(journal: TradeJournal) -> None:
+    global _default_journal
+    with _default_lock:
+        _default_journal = journal